@@ -100,7 +100,12 @@ warnings.filterwarnings('ignore')
 dfn = classifier.get_pdf_text_boxes()
 
 # %%
-model = classifier.load_classifier("text_block")
+import contextlib
+from pydoxtools.model_registry import model_registry
+# keep the model acquired for the whole session, so that the model registry
+# doesn't evict it while we are still using it (call session.close() to release it)
+session = contextlib.ExitStack()
+model = session.enter_context(model_registry.acquire("classifier", "text_block"))
 
 # %%
 model.cv2.bias.max()
@@ -110,7 +110,12 @@ settings.TRAINING_DATA_DIR
 df_labeled.label.unique()
 
 # %%
-model = classifier.load_classifier("text_block")
+import contextlib
+from pydoxtools.model_registry import model_registry
+# keep the model acquired for the whole session, so that the model registry
+# doesn't evict it while we are still using it (call session.close() to release it)
+session = contextlib.ExitStack()
+model = session.enter_context(model_registry.acquire("classifier", "text_block"))
 
 # %%
 pytorch_lightning.utilities.memory.get_model_size_mb(model)
@@ -92,7 +92,12 @@ file = TRAINING_DATA_DIR / "pdfs/datasheet/remo-m_fixed-wing.2f.pdf"
 file
 
 # %%
-model = classifier.load_classifier("text_block")
+import contextlib
+from pydoxtools.model_registry import model_registry
+# keep the model acquired for the whole session, so that the model registry
+# doesn't evict it while we are still using it (call session.close() to release it)
+session = contextlib.ExitStack()
+model = session.enter_context(model_registry.acquire("classifier", "text_block"))
 
 # %%
 doc = pydoxtools.document.Document(file)
@@ -0,0 +1,339 @@
+"""
+Persistent, content-addressed cache for extractor results.
+
+Results of extractors get stored on disk using a key which is
+calculated from:
+
+- a hash of the raw document (bytes, string or file content)
+- the identity of the extractor (class, input/output mappings, parameters)
+  and the pydoxtools version
+- the name of the requested output
+- the effective configuration parameters of the extractor
+
+This way we can re-use expensive calculations (pdf parsing, table detection etc...)
+for documents which were already processed at some point, even across
+python processes.
+
+The cache is bounded in size and evicts the least recently used entries
+once the size limit is exceeded.
+"""
+
+import functools
+import hashlib
+import io
+import logging
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import time
+import typing
+from pathlib import Path
+from typing import Any
+
+import pydoxtools
+from pydoxtools.settings import settings
+
+if typing.TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+
+class Serializer:
+    """Base class for serializers which can be registered in the DiskCache"""
+    suffix: str = ""
+
+    def accepts(self, value: Any) -> bool:
+        return True
+
+    def dumps(self, value: Any) -> bytes:
+        raise NotImplementedError()
+
+    def loads(self, data: bytes) -> Any:
+        raise NotImplementedError()
+
+
+class PickleSerializer(Serializer):
+    suffix = ".pkl"
+
+    def dumps(self, value: Any) -> bytes:
+        return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def loads(self, data: bytes) -> Any:
+        return pickle.loads(data)
+
+
+class ParquetSerializer(Serializer):
+    """
+    store pandas dataframes in parquet format. This only works for
+    dataframes with "simple" column types (no python objects such as
+    pdfminer objects). Other dataframes fall back to the next serializer.
+    """
+    suffix = ".parquet"
+
+    def accepts(self, value: Any) -> bool:
+        # values can only be dataframes if pandas was imported already
+        pd = sys.modules.get("pandas")
+        if pd is None or not isinstance(value, pd.DataFrame):
+            return False
+        # object columns are only allowed if they contain strings
+        return all(value[c].map(type).eq(str).all()
+                   for c, dt in value.dtypes.items() if dt == object)
+
+    def dumps(self, value: "pd.DataFrame") -> bytes:
+        buf = io.BytesIO()
+        value.to_parquet(buf)
+        return buf.getvalue()
+
+    def loads(self, data: bytes) -> "pd.DataFrame":
+        import pandas as pd
+        return pd.read_parquet(io.BytesIO(data))
+
+
+def hash_document(fobj) -> str | None:
+    """
+    calculate a hash of the raw document content. Returns None
+    if the content can not be hashed (e.g. non-seekable streams)
+    """
+    h = hashlib.sha256()
+    if isinstance(fobj, str):
+        h.update(fobj.encode("utf-8", errors="surrogatepass"))
+    elif isinstance(fobj, bytes):
+        h.update(fobj)
+    elif isinstance(fobj, Path):
+        with open(fobj, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    elif hasattr(fobj, "read") and hasattr(fobj, "seek") and fobj.seekable():
+        pos = fobj.tell()
+        data = fobj.read()
+        fobj.seek(pos)
+        h.update(data.encode("utf-8") if isinstance(data, str) else data)
+    else:
+        return None
+    return h.hexdigest()
+
+
+def estimate_size(value: Any, _depth: int = 0) -> int:
+    """
+    roughly estimate the memory used by an extractor result in bytes.
+
+    numpy arrays and pandas dataframes are measured without looking into
+    python objects stored in them, containers are measured up to a depth of 3.
+    """
+    if hasattr(value, "nbytes") and hasattr(value, "dtype"):  # numpy arrays
+        return int(value.nbytes)
+    if hasattr(value, "memory_usage") and hasattr(value, "columns"):  # pandas dataframes
+        return int(value.memory_usage(index=True, deep=False).sum())
+    size = sys.getsizeof(value, 0)
+    if _depth >= 3 or isinstance(value, (str, bytes)):
+        return size
+    if isinstance(value, dict):
+        return size + sum(estimate_size(v, _depth + 1) for v in value.values())
+    if isinstance(value, (list, tuple, set)):
+        return size + sum(estimate_size(v, _depth + 1) for v in value)
+    return size
+
+
+def _qualified_name(obj) -> str:
+    if hasattr(obj, "_module") and hasattr(obj, "_name"):  # extract_logic.LazyFunction
+        return f"{obj._module}.{obj._name}"
+    if hasattr(obj, "__qualname__"):
+        return f"{getattr(obj, '__module__', '')}.{obj.__qualname__}"
+    cls = type(obj)
+    return f"{cls.__module__}.{cls.__qualname__}"
+
+
+def extractor_fingerprint(extractor) -> str:
+    """
+    Calculate a stable identity for an extractor which doesn't change between
+    python processes. It is based on the pydoxtools version, the class, the input & output
+    mappings and the parameters of the extractor. Parameters which can not be
+    represented in a stable way are only identified by their type.
+
+    Values of cached properties (e.g. the wrapped extractor of a LazyExtractor) get
+    created on the first call and are not part of the fingerprint. Otherwise, the
+    fingerprint would change after the first call of an extractor.
+    """
+    cls = extractor.__class__
+    parts = [pydoxtools.__version__,
+             f"{cls.__module__}.{cls.__qualname__}",
+             repr(sorted(extractor._in_mapping.items())),
+             repr(sorted(extractor._out_mapping.items()))]
+    for k, v in sorted(vars(extractor).items()):
+        if k in ("_in_mapping", "_out_mapping", "_dynamic_config",
+                 "_cache", "_disk_cache", "_interactive", "_process"):
+            continue
+        if isinstance(getattr(cls, k, None), functools.cached_property):
+            continue
+        if callable(v) and hasattr(v, "__code__"):
+            # e.g. LambdaExtractor functions. co_names includes the global
+            # functions which are called inside of lambdas
+            code = v.__code__
+            parts.append(f"{k}={code.co_code.hex()}{code.co_consts!r}{code.co_names!r}")
+        elif isinstance(v, (str, int, float, bool, type(None), tuple, list, dict)):
+            parts.append(f"{k}={v!r}")
+        elif hasattr(v, "json"):  # pydantic models
+            parts.append(f"{k}={v.json()}")
+        else:
+            # e.g. LazyFunctions, functools.partial or other objects
+            parts.append(f"{k}={_qualified_name(v)}")
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """
+    Content-addressed on-disk cache with pluggable serializers and
+    size-bounded LRU eviction.
+
+    Entries are stored as files and file modification times are used
+    to keep track of the last access. This makes it possible to share the cache
+    between several processes.
+
+    The size of the cache directory gets tracked per process and re-scanned
+    from disk every *rescan_interval* seconds. When several processes write
+    into the same cache (e.g. Pipeline.map workers), the size limit can
+    therefore be exceeded for up to rescan_interval seconds.
+    """
+
+    def __init__(
+            self,
+            cache_dir: str | Path = None,
+            max_size: int = None,
+            serializers: list[Serializer] = None,
+            rescan_interval: float = 30.0
+    ):
+        self._dir = Path(cache_dir or settings.PDXT_DISK_CACHE_DIR)
+        self._dir.mkdir(parents=True, exist_ok=True)
+        self._max_size = max_size if max_size is not None else settings.PDXT_DISK_CACHE_MAX_SIZE
+        # the first serializer which accepts a value will be used
+        self._serializers = serializers or [ParquetSerializer(), PickleSerializer()]
+        self._lock = threading.Lock()
+        self._size = None  # lazily calculated size of the cache directory
+        self._rescan_interval = rescan_interval
+        self._scanned_at = 0.0  # time.monotonic() of the last scan of the cache directory
+
+    def __getstate__(self):
+        # make the cache usable in worker processes
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def cache_dir(self) -> Path:
+        return self._dir
+
+    def key(self, document_hash: str, extractor, output_name: str, config_params: dict = None) -> str:
+        return self.keys(document_hash, extractor, [output_name], config_params)[output_name]
+
+    def keys(
+            self, document_hash: str, extractor, output_names: typing.Iterable[str], config_params: dict = None
+    ) -> dict[str, str]:
+        """the keys of several outputs of the same extractor call"""
+        config = repr(sorted((config_params or {}).items()))
+        fingerprint = extractor_fingerprint(extractor)
+        return {
+            name: hashlib.sha256("|".join((document_hash, fingerprint, name, config)).encode("utf-8")).hexdigest()
+            for name in output_names
+        }
+
+    def _entry_paths(self, key: str) -> typing.Iterator[tuple[Path, Serializer]]:
+        subdir = self._dir / key[:2]
+        for s in self._serializers:
+            yield subdir / (key + s.suffix), s
+
+    def get(self, key: str, default=None) -> Any:
+        for path, serializer in self._entry_paths(key):
+            try:
+                data = path.read_bytes()
+            except FileNotFoundError:
+                continue
+            try:
+                value = serializer.loads(data)
+            except Exception:
+                logger.warning(f"could not load cache entry {path}, removing it")
+                self._remove(path)
+                continue
+            # mark as "recently used"
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            return value
+        return default
+
+    def set(self, key: str, value: Any) -> bool:
+        """store a value in the cache, returns False if the value can not be serialized"""
+        for path, serializer in self._entry_paths(key):
+            if not serializer.accepts(value):
+                continue
+            try:
+                data = serializer.dumps(value)
+            except Exception:
+                logger.debug(f"serializer {serializer.__class__.__name__} failed for {type(value)}")
+                continue
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # write atomically so that concurrent processes never see half-written files
+            fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+            with self._lock:
+                if self._size is not None:
+                    self._size += len(data)
+            self._evict_if_needed()
+            return True
+        logger.debug(f"could not serialize {type(value)} for disk cache")
+        return False
+
+    def _files(self) -> list[os.DirEntry]:
+        files = []
+        for sub in os.scandir(self._dir):
+            if sub.is_dir():
+                files.extend(f for f in os.scandir(sub.path) if f.is_file() and not f.name.endswith(".tmp"))
+        return files
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    @property
+    def size(self) -> int:
+        """total size of the cache in bytes"""
+        with self._lock:
+            # other processes might have written into the cache in the meantime
+            if (self._size is None) or (time.monotonic() - self._scanned_at > self._rescan_interval):
+                self._size = sum(f.stat().st_size for f in self._files())
+                self._scanned_at = time.monotonic()
+            return self._size
+
+    def _evict_if_needed(self):
+        if self.size <= self._max_size:
+            return
+        with self._lock:
+            files = sorted(self._files(), key=lambda f: f.stat().st_mtime)
+            total = sum(f.stat().st_size for f in files)
+            # evict a little more than necessary in order to avoid
+            # evicting on every new entry
+            target = 0.9 * self._max_size
+            for f in files:
+                if total <= target:
+                    break
+                total -= f.stat().st_size
+                self._remove(f.path)
+            self._size = total
+            self._scanned_at = time.monotonic()
+
+    def clear(self):
+        with self._lock:
+            for f in self._files():
+                self._remove(f.path)
+            self._size = 0
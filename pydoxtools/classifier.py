@@ -24,6 +24,7 @@ from torch.nn import functional as F
 from transformers import AutoTokenizer, AutoModel
 
 from pydoxtools import html_utils
+from pydoxtools.model_registry import model_registry
 from pydoxtools.settings import settings
 
 logger = logging.getLogger(__name__)
@@ -702,9 +703,7 @@ class pdfClassifier(
         return torch.stack(x)
 
 
-@functools.lru_cache()
-def load_classifier(name):
-    logger.info(f"loading classifier: {name}")
+def _load_classifier(name):
     if name == "text_block":
         net = txt_block_classifier.load_from_checkpoint(settings.MODEL_STORE(name))
     elif name == "url":
@@ -718,6 +717,17 @@ def load_classifier(name):
     return net
 
 
+model_registry.register("classifier", _load_classifier)
+
+
+def load_classifier(name):
+    """
+    only use the result right away, use model_registry.acquire("classifier", name)
+    in order to keep the model (see ModelRegistry.get)
+    """
+    return model_registry.get("classifier", name)
+
+
 @functools.lru_cache()
 def gen_meta_info(url, htmlstr) -> torch.tensor:
     """
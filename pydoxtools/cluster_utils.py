@@ -632,25 +632,152 @@ def pairwise_weighted_distance_combination(
 #       those into a "minimum" function.
 
 
-def boundarybox_query(bbs, bbox, tol=10.0):
+class BoxIndex:
+    """
+    Static, packed R-tree over a list of bounding boxes.
+
+    The leaves get packed using the "Sort-Tile-Recursive" algorithm and all
+    upper levels are stored as arrays, so building the index is just a couple of
+    sorts. Queries are answered for many boxes at once by traversing the tree
+    level-by-level for all (query, node) pairs with vectorized numpy operations.
+
+    All queries return positional indices into the boxes the index was built with,
+    sorted in ascending order.
+
+        index = BoxIndex(df[box_cols].values)
+        df.iloc[index.contained(bbox, tol=10.0)]
+    """
+
+    def __init__(self, boxes: np.ndarray, node_size: int = 16):
+        boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+        self._n = len(boxes)
+        order = self._str_order(boxes, node_size)
+        self._order = order
+        leaves = boxes[order]
+        # for every node we store the minimum and maximum of each coordinate
+        # individually. This way we can prune nodes exactly for
+        # both "contained" and "intersection" queries
+        self._levels: list[tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        mins, maxs = leaves, leaves
+        while len(mins) > 1 or not self._levels:
+            starts = np.arange(0, len(mins), node_size)
+            if len(mins):
+                with np.errstate(invalid="ignore"):
+                    node_mins = np.fmin.reduceat(mins, starts, axis=0)
+                    node_maxs = np.fmax.reduceat(maxs, starts, axis=0)
+            else:
+                node_mins = node_maxs = np.empty((0, 4))
+            self._levels.append((node_mins, node_maxs, np.append(starts, len(mins))))
+            mins, maxs = node_mins, node_maxs
+        self._leaves = leaves
+        self._levels.reverse()  # root first
+
+    @staticmethod
+    def _str_order(boxes: np.ndarray, node_size: int) -> np.ndarray:
+        """Sort-Tile-Recursive ordering of the boxes"""
+        n = len(boxes)
+        if n <= node_size:
+            return np.arange(n)
+        centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+        slice_count = int(np.ceil(np.sqrt(np.ceil(n / node_size))))
+        slice_size = slice_count * node_size
+        order = np.argsort(centers[:, 0], kind="stable")
+        for start in range(0, n, slice_size):
+            part = order[start:start + slice_size]
+            order[start:start + slice_size] = part[np.argsort(centers[part, 1], kind="stable")]
+        return order
+
+    def __len__(self):
+        return self._n
+
+    @staticmethod
+    def _expand(pairs_q: np.ndarray, nodes: np.ndarray, starts: np.ndarray):
+        """get all (query, child) pairs for the (query, node) pairs"""
+        counts = starts[nodes + 1] - starts[nodes]
+        q = np.repeat(pairs_q, counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return q, np.repeat(starts[nodes], counts) + offsets
+
+    def _query(self, lower: np.ndarray, upper: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        find all boxes b with lower < b < upper (elementwise for all 4 coordinates)
+        for a batch of queries. returns (query indices, box indices)
+        """
+        nq = len(lower)
+        if self._n == 0 or nq == 0:
+            return np.empty(0, dtype=int), np.empty(0, dtype=int)
+        q = np.arange(nq)
+        nodes = np.zeros(nq, dtype=int)
+        for node_mins, node_maxs, starts in self._levels:
+            # prune nodes which can not contain any matching box
+            keep = ((node_maxs[nodes] > lower[q]) & (node_mins[nodes] < upper[q])).all(axis=1)
+            q, nodes = self._expand(q[keep], nodes[keep], starts)
+        leaves = self._leaves[nodes]
+        match = ((leaves > lower[q]) & (leaves < upper[q])).all(axis=1)
+        return q[match], self._order[nodes[match]]
+
+    @staticmethod
+    def _split(nq: int, q: np.ndarray, idx: np.ndarray) -> list[np.ndarray]:
+        order = np.lexsort((idx, q))
+        q, idx = q[order], idx[order]
+        return np.split(idx, np.searchsorted(q, np.arange(1, nq)))
+
+    @staticmethod
+    def _bounds(bboxes, tol: float, intersection: bool):
+        bboxes = np.asarray(bboxes, dtype=float).reshape(-1, 4)
+        inf = np.full(len(bboxes), np.inf)
+        if intersection:  # b.x1 > x0 - tol, b.x0 < x1 + tol etc...
+            lower = np.column_stack([-inf, -inf, bboxes[:, 0] - tol, bboxes[:, 1] - tol])
+            upper = np.column_stack([bboxes[:, 2] + tol, bboxes[:, 3] + tol, inf, inf])
+        else:  # box is completely inside of the query box
+            lower = np.column_stack([bboxes[:, 0] - tol, bboxes[:, 1] - tol, -inf, -inf])
+            upper = np.column_stack([inf, inf, bboxes[:, 2] + tol, bboxes[:, 3] + tol])
+        return lower, upper
+
+    def contained_batch(self, bboxes, tol: float = 0.0) -> list[np.ndarray]:
+        """for each query box, get the boxes which are inside of it"""
+        lower, upper = self._bounds(bboxes, tol, intersection=False)
+        return self._split(len(lower), *self._query(lower, upper))
+
+    def intersecting_batch(self, bboxes, tol: float = 0.0) -> list[np.ndarray]:
+        """for each query box, get the boxes which intersect with it"""
+        lower, upper = self._bounds(bboxes, tol, intersection=True)
+        return self._split(len(lower), *self._query(lower, upper))
+
+    def count_intersecting(self, bboxes, tol: float = 0.0) -> np.ndarray:
+        """number of intersecting boxes for each query box"""
+        lower, upper = self._bounds(bboxes, tol, intersection=True)
+        q, _ = self._query(lower, upper)
+        return np.bincount(q, minlength=len(lower))
+
+    def contained(self, bbox, tol: float = 0.0) -> np.ndarray:
+        return self.contained_batch([bbox], tol)[0]
+
+    def intersecting(self, bbox, tol: float = 0.0) -> np.ndarray:
+        return self.intersecting_batch([bbox], tol)[0]
+
+
+def boundarybox_query(bbs, bbox, tol=10.0, index: BoxIndex = None):
     """
     This function filters a pandas list of boundingboxes for
     boxes that are fully contained in a specific region
 
-    TODO: also do this using an rtree/bvh function
-
     :param bbs: list of boundary boxes to search
     :param bbox: search in this area
     :param tol: search tolerance (with respect to a single dimension)
+    :param index: optional BoxIndex which was built from bbs[box_cols]. Speeds up
+                  the query a lot if many queries are done on the same boxes.
     :return: list of boundary boxes extracted from bbs which are in the search area *bbox*
     """
+    if index is not None:
+        return bbs.iloc[index.contained(np.asarray(bbox, dtype=float), tol=tol)]
     # valid_areas.loc[valid_areas.x0>bbox[0]].loc[valid_areas.x1<bbox[2]]
     # in order to increase the speed we filter with several .loc operations
     return bbs.loc[bbs.y0 > (bbox[1] - tol)].loc[bbs.y1 < (bbox[3] + tol)] \
         .loc[bbs.x0 > (bbox[0] - tol)].loc[bbs.x1 < (bbox[2] + tol)]
 
 
-def boundarybox_intersection_query(bbs, bbox, tol=1.0):
+def boundarybox_intersection_query(bbs, bbox, tol=1.0, index: BoxIndex = None):
     """
     This function filters a pandas list of boundingboxes for
     boxes that intersect with each other
@@ -658,15 +785,19 @@ def boundarybox_intersection_query(bbs, bbox, tol=1.0):
     :param bbs: list of boundary boxes to search
     :param bbox: search in this area
     :param tol: search tolerance (with respect to a single dimension)
+    :param index: optional BoxIndex which was built from bbs[box_cols]
     :return: list of boundary boxes extracted from bbs which are in the search area *bbox*
     """
+    if index is not None:
+        return bbs.index[index.intersecting(np.asarray(bbox, dtype=float), tol=tol)]
     # valid_areas.loc[valid_areas.x0>bbox[0]].loc[valid_areas.x1<bbox[2]]
     # in order to increase the speed we filter with several .loc operations
-    indices =  bbs.loc[bbs.y1 > (bbox[1] - tol)].loc[bbs.y0 < (bbox[3] + tol)] \
+    indices = bbs.loc[bbs.y1 > (bbox[1] - tol)].loc[bbs.y0 < (bbox[3] + tol)] \
         .loc[bbs.x1 > (bbox[0] - tol)].loc[bbs.x0 < (bbox[2] + tol)].index
 
     return indices
 
+
 # TODO: check in different location whether it makes sense that
 #       we use a custom distance function in order to improve clustering
 # TODO: directly hand over the distance matrix for clarity?...
@@ -713,6 +844,120 @@ def distance_cluster(data: np.ndarray = None,
     return res.labels_, res.distances_
 
 
+def weighted_distance_cutoff(
+        parameter_list: typing.Dict[str, typing.List], distance_threshold: float
+) -> tuple[float, float]:
+    """
+    Calculate the maximum gaps along x and y for which two boxes can have a
+    distance < distance_threshold using pairwise_weighted_distance_combination.
+
+    "va": p0*y_gap + min(p1*|dx0|, p2*|dxm|, p3*|dx1|), and the gap along x can never
+    be larger than any of the x-edge alignements. "ha" works the same way with switched axes.
+    For unknown distance functions we can not give a bound and return infinity.
+    """
+    cx, cy = 0.0, 0.0
+    t = np.float64(distance_threshold)
+    with np.errstate(divide="ignore"):
+        for key, p in parameter_list.items():
+            if not p:
+                continue
+            if key == "va":
+                cy = max(cy, t / p[0])
+                cx = max(cx, max(t / np.float64(w) for w in p[1:4]))
+            elif key == "ha":
+                cx = max(cx, t / p[0])
+                cy = max(cy, max(t / np.float64(w) for w in p[1:4]))
+            else:
+                return np.inf, np.inf
+    return float(cx), float(cy)
+
+
+def txtbox_dist_cutoff(distance_threshold: float, min_line_alignement: float, max_box_gap: float) -> tuple[float, float]:
+    """
+    maximum gaps along x and y for which two boxes can have a
+    distance < distance_threshold using pairwise_txtbox_dist.
+    The gap along y is always smaller than the line alignement.
+    """
+    return distance_threshold * max_box_gap, distance_threshold * min_line_alignement
+
+
+def candidate_pairs(boxes: np.ndarray, cutoff: tuple[float, float]) -> np.ndarray:
+    """
+    get all pairs of boxes with gaps along x and y smaller than cutoff=(cx, cy).
+
+    Uses a BoxIndex as a spatial pre-filter, so that we don't have to calculate the
+    distance of every box to every other box.
+
+    returns pair indices (i>j) in the same format as lower_triangle_indices_cached
+    """
+    n = len(boxes)
+    cx, cy = cutoff
+    if not (np.isfinite(cx) and np.isfinite(cy)):
+        return np.array(lower_triangle_indices_cached(n))
+    # make the cutoff slightly larger in order to make up for rounding errors
+    cx, cy = cx * (1 + 1e-9) + 1e-9, cy * (1 + 1e-9) + 1e-9
+    index = BoxIndex(boxes[:, :4])
+    search = boxes[:, :4] + [-cx, -cy, cx, cy]
+    q, idx = index._query(*index._bounds(search, 0.0, intersection=True))
+    keep = q > idx
+    return np.vstack([q[keep], idx[keep]])
+
+
+def connected_component_labels(n: int, edges: np.ndarray) -> np.ndarray:
+    """
+    vectorized union-find: returns the component labels of n nodes
+    connected by *edges* (2 x m). Labels are numbered in order of the first
+    occurrence of a component.
+    """
+    parent = np.arange(n)
+    a, b = edges
+    while True:
+        # hook the larger root onto the smaller one
+        pa, pb = parent[a], parent[b]
+        m = np.minimum(pa, pb)
+        new = parent.copy()
+        np.minimum.at(new, pa, m)
+        np.minimum.at(new, pb, m)
+        # path compression
+        while True:
+            nxt = new[new]
+            if (nxt == new).all():
+                break
+            new = nxt
+        if (new == parent).all():
+            break
+        parent = new
+    return np.unique(parent, return_inverse=True)[1]
+
+
+def distance_cluster_sparse(
+        boxes: np.ndarray,
+        pairwise_distance_func: typing.Callable,
+        distance_threshold: float,
+        cutoff: tuple[float, float] = (np.inf, np.inf),
+        **kwargs
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Single-linkage clustering of boxes which doesn't need a dense distance matrix.
+
+    Distances are only calculated for pairs of boxes which are closer than *cutoff*
+    along x & y (see candidate_pairs). All pairs with a distance < distance_threshold get
+    connected and the connected components form the clusters. This results in the same clusters
+    as distance_cluster (AgglomerativeClustering with single linkage) as long as the cutoff
+    is a valid bound for the distance function.
+
+    returns labels and the distances of all connecting pairs
+    """
+    boxes = np.asarray(boxes, dtype=float)
+    n = len(boxes)
+    if n < 2:
+        return np.zeros(n, dtype=int), np.empty(0)
+    pair_idx = candidate_pairs(boxes, cutoff)
+    d = pairwise_distance_func(boxes, pair_idx, **kwargs)
+    connected = d < distance_threshold
+    return connected_component_labels(n, pair_idx[:, connected]), np.sort(d[connected])
+
+
 # TODO: generalize this method to more dimensions in order to be able
 #       to replace sklearn clustering for our distance functions...
 # TODO: move this to list functions....
@@ -0,0 +1,327 @@
+"""
+A vector index which spans many documents (a "corpus").
+
+Vectors of noun chunks, sentences and text boxes of every added document
+get appended to memory-mapped files on disk together with metadata which
+identifies the document and the position of the text inside of it:
+
+    corpus = CorpusIndex("/data/corpus_index")
+    for path in paths:
+        corpus.add_document(Document(path), doc_id=str(path))
+    corpus.save()  # only needed for the approximate index, everything else is written right away
+
+    hits = corpus.search(query_vec, k=10, sources=["sents"])
+    # [CorpusHit(doc_id=..., source="sents", offset=3, text="...", distance=0.12), ...]
+
+Small corpora are searched exactly. Once the corpus gets larger than
+settings.PDXT_BRUTE_FORCE_INDEX_MAX_SIZE an approximate hnswlib index
+(if available) is maintained in addition to the raw vectors.
+"""
+
+import json
+import logging
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+
+from pydoxtools.settings import settings
+from pydoxtools.vector_index import HnswIndex, VectorIndex, _normalize, hnswlib, load_index
+
+logger = logging.getLogger(__name__)
+
+# sources of vectors in a document: source name -> (vector output, text output)
+SOURCES: dict[str, tuple[str, str]] = {
+    "noun_chunks": ("noun_vecs", "noun_chunks"),
+    "sents": ("sent_vecs", "spacy_sents"),
+    "text_boxes": ("text_box_vecs", "text_box_list"),
+}
+
+_META_DTYPE = np.dtype([("doc", np.int32), ("source", np.int8), ("offset", np.int32)])
+
+
+@dataclass
+class CorpusHit:
+    doc_id: str
+    source: str
+    offset: int  # position of the element in the source list of the document (e.g. the n-th sentence)
+    text: str
+    distance: float
+
+
+class CorpusIndex(VectorIndex):
+    """
+    Incrementally growing, memory-mapped vector index over many documents.
+
+    path: directory where the index is stored. An existing index gets opened.
+    vectorizer: function which converts query strings into vectors, e.g. doc.x("vectorizer")
+    """
+    backend = "corpus"
+
+    def __init__(self, path: str | Path, vectorizer: Callable[[str], np.ndarray] = None):
+        self._path = Path(path)
+        self._path.mkdir(parents=True, exist_ok=True)
+        self._vectorizer = vectorizer
+        self._lock = threading.RLock()
+        self._vecs = self._meta = self._deleted = None  # memory maps, opened lazily
+        self._texts = None
+        self._ann: HnswIndex | None = None
+        info_file = self._path / "index.json"
+        if info_file.exists():
+            info = json.loads(info_file.read_text())
+            self._dim, self._doc_ids = info["dim"], info["documents"]
+            if (self._path / "ann.idx").exists():
+                self._ann = load_index(self._path / "ann.idx")
+                if len(self._ann) < len(self):
+                    # vectors which were added after the last save
+                    self._open()
+                    self._ann.add_items(np.asarray(self._vecs[len(self._ann):]), np.arange(len(self._ann), len(self)))
+        else:
+            self._dim, self._doc_ids = None, []
+        self._doc_numbers = {d: i for i, d in enumerate(self._doc_ids) if d is not None}
+
+    def _file(self, name: str) -> Path:
+        return self._path / name
+
+    def _write_info(self):
+        """write the dimension & document list which are needed to interpret the data files"""
+        self._file("index.json").write_text(json.dumps(dict(dim=self._dim, documents=self._doc_ids)))
+
+    def _invalidate(self):
+        self._vecs = self._meta = self._deleted = None
+
+    def _open(self):
+        if self._vecs is None and len(self):
+            n = len(self)
+            self._vecs = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r", shape=(n, self._dim))
+            self._meta = np.memmap(self._file("meta.bin"), dtype=_META_DTYPE, mode="r", shape=(n,))
+            self._deleted = np.memmap(self._file("deleted.u8"), dtype=np.uint8, mode="r+", shape=(n,))
+
+    def __len__(self) -> int:
+        """number of stored vectors (including deleted ones)"""
+        f = self._file("meta.bin")
+        return f.stat().st_size // _META_DTYPE.itemsize if f.exists() else 0
+
+    @property
+    def documents(self) -> list[str]:
+        return list(self._doc_numbers)
+
+    def add_items(
+            self, data: np.ndarray, ids: list[int] | np.ndarray = None,
+            doc_id: str = "", source: str = "noun_chunks"
+    ):
+        """
+        add vectors without texts to the document *doc_id* (see add_vectors).
+
+        The labels of a CorpusIndex are always the row numbers of the vectors,
+        so *ids* can only be the row numbers the vectors get anyway.
+        """
+        data = np.atleast_2d(data)
+        with self._lock:
+            if ids is not None and not np.array_equal(ids, np.arange(len(self), len(self) + len(data))):
+                raise ValueError("the labels of a CorpusIndex are the row numbers of its vectors")
+            self.add_vectors(doc_id, source, data, [""] * len(data))
+
+    def add_vectors(self, doc_id: str, source: str, vecs: np.ndarray, texts: list[str]):
+        """append vectors of a single source of a document to the index"""
+        vecs = _normalize(vecs) if len(vecs) else np.empty((0, self._dim or 0), dtype=np.float32)
+        if len(vecs) != len(texts):
+            raise ValueError(f"got {len(vecs)} vectors, but {len(texts)} texts")
+        if not len(vecs):
+            return
+        with self._lock:
+            if self._dim is None:
+                self._dim = vecs.shape[1]
+            elif vecs.shape[1] != self._dim:
+                raise ValueError(f"vectors have dimension {vecs.shape[1]}, but the index has {self._dim}")
+            if (doc := self._doc_numbers.get(doc_id)) is None:
+                doc = self._doc_numbers[doc_id] = len(self._doc_ids)
+                self._doc_ids.append(doc_id)
+                self._write_info()
+            start = len(self)
+            meta = np.zeros(len(vecs), dtype=_META_DTYPE)
+            meta["doc"], meta["source"], meta["offset"] = doc, list(SOURCES).index(source), np.arange(len(vecs))
+            self._invalidate()
+            with open(self._file("vectors.f32"), "ab") as f:
+                f.write(vecs.tobytes())
+            with open(self._file("meta.bin"), "ab") as f:
+                f.write(meta.tobytes())
+            with open(self._file("deleted.u8"), "ab") as f:
+                f.write(bytes(len(vecs)))
+            with open(self._file("texts.jsonl"), "a") as f:
+                f.writelines(json.dumps(str(t)) + "\n" for t in texts)
+            if self._texts is not None:
+                self._texts.extend(str(t) for t in texts)
+
+            ids = np.arange(start, start + len(vecs))
+            if self._ann is not None:
+                self._ann.add_items(vecs, ids)
+            elif hnswlib is not None and len(self) > settings.PDXT_BRUTE_FORCE_INDEX_MAX_SIZE:
+                logger.info(f"building approximate index for {len(self)} vectors")
+                self._open()
+                self._ann = HnswIndex(dim=self._dim, max_elements=2 * len(self))
+                # deleted vectors get filtered out during search
+                self._ann.add_items(np.asarray(self._vecs), np.arange(len(self)))
+
+    def add_document(self, doc, doc_id: str, sources: list[str] = ("noun_chunks",)):
+        """
+        add the vectors of a pydoxtools Document to the index. An already existing
+        document with the same doc_id gets replaced.
+        """
+        with self._lock:
+            if doc_id in self._doc_numbers:
+                self.remove_document(doc_id)
+            for source in sources:
+                vec_name, text_name = SOURCES[source]
+                vecs = np.asarray(doc.x(vec_name))
+                texts = [str(t) for t in doc.x(text_name)]
+                self.add_vectors(doc_id, source, vecs, texts)
+
+    def remove_document(self, doc_id: str):
+        """mark all vectors of a document as deleted"""
+        with self._lock:
+            doc = self._doc_numbers.pop(doc_id, None)
+            if doc is None:
+                return
+            self._doc_ids[doc] = None
+            self._write_info()
+            self._open()
+            if self._deleted is not None:
+                self._deleted[self._meta["doc"] == doc] = 1
+                self._deleted.flush()
+
+    def _texts_list(self) -> list[str]:
+        if self._texts is None:
+            with open(self._file("texts.jsonl")) as f:
+                self._texts = [json.loads(line) for line in f]
+        return self._texts
+
+    def _valid_mask(self, sources: list[str] = None) -> np.ndarray:
+        valid = self._deleted == 0
+        if sources:
+            valid &= np.isin(self._meta["source"], [list(SOURCES).index(s) for s in sources])
+        return valid
+
+    def _exact_query(self, queries: np.ndarray, k: int, valid: np.ndarray,
+                     chunk_size: int = 1 << 16) -> tuple[np.ndarray, np.ndarray]:
+        labels = np.full((len(queries), 0), -1, dtype=np.int64)
+        distances = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, len(self), chunk_size):
+            sel = np.flatnonzero(valid[start:start + chunk_size]) + start
+            if not len(sel):
+                continue
+            dist = 1.0 - queries @ np.asarray(self._vecs[sel]).T
+            labels = np.hstack((labels, np.broadcast_to(sel, dist.shape)))
+            distances = np.hstack((distances, dist))
+            if labels.shape[1] > k:  # keep only the best k candidates
+                best = np.argpartition(distances, k - 1, axis=1)[:, :k]
+                labels = np.take_along_axis(labels, best, axis=1)
+                distances = np.take_along_axis(distances, best, axis=1)
+        order = np.argsort(distances, axis=1, kind="stable")
+        return np.take_along_axis(labels, order, axis=1), np.take_along_axis(distances, order, axis=1)
+
+    def _ann_query(self, queries: np.ndarray, k: int, valid: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        # fetch more candidates than needed, as some of them might be deleted
+        # or from other sources
+        fetch = min(len(self), max(2 * k, int(k * len(valid) / max(valid.sum(), 1)) + k))
+        while True:
+            labels, distances = self._ann.knn_query(queries, k=fetch)
+            ok = valid[labels]
+            if ok.sum(axis=1).min() >= k or fetch >= len(self):
+                break
+            fetch = min(len(self), 4 * fetch)
+        order = np.argsort(~ok, axis=1, kind="stable")[:, :k]
+        labels = np.take_along_axis(labels, order, axis=1)
+        distances = np.take_along_axis(distances, order, axis=1)
+        ok = np.take_along_axis(ok, order, axis=1)
+        return np.where(ok, labels, -1), np.where(ok, distances, np.inf)
+
+    def knn_query(self, data: np.ndarray, k: int = 1, sources: list[str] = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        return (labels, distances) of the k nearest (non-deleted) vectors for
+        every query vector. labels are row numbers of the index. If less than k
+        vectors can be found, labels are padded with -1.
+        """
+        with self._lock:
+            queries = _normalize(data)
+            if not len(self):
+                return (np.full((len(queries), 0), -1, dtype=np.int64),
+                        np.empty((len(queries), 0), dtype=np.float32))
+            self._open()
+            valid = self._valid_mask(sources)
+            k = min(k, len(self))
+            if self._ann is not None:
+                return self._ann_query(queries, k, valid)
+            labels, distances = self._exact_query(queries, k, valid)
+            if labels.shape[1] < k:
+                pad = k - labels.shape[1]
+                labels = np.pad(labels, ((0, 0), (0, pad)), constant_values=-1)
+                distances = np.pad(distances, ((0, 0), (0, pad)), constant_values=np.inf)
+            return labels, distances
+
+    def search(
+            self, query: str | np.ndarray, k: int = 5, sources: list[str] = None
+    ) -> list[CorpusHit] | list[list[CorpusHit]]:
+        """
+        search the corpus for the k most similar elements. query can be a string (which needs a
+        vectorizer), a vector or a 2D-matrix of vectors in which case a list of results is returned.
+        """
+        batched = isinstance(query, np.ndarray) and query.ndim == 2
+        if isinstance(query, str):
+            if self._vectorizer is None:
+                raise ValueError("a vectorizer is needed in order to search for strings")
+            query = self._vectorizer(query)
+        labels, distances = self.knn_query(query, k=k, sources=sources)
+        with self._lock:
+            texts, source_names = self._texts_list(), list(SOURCES)
+            res = [[CorpusHit(doc_id=self._doc_ids[self._meta["doc"][i]],
+                              source=source_names[self._meta["source"][i]],
+                              offset=int(self._meta["offset"][i]),
+                              text=texts[i], distance=float(d))
+                    for i, d in zip(li, di) if i >= 0]
+                   for li, di in zip(labels, distances)]
+        return res if batched else res[0]
+
+    def save(self, path: str | Path = None):
+        """
+        write the approximate index to disk. Vectors and the document list are
+        always written right away.
+        """
+        if path is not None and Path(path) != self._path:
+            raise ValueError("a CorpusIndex can only be saved to its own directory")
+        with self._lock:
+            if self._deleted is not None:
+                self._deleted.flush()
+            self._write_info()
+            if self._ann is not None:
+                self._ann.save(self._file("ann.idx"))
+
+    def compact(self):
+        """remove deleted vectors from the files on disk and rebuild the approximate index"""
+        with self._lock:
+            self._open()
+            if self._deleted is None or not self._deleted.any():
+                return
+            keep = np.flatnonzero(self._deleted == 0)
+            vecs, meta = np.array(self._vecs[keep]), np.array(self._meta[keep])
+            texts = [self._texts_list()[i] for i in keep]
+            # re-number documents
+            doc_ids = [self._doc_ids[d] for d in np.unique(meta["doc"])]
+            meta["doc"] = np.searchsorted(np.unique(meta["doc"]), meta["doc"])
+            self._invalidate()
+            self._file("vectors.f32").write_bytes(vecs.tobytes())
+            self._file("meta.bin").write_bytes(meta.tobytes())
+            self._file("deleted.u8").write_bytes(bytes(len(keep)))
+            with open(self._file("texts.jsonl"), "w") as f:
+                f.writelines(json.dumps(t) + "\n" for t in texts)
+            self._texts = texts
+            self._doc_ids = doc_ids
+            self._doc_numbers = {d: i for i, d in enumerate(doc_ids)}
+            self._ann = None
+            self._file("ann.idx").unlink(missing_ok=True)
+            if hnswlib is not None and len(keep) > settings.PDXT_BRUTE_FORCE_INDEX_MAX_SIZE:
+                self._ann = HnswIndex(dim=self._dim, max_elements=2 * len(keep))
+                self._ann.add_items(vecs, np.arange(len(keep)))
+            self.save()
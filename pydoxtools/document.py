@@ -1,27 +1,45 @@
-import langdetect
 import numpy as np
-import pandas as pd
 
 from . import document_base
-from .extract_classes import LanguageExtractor, TextBlockClassifier
 from .extract_files import FileLoader
-from .extract_html import HtmlExtractor
-from .extract_index import IndexExtractor, KnnQuery, SimilarityGraph, ExtractKeywords
-from .extract_logic import Alias, Constant
-from .extract_logic import LambdaExtractor
-from .extract_nlpchat import OpenAIChat
-from .extract_objects import EntityExtractor
-from .extract_ocr import OCRExtractor
-from .extract_pandoc import PandocLoader, PandocExtractor, PandocConverter, PandocBlocks
-from .extract_spacy import SpacyExtractor, extract_spacy_token_vecs, get_spacy_embeddings, extract_noun_chunks
-from .extract_tables import ListExtractor, TableCandidateAreasExtractor
-from .extract_textstructure import DocumentElementFilter, TextBoxElementExtractor, TitleExtractor
-from .html_utils import get_text_only_blocks
-from .list_utils import flatten
-from .pdf_utils import PDFFileLoader
-from .qamachine import QamExtractor
+from .extract_logic import Alias, Constant, LambdaExtractor, LazyFunction, lazy_extractor
 from .settings import settings
 
+# Extractors and functions which need heavy libraries (torch, spacy, pandoc, sklearn etc...)
+# only get imported when they are used for the first time. This keeps "import pydoxtools" fast.
+LanguageExtractor = lazy_extractor("pydoxtools.extract_classes", "LanguageExtractor")
+TextBlockClassifier = lazy_extractor("pydoxtools.extract_classes", "TextBlockClassifier")
+HtmlExtractor = lazy_extractor("pydoxtools.extract_html", "HtmlExtractor")
+IndexExtractor = lazy_extractor("pydoxtools.extract_index", "IndexExtractor")
+KnnQuery = lazy_extractor("pydoxtools.extract_index", "KnnQuery")
+SimilarityGraph = lazy_extractor("pydoxtools.extract_index", "SimilarityGraph")
+ExtractKeywords = lazy_extractor("pydoxtools.extract_index", "ExtractKeywords")
+OpenAIChat = lazy_extractor("pydoxtools.extract_nlpchat", "OpenAIChat")
+EntityExtractor = lazy_extractor("pydoxtools.extract_objects", "EntityExtractor")
+OCRExtractor = lazy_extractor("pydoxtools.extract_ocr", "OCRExtractor")
+PandocLoader = lazy_extractor("pydoxtools.extract_pandoc", "PandocLoader")
+PandocExtractor = lazy_extractor("pydoxtools.extract_pandoc", "PandocExtractor")
+PandocConverter = lazy_extractor("pydoxtools.extract_pandoc", "PandocConverter")
+PandocBlocks = lazy_extractor("pydoxtools.extract_pandoc", "PandocBlocks")
+SpacyExtractor = lazy_extractor("pydoxtools.extract_spacy", "SpacyExtractor")
+ListExtractor = lazy_extractor("pydoxtools.extract_tables", "ListExtractor")
+TableCandidateAreasExtractor = lazy_extractor("pydoxtools.extract_tables", "TableCandidateAreasExtractor")
+DocumentElementFilter = lazy_extractor("pydoxtools.extract_textstructure", "DocumentElementFilter")
+TextBoxElementExtractor = lazy_extractor("pydoxtools.extract_textstructure", "TextBoxElementExtractor")
+TitleExtractor = lazy_extractor("pydoxtools.extract_textstructure", "TitleExtractor")
+PDFFileLoader = lazy_extractor("pydoxtools.pdf_utils", "PDFFileLoader")
+PDFPageStreamer = lazy_extractor("pydoxtools.pdf_utils", "PDFPageStreamer")
+QamExtractor = lazy_extractor("pydoxtools.qamachine", "QamExtractor")
+
+DataFrame = LazyFunction("pandas", "DataFrame")
+similarity_graph_to_networkx = LazyFunction("pydoxtools.extract_index", "similarity_graph_to_networkx")
+extract_spacy_token_vecs = LazyFunction("pydoxtools.extract_spacy", "extract_spacy_token_vecs")
+get_spacy_embeddings = LazyFunction("pydoxtools.extract_spacy", "get_spacy_embeddings")
+extract_noun_chunks = LazyFunction("pydoxtools.extract_spacy", "extract_noun_chunks")
+get_text_only_blocks = LazyFunction("pydoxtools.html_utils", "get_text_only_blocks")
+detect_section_languages = LazyFunction("pydoxtools.language_utils", "detect_section_languages")
+flatten = LazyFunction("pydoxtools.list_utils", "flatten")
+
 
 class Document(document_base.Pipeline):
     """Standard document class for document analysis, data extraction and transformation.
@@ -113,22 +131,28 @@ that are higher up in the hierarchy. The argument precedence is hereby as follow
     _extractors = {
         ".pdf": [
             FileLoader()  # pdfs are usually in binary format...
-            .pipe(fobj="_fobj").out("raw_content").cache(),
+            .pipe(fobj="_fobj").out("raw_content").cache().no_disk_cache(),
             PDFFileLoader()
             .pipe(fobj="raw_content", page_numbers="_page_numbers", max_pages="_max_pages")
-            .out("pages_bbox", "elements", "meta", pages="page_set")
-            .cache(),
+            .out("pages_bbox", "element_store", "meta", pages="page_set")
+            .cache().config(workers="pdf_workers"),
+            # the DataFrame is a lot larger than the element store, so we don't put it on disk
+            LambdaExtractor(lambda store: store.to_frame())
+            .pipe(store="element_store").out("elements").cache().no_disk_cache(),
+            PDFPageStreamer()
+            .pipe(fobj="raw_content", page_numbers="_page_numbers", max_pages="_max_pages", filename="filename")
+            .out("page_stream"),
             LambdaExtractor(lambda pages: len(pages))
             .pipe(pages="page_set").out("num_pages").cache(),
             DocumentElementFilter(element_type=document_base.ElementType.Line)
-            .pipe("elements").out("line_elements").cache(),
+            .pipe(elements="element_store").out("line_elements").cache(),
             DocumentElementFilter(element_type=document_base.ElementType.Graphic)
-            .pipe("elements").out("graphic_elements").cache(),
+            .pipe(elements="element_store").out("graphic_elements").cache(),
             ListExtractor().cache()
             .pipe("line_elements").out("lists"),
             TableCandidateAreasExtractor()
             .pipe("graphic_elements", "line_elements", "pages_bbox", "text_box_elements", "filename")
-            .out("table_candidates", box_levels="table_box_levels").cache(),
+            .out("table_candidates", box_levels="table_box_levels").cache().in_process_pool(),
             LambdaExtractor(lambda candidates: [t.df for t in candidates if t.is_valid])
             .pipe(candidates="table_candidates").out("table_df0").cache(),
             LambdaExtractor(lambda table_df0, lists: table_df0 + [lists]).cache()
@@ -142,7 +166,7 @@ that are higher up in the hierarchy. The argument precedence is hereby as follow
             TitleExtractor()
             .pipe("line_elements").out("titles", "side_titles").cache(),
             LanguageExtractor().cache()
-            .pipe(text="full_text").out("language").cache()
+            .pipe(text="text_box_list").out("language").cache()
         ],
         ".html": [
             HtmlExtractor()
@@ -155,7 +179,7 @@ that are higher up in the hierarchy. The argument precedence is hereby as follow
             LambdaExtractor(lambda article: article.top_image)
             .pipe(article="goose_article").out("main_image").cache(),
             Alias(full_text="main_content"),
-            LambdaExtractor(lambda x: pd.DataFrame(get_text_only_blocks(x), columns=["text"])).cache()
+            LambdaExtractor(lambda x: DataFrame(get_text_only_blocks(x), columns=["text"])).cache()
             .pipe(x="raw_content").out("text_box_elements"),
             LambdaExtractor(lambda t, s: [t, s])
             .pipe(t="title", s="short_title").out("titles").cache(),
@@ -198,8 +222,11 @@ that are higher up in the hierarchy. The argument precedence is hereby as follow
             # now taking the pdf from a different variable
             PDFFileLoader()
             .pipe(fobj="ocr_pdf_file")
-            .out("pages_bbox", "elements", "meta", pages="page_set")
+            .out("pages_bbox", "element_store", "meta", pages="page_set")
             .cache(),
+            PDFPageStreamer()
+            .pipe(fobj="ocr_pdf_file", filename="filename")
+            .out("page_stream"),
         ],
         # the first base doc types have priority over the last ones
         # so here .png > image > .pdf
@@ -211,9 +238,9 @@ that are higher up in the hierarchy. The argument precedence is hereby as follow
         "*": [
             FileLoader()
             .pipe(fobj="_fobj", document_type="document_type", page_numbers="_page_numbers", max_pages="_max_pages")
-            .out("raw_content").cache(),
+            .out("raw_content").cache().no_disk_cache(),
             Alias(full_text="raw_content"),
-            LambdaExtractor(lambda x: pd.DataFrame(x.split("\n"), columns=["text"]))
+            LambdaExtractor(lambda x: DataFrame(x.split("\n"), columns=["text"]))
             .pipe(x="full_text").out("text_box_elements").cache(),
             LambdaExtractor(lambda df: df.get("text", None).to_list())
             .pipe(df="text_box_elements").out("text_box_list").cache(),
@@ -221,15 +248,20 @@ that are higher up in the hierarchy. The argument precedence is hereby as follow
             .pipe("tables_df").out("tables_dict"),
             Alias(tables="tables_dict"),
             TextBlockClassifier(min_prob=0.6)
-            .pipe("text_box_elements").out("addresses").cache(),
+            .pipe("text_box_elements").out("addresses").cache()
+            .config(batch_size="text_block_batch_size"),
             LambdaExtractor(lambda full_text: 1 + (len(full_text) // 1000))
             .pipe("full_text").out("num_pages").cache(),
-            LambdaExtractor(lambda full_text: langdetect.detect(full_text))
-            .pipe("full_text").out("language").cache(),
+            LanguageExtractor()
+            .pipe(text="text_box_list").out("language").cache(),
+            LambdaExtractor(detect_section_languages)
+            .pipe(text="text_box_list").out("section_languages").cache(),
 
             #########  SPACY WRAPPERS  #############
             SpacyExtractor(model_size="md")
-            .pipe("full_text", "language").out(doc="spacy_doc", nlp="spacy_nlp").cache(),
+            .pipe("full_text", "language").out(doc="spacy_doc", nlp="spacy_nlp").cache().no_disk_cache()
+            .config(outputs=document_base.REQUESTED_OUTPUTS, chunk_size="spacy_chunk_size",
+                    batch_size="spacy_batch_size", n_process="spacy_n_process"),
             LambdaExtractor(extract_spacy_token_vecs)
             .pipe("spacy_doc").out("spacy_vectors"),
             LambdaExtractor(get_spacy_embeddings)
@@ -237,7 +269,7 @@ that are higher up in the hierarchy. The argument precedence is hereby as follow
             LambdaExtractor(lambda spacy_doc: list(spacy_doc.sents))
             .pipe("spacy_doc").out("spacy_sents"),
             LambdaExtractor(extract_noun_chunks)
-            .pipe("spacy_doc").out("spacy_noun_chunks").cache(),
+            .pipe("spacy_doc").out("spacy_noun_chunks").cache().no_disk_cache(),
             ########## END OF SPACY ################
 
             EntityExtractor().cache()
@@ -257,16 +289,28 @@ that are higher up in the hierarchy. The argument precedence is hereby as follow
             )
             .pipe(x="noun_chunks").out("noun_vecs", "noun_ids").cache(),
             IndexExtractor()
-            .pipe(vecs="noun_vecs", ids="noun_ids").out("noun_index").cache(),
+            .pipe(vecs="noun_vecs", ids="noun_ids").out("noun_index").cache()
+            .config(backend="vector_index_backend"),
             LambdaExtractor(lambda spacy_nlp: lambda x: spacy_nlp(x).vector)
-            .pipe("spacy_nlp").out("vectorizer").cache(),
+            .pipe("spacy_nlp").out("vectorizer").cache().no_disk_cache(),
             KnnQuery().pipe(index="noun_index", idx_values="noun_chunks", vectorizer="vectorizer")
-            .out("noun_query").cache(),
-            SimilarityGraph().pipe(index_query_func="noun_query", source="noun_chunks")
-            .out("noun_graph").cache(),
-            ExtractKeywords(top_k=5).pipe(G="noun_graph").out("textrank_keywords").cache(),
+            .out("noun_query").cache().no_disk_cache(),
+            SimilarityGraph().pipe(index="noun_index", vecs="noun_vecs")
+            .out("noun_adjacency").cache(),
+            LambdaExtractor(similarity_graph_to_networkx)
+            .pipe(adjacency="noun_adjacency", labels="noun_chunks").out("noun_graph").cache(),
+            ExtractKeywords(top_k=5).pipe(adjacency="noun_adjacency", labels="noun_chunks")
+            .out("textrank_keywords").cache(),
             ########### END NOUN_INDEX ###########
 
+            ########### CORPUS VECTORS ###########
+            # vectors of other text elements which can be added to a pydoxtools.corpus_index.CorpusIndex
+            LambdaExtractor(lambda x: np.array([s.vector for s in x]))
+            .pipe(x="spacy_sents").out("sent_vecs").cache(),
+            LambdaExtractor(lambda spacy_nlp, text_box_list: np.array(
+                [d.vector for d in spacy_nlp.pipe(text_box_list)]))
+            .pipe("spacy_nlp", "text_box_list").out("text_box_vecs").cache(),
+
             ########### AGGREGATION ##############
             LambdaExtractor(lambda **kwargs: set(flatten(kwargs.values())))
             .pipe("html_keywords", "textrank_keywords").out("keywords").cache(),
@@ -274,10 +318,11 @@ that are higher up in the hierarchy. The argument precedence is hereby as follow
             ########### QaM machine #############
             # TODO: make sure we can set the model that we want to use dynamically!
             QamExtractor(model_id=settings.PDXT_STANDARD_QAM_MODEL)
-            .pipe(text="full_text").out("answers").cache().config(trf_model_id="qam_model_id"),
+            .pipe(text="full_text").out("answers").cache().no_disk_cache()
+            .config(trf_model_id="qam_model_id", batch_size="qam_batch_size"),
 
             ########### Chat AI ##################
             OpenAIChat()
-            .pipe(full_text="full_text").out("chat_answers").cache().config(model_id="model_id"),
+            .pipe(full_text="full_text").out("chat_answers").cache().no_disk_cache().config(model_id="model_id"),
         ]
     }
@@ -1,12 +1,16 @@
 import abc
+import collections
+import concurrent.futures
+import contextlib
 import functools
+import graphlib
 import logging
 import mimetypes
 import pathlib
 import typing
 import uuid
 from abc import ABC
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
 from functools import cached_property
 from pathlib import Path
@@ -14,13 +18,18 @@ from time import time
 from typing import List, Any, IO
 from urllib.parse import urlparse
 
-import networkx as nx
 import numpy as np
-import requests
-import spacy.tokens
+
+from pydoxtools import cache_utils, document_batch, tracing
+
+if typing.TYPE_CHECKING:
+    import spacy.tokens
 
 logger = logging.getLogger(__name__)
 
+# marker for values that couldn't be found in a cache
+_NOT_FOUND = object()
+
 
 @dataclass(eq=True, frozen=True, slots=True)
 class Font:
@@ -57,29 +66,110 @@ class DocumentElement:
     evenodd: int | None
 
 
+def token_vectors(doc: "spacy.tokens.Doc") -> np.ndarray:
+    """
+    get the vectors of all tokens of a spacy document as a matrix. This gives the same
+    result as np.array([t.vector for t in doc]), but without a python loop over all tokens
+    for the common cases. The matrix gets cached in the document.
+    """
+    cache_key = ("pydoxtools", "token_vectors")
+    if (vecs := doc.user_data.get(cache_key)) is not None:
+        return vecs
+    vectors = doc.vocab.vectors
+    if "vector" in doc.user_token_hooks:
+        if doc.has_extension("trf_token_vecs") and (doc._.trf_token_vecs is not None):
+            vecs = doc._.trf_token_vecs
+        else:
+            vecs = np.array([t.vector for t in doc])
+    elif vectors.size == 0 and doc.tensor.size != 0:
+        vecs = doc.tensor
+    elif vectors.size == 0:
+        vecs = np.zeros((len(doc), doc.vocab.vectors_length), dtype=np.float32)
+    elif getattr(vectors, "mode", "default") == "default":
+        # look up the vector rows only once for every unique word
+        keys, inverse = np.unique(doc.to_array(vectors.attr), return_inverse=True)
+        rows = np.array([vectors.key2row.get(int(k), -1) for k in keys], dtype=np.int64)[inverse]
+        data = np.asarray(vectors.data)
+        vecs = np.zeros((len(doc), data.shape[1]), dtype=data.dtype)
+        vecs[rows >= 0] = data[rows[rows >= 0]]
+    else:  # e.g. floret vectors
+        vecs = np.array([t.vector for t in doc])
+    doc.user_data[cache_key] = vecs
+    return vecs
+
+
+def segment_mean(vecs: np.ndarray, segments: list[np.ndarray]) -> np.ndarray:
+    """mean of the rows of vecs for a list of (non-empty) index arrays in a single pass"""
+    if not segments:
+        return np.empty((0, vecs.shape[1]), dtype=vecs.dtype)
+    lengths = np.array([len(seg) for seg in segments])
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    sums = np.add.reduceat(vecs[np.concatenate(segments)], starts, axis=0)
+    return (sums / lengths[:, None]).astype(vecs.dtype, copy=False)
+
+
 class TokenCollection:
-    def __init__(self, tokens: List[spacy.tokens.Token]):
-        self._tokens = tokens
+    """
+    A lightweight view on a selection of tokens of a spacy document
+    (e.g. a noun chunk without its determiners). It only stores the document
+    and the token indices.
+    """
+
+    def __init__(self, doc: "spacy.tokens.Doc", indices: np.ndarray | list[int], vector: np.ndarray = None):
+        self._doc = doc
+        self._indices = np.asarray(indices, dtype=np.int64)
+        if vector is not None:
+            self.__dict__["vector"] = vector
+
+    @classmethod
+    def from_tokens(cls, tokens: List["spacy.tokens.Token"]) -> "TokenCollection":
+        return cls(tokens[0].doc, [t.i for t in tokens])
+
+    @property
+    def doc(self) -> "spacy.tokens.Doc":
+        return self._doc
+
+    @property
+    def indices(self) -> np.ndarray:
+        return self._indices
 
     @cached_property
     def vector(self):
-        return np.mean([t.vector for t in self._tokens], 0)
+        return token_vectors(self._doc)[self._indices].mean(0)
 
     @cached_property
     def text(self):
         return self.__str__()
 
     def __len__(self):
-        return len(self._tokens)
+        return len(self._indices)
 
     def __getitem__(self, item):
-        return self._tokens[item]
+        if isinstance(item, slice):
+            return [self._doc[int(i)] for i in self._indices[item]]
+        return self._doc[int(self._indices[item])]
+
+    def __iter__(self):
+        return (self._doc[int(i)] for i in self._indices)
 
     def __str__(self):
-        return " ".join(t.text for t in self._tokens)
+        return " ".join(t.text for t in self)
 
     def __repr__(self):
-        return "|".join(t.text for t in self._tokens)
+        return "|".join(t.text for t in self)
+
+
+def token_collection_vectors(collections: list[TokenCollection]) -> np.ndarray:
+    """
+    calculate the vectors of many token collections of the same document in a
+    single vectorized pass.
+    """
+    if not collections:
+        return np.empty((0, 0), dtype=np.float32)
+    vecs = segment_mean(token_vectors(collections[0].doc), [tc.indices for tc in collections])
+    for tc, v in zip(collections, vecs):
+        tc.__dict__["vector"] = v
+    return vecs
 
 
 class ExtractorException(Exception):
@@ -122,17 +212,27 @@ class Extractor(ABC):
         self._in_mapping: dict[str, str] = {}
         self._out_mapping: dict[str, str] = {}
         self._cache = False  # TODO: switch to "True" by default
+        self._disk_cache = True  # only has an effect if the pipeline has a disk cache configured
         self._dynamic_config: dict[str, str] = {}
         self._interactive = False
+        self._process = False  # can be run in a process pool in Pipeline.x_parallel
 
     @abc.abstractmethod
     def __call__(self, *args, **kwargs) -> dict[str, typing.Any] | Any:
         pass
 
+    @property
+    def class_name(self) -> str:
+        """name of the extractor class (e.g. for tracing and visualizations)"""
+        return self.__class__.__name__
+
     def _mapped_call(
             self, parent_document: "Pipeline",
             *args,
             config_params: dict[str, Any] = None,
+            executor: concurrent.futures.Executor = None,
+            trace: "tracing.TraceEvent" = None,
+            inputs: tuple[tuple[str, str, bool], ...] = None,
             **kwargs
     ) -> dict[
         str, typing.Any]:
@@ -150,13 +250,22 @@ class Extractor(ABC):
         python-class-member < extractor-graph-function < config
 
         # TODO: maybe we should change precedence and make config the lowest?
+
+        If an executor is given, the extractor function itself gets executed
+        using that executor (for example a process pool).
+
+        If a trace event is given, the sizes of the inputs get recorded in it.
+
+        inputs: the resolved input mapping from an ExtractionPlan. It gets
+            calculated from _in_mapping if not given.
         """
+        if inputs is None:
+            inputs = resolve_inputs(self, parent_document.x_funcs)
         mapped_kwargs = {}
         # get all required input parameters from _in_mapping which was declared with "pipe"
-        for k, v in self._in_mapping.items():
-            # first check if parameter is available as an extractor
-            if v in parent_document.x_funcs:
-                # then call the function to get the value
+        for k, v, is_output in inputs:
+            if is_output:
+                # the parameter is available as an extractor output
                 mapped_kwargs[k] = parent_document.x(v)
             else:
                 # get "native" member-variables or other functions
@@ -169,8 +278,14 @@ class Extractor(ABC):
             mapped_kwargs.update(override_parameters)
 
         # override graph args directly with function call params...
-        mapped_kwargs.update(kwargs)
-        output = self(*args, **mapped_kwargs)
+        if kwargs:
+            mapped_kwargs.update(kwargs)
+        if trace:
+            trace.inputs = {k: tracing.input_size(v) for k, v in mapped_kwargs.items()}
+        if executor:
+            output = executor.submit(self, *args, **mapped_kwargs).result()
+        else:
+            output = self(*args, **mapped_kwargs)
         if isinstance(output, dict):
             return {self._out_mapping[k]: v for k, v in output.items() if k in self._out_mapping}
         else:
@@ -240,6 +355,80 @@ class Extractor(ABC):
         self._cache = False
         return self
 
+    def in_process_pool(self):
+        """
+        indicate that this extractor can be executed in a separate process when the
+        pipeline is run using Pipeline.x_parallel with process_workers > 0.
+
+        This makes sense for heavy, pure-python extractors which would otherwise
+        block each other because of the GIL. The extractor itself, its inputs
+        and outputs have to be picklable for this to work.
+        """
+        self._process = True
+        return self
+
+    def no_disk_cache(self):
+        """
+        indicate to document that the results of this extractor should never be
+        stored in a persistent disk cache. This is needed for values which can
+        not be pickled (e.g. functions) or which don't make sense to be stored
+        on disk such as spacy documents, language models or hnswlib indexes.
+        """
+        self._disk_cache = False
+        return self
+
+
+def resolve_inputs(extractor: Extractor, x_funcs: dict[str, Extractor]) -> tuple[tuple[str, str, bool], ...]:
+    """
+    resolve the input mapping of an extractor into (parameter, source, is_output) tuples.
+    is_output indicates whether the source is the output of another extractor or
+    a member of the document.
+    """
+    return tuple((k, v, v in x_funcs) for k, v in extractor._in_mapping.items())
+
+
+# separates positional from keyword arguments in result keys
+_KWARGS_MARK = object()
+
+
+def result_key(extractor: Extractor, args: tuple = (), kwargs: dict = None) -> tuple[Extractor, tuple]:
+    """
+    key of the results of an extractor call in Pipeline._x_func_cache:
+    (extractor, arguments). Calls without arguments have the key (extractor, ()).
+    """
+    if kwargs:
+        args = args + (_KWARGS_MARK,) + tuple(sorted(kwargs.items(), key=lambda kv: kv[0]))
+    return extractor, args
+
+
+@dataclass(frozen=True, slots=True)
+class ExtractionPlan:
+    """
+    Precompiled information on how to calculate a single output of a document type.
+    Plans get compiled once per document class by MetaDocumentClassConfiguration, so
+    that Pipeline.x doesn't have to look up mappings & configurations on every call.
+
+    Settings of the extractor which can still be changed after the class was created
+    (e.g. Extractor.cache() or Extractor.in_process_pool()) are not part of the plan
+    and get read from the extractor at call time.
+    """
+    name: str
+    extractor: Extractor
+    inputs: tuple[tuple[str, str, bool], ...]  # (parameter, source, is_output)
+    config_keys: tuple[str, ...]  # document config keys which configure the extractor
+    cache_key: tuple[Extractor, tuple]  # key of the results in Pipeline._x_func_cache
+
+
+def compile_plans(x_funcs: dict[str, Extractor], x_config: dict[str, list[str]]) -> dict[str, ExtractionPlan]:
+    """compile an ExtractionPlan for every output of a document type"""
+    return {name: ExtractionPlan(
+        name=name,
+        extractor=ex,
+        inputs=resolve_inputs(ex, x_funcs),
+        config_keys=tuple(x_config.get(name, ())),
+        cache_key=result_key(ex)
+    ) for name, ex in x_funcs.items()}
+
 
 class ConfigurationError(Exception):
     pass
@@ -341,6 +530,7 @@ class MetaDocumentClassConfiguration(type):
                 # to the logic of the parent classes.
                 new_class._x_funcs = {}
                 new_class._x_config = {}
+                new_class._x_plans = {}
                 doc_type: str
                 # add all extractors by combining the logic for the different document types
                 for doc_type in uncombined_extractors:
@@ -378,6 +568,9 @@ class MetaDocumentClassConfiguration(type):
 
                         # TODO: how do we add x-functions to
 
+                    new_class._x_plans[doc_type] = compile_plans(
+                        new_class._x_funcs[doc_type], new_class._x_config[doc_type])
+
                 # TODO: remove "dangling" extractors which lack input mapping
 
         else:
@@ -389,6 +582,36 @@ class MetaDocumentClassConfiguration(type):
         return new_class
 
 
+@dataclass
+class ExtractionResult:
+    """result of Pipeline.extract"""
+    outputs: dict[str, Any]  # the requested outputs in the requested order
+    computed: list[str]  # outputs which were calculated during the extraction
+    reused: list[str]  # outputs which were taken from the memory or disk cache
+    released: list[str] = field(default_factory=list)  # intermediate outputs which were freed again
+
+
+# config key which is set by Pipeline.extract to all outputs which are needed for the
+# requested outputs. Extractors can use it (e.g. with ".config(outputs=REQUESTED_OUTPUTS)")
+# in order to skip work which isn't needed for a request. The outputs of the configured
+# extractor itself are only part of it if they were requested directly.
+REQUESTED_OUTPUTS = "requested_outputs"
+
+
+@dataclass
+class _ExtractionLog:
+    computed: set[str] = field(default_factory=set)
+    reused: set[str] = field(default_factory=set)
+    released: set[str] = field(default_factory=set)
+    names: tuple[str, ...] = ()  # the requested outputs
+    requested: tuple[str, ...] = ()  # upstream closure of the requested outputs
+
+    def requested_for(self, extractor: Extractor) -> tuple[str, ...]:
+        """the value of REQUESTED_OUTPUTS for *extractor*"""
+        indirect = set(extractor._out_mapping.values()).difference(self.names)
+        return tuple(name for name in self.requested if name not in indirect)
+
+
 def is_url(url):
     try:
         result = urlparse(url)
@@ -429,6 +652,9 @@ class Pipeline(metaclass=MetaDocumentClassConfiguration):
     # dict which stores function configurations
     _x_config: dict[str, dict[str, dict[str, Any]]] = {}
 
+    # precompiled execution plans for every output of every document type
+    _x_plans: dict[str, dict[str, ExtractionPlan]] = {}
+
     def __init__(
             self,
             fobj: str | bytes | Path | IO = None,
@@ -438,8 +664,11 @@ class Pipeline(metaclass=MetaDocumentClassConfiguration):
             config: dict[str, Any] = None,
             mime_type: str = None,
             filename: str = None,
-            document_type: str = None
+            document_type: str = None,
             # TODO: add "auto" for automatic recognition of the type using python-magic
+            disk_cache: "cache_utils.DiskCache | bool" = False,
+            tracer: "tracing.Tracer" = None,
+            memory_budget: int = None
     ):
         """
         fobj: a file object which should be loaded.
@@ -454,11 +683,21 @@ class Pipeline(metaclass=MetaDocumentClassConfiguration):
         filename: optional filename. Helps sometimes helps in determining the purpose of a document
         document_type: directly specify the document type which specifies the extraction
             logic that should be used
+        disk_cache: persist the results of cached extractors on disk, keyed by the
+            content of the document. Can be "True" for a cache in the default location
+            (settings.PDXT_DISK_CACHE_DIR) or a cache_utils.DiskCache instance.
+        tracer: record all extractor calls of this document (timing, memory, cache hits)
+            with a tracing.Tracer. Without a tracer, the tracer which was activated
+            with "with Tracer(): ..." gets used.
+        memory_budget: maximum (estimated) memory in bytes for the cached results of this document.
+            If the budget gets exceeded, the least recently used results get evicted and recalculated
+            when they are needed again.
         """
 
         # TODO: move this code into its own little extractor...
         try:
             if is_url(fobj):
+                import requests
                 response = requests.get(fobj)
                 with open('file.pdf', 'wb') as file:
                     fobj = response.content
@@ -473,8 +712,19 @@ class Pipeline(metaclass=MetaDocumentClassConfiguration):
         self._page_numbers = page_numbers
         self._max_pages = max_pages
         self._cache_hits = 0
-        self._x_func_cache: dict[Extractor, dict[str, Any]] = {}
+        self._x_func_cache: dict[tuple[Extractor, tuple], dict[str, Any]] = {}
+        self._memory_budget = memory_budget
+        # sizes of the cached results in the order of their last use (only used with a memory budget)
+        self._x_cache_sizes: dict[tuple[Extractor, tuple], int] = {}
         self._config = config or {}
+        if disk_cache is True:
+            disk_cache = cache_utils.DiskCache()
+        self._disk_cache: cache_utils.DiskCache | None = disk_cache or None
+        self._tracer = tracer
+        # gets set while running Pipeline.x_parallel with process workers
+        self._process_pool: concurrent.futures.Executor | None = None
+        # records computed & reused outputs while running Pipeline.extract
+        self._extraction_log: _ExtractionLog | None = None
 
     @cached_property
     def filename(self) -> str | None:
@@ -531,43 +781,132 @@ class Pipeline(metaclass=MetaDocumentClassConfiguration):
         """
         return self._x_funcs.get(self.document_logic_id, self._x_funcs["*"])
 
+    @cached_property
+    def x_plans(self) -> dict[str, ExtractionPlan]:
+        """execution plans for all outputs of this specific file type"""
+        return self._x_plans.get(self.document_logic_id, self._x_plans["*"])
+
     def non_interactive_x_funcs(self) -> dict[str, Extractor]:
         """return all non-interactive extractors"""
         return {k: v for k, v in self.x_funcs.items() if (not v._interactive)}
 
     def x_config_params(self, extract_name: str):
-        # TODO: can we cache this somehow? Or re-calculate it when calling "config"?
-        # get our required config parameters specifically for the function specified by "extract_name"
-        config = self._x_config.get(self.document_logic_id).get(extract_name, {})
+        """get the config parameters of the document for the extractor of "extract_name\""""
+        return self._config_params(self.x_plans[extract_name])
+
+    def _config_params(self, plan: ExtractionPlan) -> dict[str, Any]:
+        if not plan.config_keys:
+            return {}
         config_params = {}
-        for config_key in config:
+        for config_key in plan.config_keys:
             if v := self._config.get(config_key):
                 config_params[config_key] = v
+            elif config_key == REQUESTED_OUTPUTS and self._extraction_log:
+                config_params[config_key] = self._extraction_log.requested_for(plan.extractor)
         return config_params
 
+    def upstream_outputs(self, names: typing.Iterable[str]) -> set[str]:
+        """all outputs which are needed in order to calculate *names* (including *names*)"""
+        needed, todo = set(), list(names)
+        while todo:
+            name = todo.pop()
+            if name in needed:
+                continue
+            needed.add(name)
+            todo.extend(source for _, source, is_output in self.x_plans[name].inputs if is_output)
+        return needed
+
+    @cached_property
+    def document_hash(self) -> str | None:
+        """content hash of the raw document which is used as a key for the disk cache"""
+        return cache_utils.hash_document(self._fobj)
+
+    def _disk_cache_keys(self, extractor: Extractor, config_params: dict) -> dict[str, str] | None:
+        """disk cache keys of all outputs of an extractor call"""
+        if (self._disk_cache is None) or (not extractor._disk_cache) or (self.document_hash is None):
+            return None
+        # parameters which are given to the document and influence the extraction result
+        params = dict(
+            config_params,
+            _document_logic_id=self.document_logic_id,
+            _page_numbers=self._page_numbers,
+            _max_pages=self._max_pages
+        )
+        return self._disk_cache.keys(self.document_hash, extractor, extractor._out_mapping.values(), params)
+
     # @functools.lru_cache
     def x(self, extract_name: str, *args, **kwargs):
         """
         call an extractor from our definition
         TODO: using *args and **kwargs the extractors parameters can be overriden
         """
-        extractor_func: Extractor = self.x_funcs[extract_name]
-
+        plan = self.x_plans[extract_name]
+        tracer = self._tracer or tracing.active_tracer()
+        if tracer is None:
+            if plan.extractor._cache and not (args or kwargs or self._extraction_log):
+                # fast path for results which are already in the memory cache
+                res = self._x_func_cache.get(plan.cache_key, None)
+                if (res is not None) and (extract_name in res):
+                    self._cache_hits += 1
+                    if self._memory_budget is not None:
+                        self._touch(plan.cache_key)
+                    return res[extract_name]
+            return self._x(plan, *args, **kwargs)
+        with tracer.span(self, extract_name, plan.extractor) as trace:
+            return self._x(plan, *args, trace=trace, **kwargs)
+
+    def _x(self, plan: ExtractionPlan, *args, trace: "tracing.TraceEvent" = None, **kwargs):
+        extract_name, extractor_func = plan.name, plan.extractor
+        executor = self._process_pool if extractor_func._process else None
         try:
             # check if we executed this function at some point...
             if extractor_func._cache:
-                key = functools._make_key((extractor_func,) + args, kwargs, typed=False)
+                key = result_key(extractor_func, args, kwargs) if (args or kwargs) else plan.cache_key
                 # we need to check for "is not None" as we also have pandas dataframes in this
                 # which cannot be checked for by simply using "if"
-                if (res := self._x_func_cache.get(key, None)) is not None:
+                res = self._x_func_cache.get(key, None)
+                if (res is not None) and (extract_name in res):
                     self._cache_hits += 1
+                    if self._memory_budget is not None:
+                        self._touch(key)
+                    if trace:
+                        trace.cache = "memory"
+                    if self._extraction_log:
+                        self._extraction_log.reused.add(extract_name)
                 else:
-                    params = self.x_config_params(extract_name)
-                    res = extractor_func._mapped_call(self, *args, config_params=params, **kwargs)
+                    params = self._config_params(plan)
+                    # we only use the disk cache for calls without direct function call overrides
+                    use_disk = not (args or kwargs)
+                    # the keys get calculated once and are used for reading & writing the results
+                    disk_keys = self._disk_cache_keys(extractor_func, params) if use_disk else None
+                    if disk_keys and (value := self._disk_cache.get(
+                            disk_keys[extract_name], _NOT_FOUND)) is not _NOT_FOUND:
+                        self._cache_hits += 1
+                        if trace:
+                            trace.cache = "disk"
+                        if self._extraction_log:
+                            self._extraction_log.reused.add(extract_name)
+                        res = {**(res or {}), extract_name: value}
+                    else:
+                        if trace:
+                            trace.cache = "miss"
+                        res = extractor_func._mapped_call(
+                            self, *args, config_params=params, executor=executor,
+                            trace=trace, inputs=plan.inputs, **kwargs)
+                        if self._extraction_log:
+                            self._extraction_log.computed.update(res)
+                        if disk_keys:
+                            for out_name, value in res.items():
+                                self._disk_cache.set(disk_keys[out_name], value)
                     self._x_func_cache[key] = res
+                    if self._memory_budget is not None:
+                        self._enforce_memory_budget(key, res)
             else:
-                params = self.x_config_params(extract_name)
-                res = extractor_func._mapped_call(self, config_params=params, *args, **kwargs)
+                res = extractor_func._mapped_call(
+                    self, *args, config_params=self._config_params(plan), executor=executor,
+                    trace=trace, inputs=plan.inputs, **kwargs)
+                if self._extraction_log:
+                    self._extraction_log.computed.update(res)
 
         except:
             logger.exception(f"problem with extractor '{extract_name}'")
@@ -575,6 +914,195 @@ class Pipeline(metaclass=MetaDocumentClassConfiguration):
 
         return res[extract_name]
 
+    def _touch(self, key: tuple[Extractor, tuple]):
+        """mark cached results as recently used, so that they get evicted last"""
+        if key in self._x_cache_sizes:
+            self._x_cache_sizes[key] = self._x_cache_sizes.pop(key)
+
+    def _enforce_memory_budget(self, new_key: tuple[Extractor, tuple], res: dict[str, Any]):
+        """evict the least recently used results until we are below the memory budget again"""
+        self._x_cache_sizes.pop(new_key, None)
+        self._x_cache_sizes[new_key] = cache_utils.estimate_size(res)
+        total = sum(self._x_cache_sizes.values())
+        for key in list(self._x_cache_sizes):
+            if total <= self._memory_budget:
+                break
+            if key == new_key:
+                continue
+            total -= self._x_cache_sizes[key]
+            self._release_key(key)
+
+    def _release_key(self, key: tuple[Extractor, tuple]) -> list[str]:
+        self._x_cache_sizes.pop(key, None)
+        released = list(self._x_func_cache.pop(key, None) or ())
+        if self._extraction_log:
+            self._extraction_log.released.update(released)
+        return released
+
+    def release(self, keep: typing.Iterable[str] = ()) -> list[str]:
+        """
+        free the cached results of all extractors except the ones which
+        calculate the outputs in *keep*. Released results get recalculated
+        if they are needed again.
+
+        returns the names of the released outputs
+        """
+        keep = {self.x_funcs[name] for name in keep}
+        released = []
+        for key in list(self._x_func_cache):
+            extractor, _ = key
+            if extractor not in keep:
+                released.extend(self._release_key(key))
+        return released
+
+    @staticmethod
+    def _cached_graph(graph: dict[Extractor, set[Extractor]]) -> dict[Extractor, set[Extractor]]:
+        """
+        maps every extractor of an extraction graph to the cached extractors it depends on.
+
+        Uncached extractors get recalculated by each of their consumers, so we look
+        through them to their own cached inputs.
+        """
+        inputs: dict[Extractor, set[Extractor]] = {}
+
+        def cached_inputs(ex: Extractor) -> set[Extractor]:
+            if ex not in inputs:
+                inputs[ex] = set().union(*({dep} if dep._cache else cached_inputs(dep) for dep in graph[ex]))
+            return inputs[ex]
+
+        for ex in graph:
+            cached_inputs(ex)
+        return inputs
+
+    def _release_tracker(
+            self, graph: dict[Extractor, set[Extractor]], names: typing.Iterable[str]
+    ) -> typing.Callable[[Extractor], list[str]]:
+        """
+        reference counting of intermediate results in an extraction graph.
+
+        returns a function which should be called once an extractor of the graph is finished.
+        It releases the cached results of the extractors which aren't needed
+        anymore by any other extractor of the graph and returns the released output names.
+        The results of the extractors for *names* are kept.
+        """
+        cached_inputs = self._cached_graph(graph)
+        keep = set()
+        for name in names:
+            ex = self.x_funcs[name]
+            keep |= {ex} if ex._cache else cached_inputs[ex]
+        consumers = collections.Counter(dep for ex in graph if ex._cache for dep in cached_inputs[ex])
+
+        def done(ex: Extractor) -> list[str]:
+            released = []
+            if not ex._cache:
+                return released
+            for dep in cached_inputs[ex]:
+                consumers[dep] -= 1
+                if consumers[dep] == 0 and dep not in keep:
+                    released.extend(self._release_key(result_key(dep)))
+            return released
+
+        return done
+
+    def _extractor_graph(self, names: typing.Iterable[str]) -> dict[Extractor, set[Extractor]]:
+        """
+        get the upstream closure of all extractors which are needed to calculate
+        the outputs given by *names*. Outputs which are already in the memory cache
+        don't need their inputs, so we don't go further upstream from there.
+
+        returns a dict which maps each required extractor to the set of extractors it
+        directly depends on.
+        """
+        graph: dict[Extractor, set[Extractor]] = {}
+        todo, seen = list(names), set()
+        while todo:
+            name = todo.pop()
+            if name in seen:
+                continue
+            seen.add(name)
+            plan = self.x_plans[name]
+            deps = graph.setdefault(plan.extractor, set())
+            res = self._x_func_cache.get(plan.cache_key, None) if plan.extractor._cache else None
+            if (res is not None) and (name in res):
+                continue
+            for _, source, is_output in plan.inputs:
+                if is_output:
+                    deps.add(self.x_plans[source].extractor)
+                    todo.append(source)
+        return graph
+
+    def _extractor_names(self) -> dict[Extractor, str]:
+        """get a (representative) output name for each extractor of this document"""
+        names = {}
+        for name, ex in self.x_funcs.items():
+            names.setdefault(ex, name)
+        return names
+
+    def x_parallel(
+            self,
+            names: typing.Iterable[str] = None,
+            workers: int = 4,
+            process_workers: int = 0,
+            release: bool = False
+    ) -> dict[str, float]:
+        """
+        Run the extractors needed for *names* (defaults to all non-interactive extractors)
+        and execute independent branches of the extraction graph concurrently.
+
+        The required extractors get sorted topologically according to their
+        inputs & outputs. Every extractor whose dependencies are finished gets
+        submitted to a thread pool. Extractors which were marked with
+        "in_process_pool()" get executed in a process pool if *process_workers* > 0.
+        Uncached extractors don't get scheduled, as their results would be thrown
+        away. They get calculated by the extractors which need them.
+
+        release: free intermediate results which are not part of *names* as soon
+            as all extractors which need them are finished.
+
+        returns the time in seconds which was spent in each cached extractor
+        (indexed by one of its output names).
+        """
+        names = list(self.non_interactive_x_funcs() if names is None else names)
+        graph = self._extractor_graph(names)
+        ex_names = self._extractor_names()
+        cached_graph = {ex: deps for ex, deps in self._cached_graph(graph).items() if ex._cache}
+        sorter = graphlib.TopologicalSorter(cached_graph)
+        sorter.prepare()
+        release_done = self._release_tracker(graph, names) if release else None
+        # worker threads have their own tracing stack, so we hand them the call chain of this thread
+        tracer = self._tracer or tracing.active_tracer()
+        parents = tracer.current_parents() if tracer else ()
+
+        def run_node(ex: Extractor) -> float:
+            start = time()
+            with tracer.parents(parents) if tracer else contextlib.nullcontext():
+                self.x(ex_names[ex])
+            return time() - start
+
+        timings = {}
+        process_pool = concurrent.futures.ProcessPoolExecutor(process_workers) if process_workers else None
+        self._process_pool = process_pool
+        try:
+            with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+                running: dict[concurrent.futures.Future, Extractor] = {}
+                while sorter.is_active():
+                    for ex in sorter.get_ready():
+                        running[pool.submit(run_node, ex)] = ex
+                    done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        ex = running.pop(future)
+                        timings[ex_names[ex]] = future.result()
+                        sorter.done(ex)
+                        if release_done:
+                            release_done(ex)
+        finally:
+            self._process_pool = None
+            if process_pool:
+                process_pool.shutdown()
+
+        logger.debug(f"extractor timings: {timings}")
+        return timings
+
     def __getattr__(self, extract_name):
         """
         __getattr__ only gets called for non-existing variable names.
@@ -587,14 +1115,117 @@ class Pipeline(metaclass=MetaDocumentClassConfiguration):
         """
         return self.x(extract_name)
 
-    def x_all(self):
+    @classmethod
+    def map(
+            cls,
+            sources: typing.Iterable,
+            extract: list[str],
+            workers: int = None,
+            timeout: float = None,
+            **document_kwargs
+    ) -> typing.Iterator["document_batch.BatchResult"]:
+        """
+        Process many documents in parallel using a pool of worker processes.
+
+        Results are streamed back in the order in which they are finished. Errors and
+        timeouts of single documents are reported in the results and don't stop the
+        processing of the other documents::
+
+            for res in Document.map([Path("a.pdf"), Path("b.pdf")], extract=["tables_df"], workers=4):
+                if res.ok:
+                    res.outputs["tables_df"]
+
+        sources: objects that can be used as *fobj* for this class (use pathlib.Path for files)
+        extract: list of outputs which should be extracted from each document
+        workers: number of worker processes (defaults to the number of cpu cores)
+        timeout: maximum processing time for a single document in seconds
+        document_kwargs: additional arguments for the creation of each document
+        """
+        return iter(document_batch.DocumentBatch(
+            sources, extract=extract, workers=workers, timeout=timeout,
+            document_class=cls, document_kwargs=document_kwargs
+        ))
+
+    def extract(self, names: typing.Iterable[str], workers: int = None, release: bool = False) -> ExtractionResult:
+        """
+        Calculate only the given outputs and the extractors they depend on (their upstream
+        closure in the extraction graph), instead of all extractors like x_all does::
+
+            res = doc.extract(["tables_df", "full_text"])
+            res.outputs["tables_df"]
+            res.computed  # e.g. ["raw_content", "elements", ..., "tables_df", "full_text"]
+            res.reused  # outputs which were already cached
+
+        The result always has an output for each of *names* which makes it suitable as a
+        fixed output schema for batch processing (see Pipeline.map). Unknown output names
+        raise a KeyError before anything gets calculated.
+
+        workers: if given, independent extractors of the closure get executed in parallel
+            (see Pipeline.x_parallel)
+        release: free the cached intermediate results as soon as all extractors which
+            need them are finished. This keeps the peak memory low if we only need a few
+            outputs of a large document (e.g. "tables_df" of a large pdf).
+
+        Extractors which are configured with REQUESTED_OUTPUTS get the upstream closure of
+        *names* and can skip work which isn't needed for it (e.g. spacy pipeline components).
+        Their own outputs are only part of it if they are among *names*.
+        Their results are only kept until the end of the extraction.
+        """
+        names = list(names)
+        if unknown := [n for n in names if n not in self.x_funcs]:
+            raise KeyError(f"unknown outputs for document type {self.document_logic_id}: {unknown}")
+        log = self._extraction_log = _ExtractionLog(
+            names=tuple(names), requested=tuple(sorted(self.upstream_outputs(names))))
+        try:
+            if workers:
+                self.x_parallel(names, workers=workers, release=release)
+            elif release:
+                # run the cached extractors one by one in topological order, so that we
+                # know when their inputs aren't needed anymore
+                graph = self._extractor_graph(names)
+                release_done = self._release_tracker(graph, names)
+                ex_names = self._extractor_names()
+                for ex in graphlib.TopologicalSorter(graph).static_order():
+                    if ex._cache:
+                        self.x(ex_names[ex])
+                        release_done(ex)
+            outputs = {name: self.x(name) for name in names}
+            # results which were calculated for this request only would be
+            # incomplete for other outputs, so we don't keep them
+            if REQUESTED_OUTPUTS not in self._config:
+                for name in log.computed:
+                    plan = self.x_plans[name]
+                    if plan.extractor._cache and REQUESTED_OUTPUTS in plan.config_keys:
+                        self._release_key(plan.cache_key)
+        finally:
+            self._extraction_log = None
+        return ExtractionResult(
+            outputs=outputs,
+            computed=sorted(log.computed),
+            reused=sorted(log.reused - log.computed),
+            released=sorted(log.released)
+        )
+
+    def x_all(self, workers: int = None):
+        """
+        get all outputs of this document. If *workers* is given, independent
+        extractors get executed in parallel.
+        """
+        if workers:
+            self.x_parallel(self.x_funcs, workers=workers)
         return {property: self.x(property) for property in self.x_funcs}
 
     def x_all_cached(self):
         return {self.x(property) for property in self.x_funcs}
 
-    def run_all_extractors(self):
-        """can be used for testing or pre-caching purposes"""
+    def run_all_extractors(self, workers: int = None):
+        """can be used for testing or pre-caching purposes. In order to only
+        calculate specific outputs, use Pipeline.extract.
+
+        workers: if given, run independent extractors in parallel using Pipeline.x_parallel
+        """
+        if workers:
+            return self.x_parallel(workers=workers)
         # print(pdfdoc.elements)
         for x in self.non_interactive_x_funcs():
             self.x(x)
@@ -665,6 +1296,7 @@ class Pipeline(metaclass=MetaDocumentClassConfiguration):
         image_path:  file path for a generated image
         """
         # TODO: change into a static method
+        import networkx as nx
         graph = nx.DiGraph()
         if document_logic_id == "current":
             logic = self.x_funcs
@@ -672,7 +1304,7 @@ class Pipeline(metaclass=MetaDocumentClassConfiguration):
             logic = self._x_funcs[document_logic_id]
 
         for name, f in logic.items():
-            f_class = f.__class__.__name__ + "\n".join(f._out_mapping.keys())
+            f_class = f.class_name + "\n".join(f._out_mapping.keys())
             graph.add_node(f_class, shape="none")
             # out-edges
             for k, v in f._out_mapping.items():
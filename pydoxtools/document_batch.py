@@ -0,0 +1,212 @@
+"""
+Process many documents in parallel using a pool of worker processes.
+
+Most of the extraction pipeline (e.g. pdf parsing, table detection) is
+CPU-bound python code, so in order to make use of all cores we fan
+documents out to worker processes and stream the results back as soon
+as they are finished:
+
+    from pydoxtools import Document
+
+    for res in Document.map(paths, extract=["full_text", "tables_df"], workers=8):
+        if res.ok:
+            print(res.source, res.outputs["tables_df"])
+        else:
+            print(res.source, res.error)
+
+Failures and timeouts of individual documents get reported in
+the results and don't stop the batch.
+"""
+
+import concurrent.futures
+import contextlib
+import logging
+import os
+import signal
+import threading
+import time
+import traceback
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Iterator
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentTimeoutError(Exception):
+    pass
+
+
+@dataclass
+class BatchResult:
+    index: int  # position of the document in the input sequence
+    source: Any  # the object that was used to create the document
+    outputs: dict[str, Any] = field(default_factory=dict)
+    error: str | None = None
+    elapsed: float = 0.0  # processing time in seconds
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@contextlib.contextmanager
+def _time_limit(seconds: float | None):
+    """
+    raise a DocumentTimeoutError if the code inside the context takes longer than *seconds*.
+
+    This uses SIGALRM and therefore only works on unix systems in the main thread
+    of a process (which is the case for the workers of a process pool).
+    Otherwise, no time limit is enforced.
+    """
+    if (not seconds) or (not hasattr(signal, "SIGALRM")) \
+            or (threading.current_thread() is not threading.main_thread()):
+        yield
+        return
+
+    def _raise_timeout(signum, frame):
+        raise DocumentTimeoutError(f"document processing took longer than {seconds}s")
+
+    previous = signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+def _process_document(
+        document_class, index: int, source, extract: list[str],
+        document_kwargs: dict, timeout: float | None
+) -> BatchResult:
+    """runs inside the worker processes"""
+    start = time.monotonic()
+    try:
+        with _time_limit(timeout):
+            doc = document_class(fobj=source, **document_kwargs)
+            outputs = doc.extract(extract).outputs
+    except Exception as e:
+        logger.debug(f"could not process document {source}", exc_info=True)
+        return BatchResult(
+            index=index, source=source,
+            error=f"{e.__class__.__name__}: {e}\n{traceback.format_exc()}",
+            elapsed=time.monotonic() - start
+        )
+    return BatchResult(index=index, source=source, outputs=outputs, elapsed=time.monotonic() - start)
+
+
+class DocumentBatch:
+    """
+    Process an iterable of documents with a process pool and
+    stream back BatchResults in the order in which they get finished.
+
+    sources: an iterable of objects which can be used as "fobj" for a Document
+        (e.g. pathlib.Path, bytes or file contents as strings)
+    extract: list of outputs which should be extracted from every document
+    workers: number of worker processes. Defaults to the number of cpu cores.
+        With workers=0 documents are processed in the current process.
+    timeout: maximum time in seconds a single document is allowed to take
+    document_class: the pipeline class which should be used, defaults to pydoxtools.Document
+    document_kwargs: additional arguments for the document class such as "config" or "document_type"
+    max_retries: how often a document gets re-submitted if a worker process crashed
+        while it was processing the document on its own. Documents which were processed
+        at the same time as a crash get re-run one at a time in order to find out which
+        one was responsible.
+    """
+
+    def __init__(
+            self,
+            sources: Iterable,
+            extract: list[str],
+            workers: int = None,
+            timeout: float = None,
+            document_class=None,
+            document_kwargs: dict = None,
+            max_retries: int = 1
+    ):
+        if document_class is None:
+            from pydoxtools.document import Document
+            document_class = Document
+        self._sources = sources
+        self._extract = list(extract)
+        self._workers = os.cpu_count() if workers is None else workers
+        self._timeout = timeout
+        self._document_class = document_class
+        self._document_kwargs = document_kwargs or {}
+        self._max_retries = max_retries
+
+    def __iter__(self) -> Iterator[BatchResult]:
+        if self._workers < 1:
+            yield from self._run_serial()
+        else:
+            yield from self._run_parallel()
+
+    def _run_serial(self) -> Iterator[BatchResult]:
+        for index, source in enumerate(self._sources):
+            yield _process_document(
+                self._document_class, index, source, self._extract,
+                self._document_kwargs, self._timeout)
+
+    def _run_parallel(self) -> Iterator[BatchResult]:
+        todo = iter(enumerate(self._sources))
+        # documents which were in flight when a worker process crashed. We can not know
+        # which one was responsible, so they get re-run one at a time and a crash only
+        # counts against a document if it was the only one in the pool.
+        isolate: list[tuple[int, Any]] = []
+        crashes: dict[int, int] = {}
+        # we only keep a limited number of documents "in-flight" in order to
+        # keep memory bounded for very large batches
+        max_in_flight = 2 * self._workers
+        exhausted = False
+
+        while True:
+            in_flight: dict[concurrent.futures.Future, tuple[int, Any, bool]] = {}
+            broken = False
+            with concurrent.futures.ProcessPoolExecutor(max_workers=self._workers) as pool:
+                while True:
+                    limit = 1 if isolate else max_in_flight
+                    while (not broken) and len(in_flight) < limit:
+                        if isolate:
+                            (index, source), alone = isolate.pop(), True
+                        else:
+                            try:
+                                (index, source), alone = next(todo), False
+                            except StopIteration:
+                                exhausted = True
+                                break
+                        future = pool.submit(
+                            _process_document, self._document_class, index, source,
+                            self._extract, self._document_kwargs, self._timeout)
+                        in_flight[future] = (index, source, alone)
+
+                    if not in_flight:
+                        break
+                    done, _ = concurrent.futures.wait(
+                        in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        index, source, alone = in_flight.pop(future)
+                        try:
+                            yield future.result()
+                        except BrokenProcessPool:
+                            # a worker died (e.g. segfault or killed because of memory)
+                            broken = True
+                            if alone:
+                                crashes[index] = crashes.get(index, 0) + 1
+                            if crashes.get(index, 0) > self._max_retries:
+                                yield BatchResult(
+                                    index=index, source=source,
+                                    error="worker process crashed while processing the document")
+                            else:
+                                isolate.append((index, source))
+                        except Exception as e:
+                            # e.g. outputs that can not be sent back from the worker process
+                            yield BatchResult(index=index, source=source,
+                                              error=f"{e.__class__.__name__}: {e}")
+                    if broken and not in_flight:
+                        break
+
+            if not broken and (exhausted and not isolate):
+                break
+            if broken:
+                logger.warning("worker process pool broke, restarting pool...")
@@ -0,0 +1,515 @@
+"""
+Compact, columnar storage for document elements.
+
+Instead of keeping a pandas DataFrame with live pdfminer objects
+(LTTextLine, LTChar, LTCurve...), a python set of fonts per line and
+a lot of mostly empty columns, the ElementStore keeps:
+
+- coordinates as float64 arrays (the same values as pdfminer)
+- fonts & colors interned into integer ids
+- the text of all elements in a single string buffer with offsets
+- character boxes & sizes and the points of graphic elements in separate
+  arrays which are only converted into DataFrames/objects on demand
+
+Elements are sorted by (type, page) which makes it possible to create
+filtered views by element type and page without copying any data:
+
+    store = ElementStoreBuilder().add_records(records).build()
+    lines_on_page_1 = store.view(element_type=ElementType.Line, page=1)
+    df = lines_on_page_1.to_frame()
+
+"to_frame" creates a DataFrame which is compatible with the records created
+in pdf_utils and document_base.DocumentElement. Instead of pdfminer objects
+the "lineobj" column holds lightweight StoredLine objects which can be iterated
+in the same way in order to get the individual characters and the "gobj" column
+holds StoredGraphic objects with the attributes of pdfminer LTCurve objects.
+"""
+
+import typing
+
+import numpy as np
+import pandas as pd
+from pdfminer.layout import LTChar, LTText, LTTextLineVertical
+
+from pydoxtools.document_base import ElementType
+
+# element columns and their datatypes. -1 is used for "not available"
+# for integer columns.
+_COLUMNS = dict(
+    element_id=np.int64,  # position of the element in the original document
+    type=np.int8,
+    p_num=np.int32,
+    boxnum=np.int32,
+    linenum=np.int32,
+    x0=np.float64,
+    y0=np.float64,
+    x1=np.float64,
+    y1=np.float64,
+    linewidth=np.float64,
+    stroke=np.int8,
+    fill=np.int8,
+    evenodd=np.int8,
+    stroking_color=np.int32,
+    non_stroking_color=np.int32,
+    fontset=np.int32,
+    vertical=np.bool_,
+    char_begin=np.int64,
+    char_end=np.int64,
+    pts_begin=np.int64,
+    pts_end=np.int64,
+)
+
+# lookup table from type codes to ElementType
+_ELEMENT_TYPES = np.empty(max(e.value for e in ElementType) + 1, dtype=object)
+for _e in ElementType:
+    _ELEMENT_TYPES[_e.value] = _e
+
+
+def _lookup(values: list, ids: np.ndarray | int) -> np.ndarray:
+    """map interned ids to their values, -1 gets mapped to None"""
+    if np.ndim(ids) == 0:
+        return None if ids < 0 else values[ids]
+    table = np.empty(len(values) + 1, dtype=object)
+    for i, v in enumerate(values):
+        table[i] = v
+    table[-1] = None
+    return table[ids]
+
+
+class _Interner:
+    def __init__(self):
+        self.values = []
+        self._ids = {}
+
+    def __call__(self, value) -> int:
+        if value is None:
+            return -1
+        # some values such as pdfminer colors can be lists which are not hashable
+        try:
+            key = (value, hash(value))
+        except TypeError:
+            key = repr(value)
+        if (i := self._ids.get(key)) is None:
+            i = self._ids[key] = len(self.values)
+            self.values.append(value)
+        return i
+
+
+class StoredChar:
+    """a single character of a StoredLine. Behaves similar to pdfminer LTChar/LTAnno"""
+    __slots__ = ("text", "size", "bbox", "is_char")
+
+    def __init__(self, text: str, size: float, bbox: tuple, is_char: bool):
+        self.text = text
+        self.size = size
+        self.bbox = bbox
+        self.is_char = is_char  # False for pdfminer "LTAnno" objects such as generated spaces
+
+    def get_text(self) -> str:
+        return self.text
+
+    def __repr__(self):
+        return f"<StoredChar {self.text!r}>"
+
+
+class StoredLine:
+    """
+    lightweight replacement for pdfminer text lines which refers to a line in an ElementStore.
+    Iterating over it yields StoredChar objects.
+    """
+    __slots__ = ("_store", "_row")
+
+    def __init__(self, store: "ElementStore", row: int):
+        self._store = store
+        self._row = row
+
+    @property
+    def vertical(self) -> bool:
+        return bool(self._store["vertical"][self._row])
+
+    def get_text(self) -> str:
+        return self._store.text(self._row)
+
+    def __iter__(self) -> typing.Iterator[StoredChar]:
+        s = self._store
+        for ci in range(s["char_begin"][self._row], s["char_end"][self._row]):
+            yield StoredChar(
+                s._text[s._char_text_offsets[ci]:s._char_text_offsets[ci + 1]],
+                float(s._char_size[ci]),
+                tuple(float(v) for v in s._char_bbox[ci]),
+                bool(s._char_is_char[ci])
+            )
+
+    def __repr__(self):
+        return f"<StoredLine {self.get_text()!r}>"
+
+
+class StoredGraphic:
+    """
+    lightweight replacement for pdfminer graphic objects (LTCurve, LTRect, LTLine)
+    which refers to a graphic element in an ElementStore.
+    """
+    __slots__ = ("_store", "_row")
+
+    def __init__(self, store: "ElementStore", row: int):
+        self._store = store
+        self._row = row
+
+    def _value(self, column: str):
+        return self._store[column][self._row]
+
+    @property
+    def bbox(self) -> tuple[float, float, float, float]:
+        return tuple(float(self._value(k)) for k in ("x0", "y0", "x1", "y1"))
+
+    @property
+    def x0(self) -> float:
+        return float(self._value("x0"))
+
+    @property
+    def y0(self) -> float:
+        return float(self._value("y0"))
+
+    @property
+    def x1(self) -> float:
+        return float(self._value("x1"))
+
+    @property
+    def y1(self) -> float:
+        return float(self._value("y1"))
+
+    @property
+    def linewidth(self) -> float:
+        return float(self._value("linewidth"))
+
+    @property
+    def stroke(self) -> bool:
+        return bool(self._value("stroke"))
+
+    @property
+    def fill(self) -> bool:
+        return bool(self._value("fill"))
+
+    @property
+    def evenodd(self) -> bool:
+        return bool(self._value("evenodd"))
+
+    @property
+    def stroking_color(self):
+        return _lookup(self._store._colors, self._value("stroking_color"))
+
+    @property
+    def non_stroking_color(self):
+        return _lookup(self._store._colors, self._value("non_stroking_color"))
+
+    @property
+    def pts(self) -> list[tuple[float, float]]:
+        """the points of the path in the same way as LTCurve.pts"""
+        points = self._store._points[self._value("pts_begin"):self._value("pts_end")]
+        return [tuple(p) for p in points.tolist()]
+
+    def __repr__(self):
+        return f"<StoredGraphic {self.bbox}>"
+
+
+class ElementStore:
+    """
+    Columnar, array-backed storage of document elements. Use ElementStoreBuilder
+    to create a new store.
+    """
+
+    def __init__(
+            self,
+            columns: dict[str, np.ndarray],
+            text: str,
+            char_text_offsets: np.ndarray,
+            char_size: np.ndarray,
+            char_bbox: np.ndarray,
+            char_is_char: np.ndarray,
+            points: np.ndarray,
+            colors: list,
+            fontsets: list[frozenset],
+            is_sorted: bool = False
+    ):
+        if not is_sorted:
+            # lexsort is stable, so elements keep their document order within (type, page)
+            order = np.lexsort((columns["p_num"], columns["type"]))
+            columns = {k: v[order] for k, v in columns.items()}
+        self._cols = columns
+        self._text = text
+        self._char_text_offsets = char_text_offsets
+        self._char_size = char_size
+        self._char_bbox = char_bbox
+        self._char_is_char = char_is_char
+        self._points = points
+        self._colors = colors
+        self._fontsets = fontsets
+
+    def _take(self, idx: slice | np.ndarray) -> "ElementStore":
+        """create a new store from a subset of the elements. slices don't copy any data"""
+        return ElementStore(
+            {k: v[idx] for k, v in self._cols.items()},
+            self._text, self._char_text_offsets, self._char_size,
+            self._char_bbox, self._char_is_char, self._points, self._colors, self._fontsets,
+            is_sorted=True
+        )
+
+    def __len__(self):
+        return len(self._cols["element_id"])
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self._cols[column]
+
+    @property
+    def empty(self) -> bool:
+        return len(self) == 0
+
+    @property
+    def pages(self) -> np.ndarray:
+        return np.unique(self._cols["p_num"])
+
+    @property
+    def nbytes(self) -> int:
+        """approximate memory usage of the store (including shared buffers)"""
+        return (sum(v.nbytes for v in self._cols.values()) + len(self._text)
+                + self._char_text_offsets.nbytes + self._char_size.nbytes
+                + self._char_bbox.nbytes + self._char_is_char.nbytes + self._points.nbytes)
+
+    def view(self, element_type: ElementType = None, page: int = None) -> "ElementStore":
+        """
+        get the elements of a specific type and/or page. If the elements are
+        contiguous in the store (which is always the case if element_type is given)
+        the returned store doesn't copy any data.
+        """
+        if element_type is None and page is None:
+            return self
+        types = self._cols["type"]
+        pages = self._cols["p_num"]
+        if element_type is None:
+            codes = np.unique(types)
+        else:
+            codes = [element_type.value]
+        ranges = []
+        for code in codes:
+            lo, hi = np.searchsorted(types, [code, code + 1])
+            if page is not None:
+                plo, phi = np.searchsorted(pages[lo:hi], [page, page + 1])
+                lo, hi = lo + plo, lo + phi
+            if hi > lo:
+                ranges.append((lo, hi))
+
+        if len(ranges) == 0:
+            return self._take(slice(0, 0))
+        elif len(ranges) == 1:
+            return self._take(slice(*ranges[0]))
+        return self._take(np.concatenate([np.arange(lo, hi) for lo, hi in ranges]))
+
+    def text(self, row: int) -> str:
+        """text of the element in *row*"""
+        c = self._cols
+        return self._text[self._char_text_offsets[c["char_begin"][row]]:
+                          self._char_text_offsets[c["char_end"][row]]]
+
+    def texts(self) -> list[str]:
+        starts = self._char_text_offsets[self._cols["char_begin"]]
+        ends = self._char_text_offsets[self._cols["char_end"]]
+        return [self._text[s:e] for s, e in zip(starts, ends)]
+
+    def chars(self) -> pd.DataFrame:
+        """create a DataFrame with the individual characters of all text lines in the store"""
+        c = self._cols
+        rows = np.repeat(np.arange(len(self)), c["char_end"] - c["char_begin"])
+        ci = np.concatenate([np.arange(b, e) for b, e in zip(c["char_begin"], c["char_end"])]
+                            or [np.array([], dtype=np.int64)])
+        bbox = self._char_bbox[ci]
+        return pd.DataFrame(dict(
+            element_id=c["element_id"][rows],
+            text=[self._text[s:e] for s, e in zip(self._char_text_offsets[ci], self._char_text_offsets[ci + 1])],
+            size=self._char_size[ci],
+            x0=bbox[:, 0], y0=bbox[:, 1], x1=bbox[:, 2], y1=bbox[:, 3],
+            is_char=self._char_is_char[ci]
+        ))
+
+    def to_frame(self) -> pd.DataFrame:
+        """
+        convert the store into a DataFrame in document order with the same
+        schema as the element records from pdf_utils. The index corresponds to the
+        position of the elements in the original document.
+
+        The DataFrame gets built from scratch on every call and takes a lot more memory
+        than the store itself. Keep the result around if it's needed more than once.
+        """
+        ordered = self._take(np.argsort(self._cols["element_id"], kind="stable"))
+        c = ordered._cols
+        is_line = c["type"] == ElementType.Line.value
+        is_graphic = c["type"] == ElementType.Graphic.value
+        frame: dict[str, typing.Any] = dict(type=_ELEMENT_TYPES[c["type"]])
+
+        if is_graphic.any():
+            def graphic_only(values):
+                return np.where(is_graphic, values, None) if not is_graphic.all() else values
+
+            gobj = np.empty(len(self), dtype=object)
+            gobj[is_graphic] = [StoredGraphic(ordered, i) for i in np.flatnonzero(is_graphic)]
+            frame.update(
+                gobj=gobj,
+                linewidth=np.where(is_graphic, c["linewidth"], np.nan),
+                non_stroking_color=_lookup(self._colors, c["non_stroking_color"]),
+                stroking_color=_lookup(self._colors, c["stroking_color"]),
+                stroke=graphic_only(c["stroke"].astype(bool)),
+                fill=graphic_only(c["fill"].astype(bool)),
+                evenodd=graphic_only(c["evenodd"].astype(bool)),
+            )
+
+        frame.update(
+            p_num=c["p_num"],
+            boxnum=c["boxnum"],
+            x0=c["x0"],
+            y0=c["y0"],
+            x1=c["x1"],
+            y1=c["y1"],
+        )
+
+        if is_line.any():
+            lineobj = np.empty(len(self), dtype=object)
+            lineobj[is_line] = [StoredLine(ordered, i) for i in np.flatnonzero(is_line)]
+            rawtext = np.array(ordered.texts(), dtype=object)
+            rawtext[~is_line] = None
+            frame.update(
+                lineobj=lineobj,
+                rawtext=rawtext,
+                font_infos=_lookup(self._fontsets, c["fontset"]),
+                linenum=c["linenum"] if is_line.all() else np.where(is_line, c["linenum"], np.nan),
+            )
+
+        return pd.DataFrame(frame, index=pd.Index(c["element_id"]))
+
+    @classmethod
+    def concat(cls, stores: list["ElementStore"]) -> "ElementStore":
+        """
+        concatenate several stores (e.g. from several page ranges) into one.
+        element ids get shifted so that the document order is kept.
+        """
+        builder = ElementStoreBuilder()
+        for s in stores:
+            builder.add_store(s)
+        return builder.build()
+
+
+class ElementStoreBuilder:
+    """incrementally build an ElementStore from element records (see pdf_utils.page_elements)"""
+
+    def __init__(self):
+        self._cols = {k: [] for k in _COLUMNS}
+        self._char_text: list[str] = []
+        self._char_size: list[float] = []
+        self._char_bbox: list[tuple] = []
+        self._char_is_char: list[bool] = []
+        self._points: list[tuple] = []
+        self._colors = _Interner()
+        self._fontsets = _Interner()
+
+    def add_records(self, records: typing.Iterable[dict]) -> "ElementStoreBuilder":
+        for r in records:
+            self.add(r)
+        return self
+
+    def add(self, record: dict):
+        c = self._cols
+        etype = record["type"]
+        c["element_id"].append(len(c["element_id"]))
+        c["type"].append(etype.value)
+        c["p_num"].append(record["p_num"])
+        c["boxnum"].append(record.get("boxnum", -1))
+        for k in ("x0", "y0", "x1", "y1"):
+            c[k].append(record[k])
+        c["char_begin"].append(len(self._char_size))
+        c["pts_begin"].append(len(self._points))
+
+        if etype == ElementType.Graphic:
+            self._points.extend(getattr(record.get("gobj"), "pts", None) or ())
+            c["linewidth"].append(record.get("linewidth", np.nan))
+            c["stroke"].append(int(bool(record.get("stroke"))))
+            c["fill"].append(int(bool(record.get("fill"))))
+            c["evenodd"].append(int(bool(record.get("evenodd"))))
+            c["stroking_color"].append(self._colors(record.get("stroking_color")))
+            c["non_stroking_color"].append(self._colors(record.get("non_stroking_color")))
+        else:
+            c["linewidth"].append(np.nan)
+            for k in ("stroke", "fill", "evenodd", "stroking_color", "non_stroking_color"):
+                c[k].append(-1)
+
+        lineobj = record.get("lineobj")
+        if etype == ElementType.Line and lineobj is not None:
+            c["linenum"].append(record.get("linenum", -1))
+            c["fontset"].append(self._fontsets(frozenset(record.get("font_infos") or ())))
+            c["vertical"].append(isinstance(lineobj, LTTextLineVertical))
+            for ch in lineobj:
+                is_char = isinstance(ch, LTChar)
+                self._char_text.append(ch.get_text() if isinstance(ch, LTText) else "")
+                self._char_size.append(ch.size if is_char else 0.0)
+                self._char_bbox.append(ch.bbox if is_char else (np.nan,) * 4)
+                self._char_is_char.append(is_char)
+        else:
+            c["linenum"].append(-1)
+            c["fontset"].append(-1)
+            c["vertical"].append(False)
+        c["char_end"].append(len(self._char_size))
+        c["pts_end"].append(len(self._points))
+
+    def add_store(self, store: ElementStore):
+        """append all elements of another store (in document order)"""
+        s = store._take(np.argsort(store["element_id"], kind="stable"))
+        c = self._cols
+        n_chars = len(self._char_size)
+        offset = len(c["element_id"])
+        color_ids = np.array([self._colors(v) for v in s._colors] + [-1], dtype=np.int32)
+        fontset_ids = np.array([self._fontsets(v) for v in s._fontsets] + [-1], dtype=np.int32)
+        for k in _COLUMNS:
+            v = s[k]
+            if k == "element_id":
+                v = np.arange(offset, offset + len(s))
+            elif k in ("stroking_color", "non_stroking_color"):
+                v = color_ids[v]
+            elif k == "fontset":
+                v = fontset_ids[v]
+            c[k].extend(v.tolist())
+
+        # the character arrays are shared by views, so we copy the
+        # characters line by line
+        for b, e in zip(s["char_begin"], s["char_end"]):
+            c_begin = len(self._char_size)
+            self._char_text.extend(s._text[s._char_text_offsets[i]:s._char_text_offsets[i + 1]] for i in range(b, e))
+            self._char_size.extend(s._char_size[b:e].tolist())
+            self._char_bbox.extend(map(tuple, s._char_bbox[b:e].tolist()))
+            self._char_is_char.extend(s._char_is_char[b:e].tolist())
+        # re-calculate char ranges for the new elements
+        lengths = s["char_end"] - s["char_begin"]
+        ends = n_chars + np.cumsum(lengths)
+        c["char_begin"][offset:] = (ends - lengths).tolist()
+        c["char_end"][offset:] = ends.tolist()
+
+        n_points = len(self._points)
+        for b, e in zip(s["pts_begin"], s["pts_end"]):
+            self._points.extend(map(tuple, s._points[b:e].tolist()))
+        lengths = s["pts_end"] - s["pts_begin"]
+        ends = n_points + np.cumsum(lengths)
+        c["pts_begin"][offset:] = (ends - lengths).tolist()
+        c["pts_end"][offset:] = ends.tolist()
+
+    def build(self) -> ElementStore:
+        columns = {k: np.array(v, dtype=_COLUMNS[k]) for k, v in self._cols.items()}
+        char_text_offsets = np.zeros(len(self._char_text) + 1, dtype=np.int64)
+        char_text_offsets[1:] = np.cumsum(
+            np.fromiter((len(t) for t in self._char_text), dtype=np.int64, count=len(self._char_text)))
+        return ElementStore(
+            columns,
+            text="".join(self._char_text),
+            char_text_offsets=char_text_offsets,
+            char_size=np.array(self._char_size, dtype=np.float64),
+            char_bbox=np.array(self._char_bbox, dtype=np.float64).reshape(-1, 4),
+            char_is_char=np.array(self._char_is_char, dtype=bool),
+            points=np.array(self._points, dtype=np.float64).reshape(-1, 2),
+            colors=list(self._colors.values),
+            fontsets=list(self._fontsets.values)
+        )
@@ -1,44 +1,81 @@
 import logging
 
-import langdetect
 import pandas as pd
+import torch
 from transformers import AutoModelForSequenceClassification, pipeline, AutoTokenizer
 
 from pydoxtools.document_base import Extractor
+from pydoxtools.language_utils import detect_language
+from pydoxtools.model_registry import model_registry
 from pydoxtools.settings import settings
 
 logger = logging.getLogger(__name__)
 
 
 class LanguageExtractor(Extractor):
-    def __call__(self, text) -> str:
-        text = text.strip()
-        if text:
-            lang = langdetect.detect(text)
-        else:
-            lang = "unknown"
-        return lang
+    """
+    detect the language of a text from a bounded sample of its text boxes
+    (see pydoxtools.language_utils)
+    """
+
+    def __init__(self, max_chars: int = 2000, seed: int = 0):
+        super().__init__()
+        self._max_chars = max_chars
+        self._seed = seed
+
+    def __call__(self, text: str | list[str]) -> str:
+        return detect_language(text, max_chars=self._max_chars, seed=self._seed)
+
+
+def _load_text_block_pipeline(model_name: str):
+    tokenizer = AutoTokenizer.from_pretrained("bert-base-uncased")
+    model_dir = settings.MODEL_DIR / model_name
+    if not model_dir.exists():
+        # TODO: download "any" model that we want from transformers
+        logger.info(f"model {model_name} not found in pydoxtools models, download directly from transformers!")
+        model_dir = "xyntopia/tb_classifier"
+    # tokenizer_kwargs = {'padding': True, 'truncation': True, 'max_length': 512, 'return_tensors': 'pt'}
+    # TODO: optionally enable CUDA...
+    model = AutoModelForSequenceClassification.from_pretrained(model_dir, num_labels=2)  # .to("cuda")
+    return pipeline("text-classification", model=model, tokenizer=tokenizer)
+
+
+model_registry.register("text_classification", _load_text_block_pipeline)
+
+
+def classify_texts(model, texts: list[str], batch_size: int = 32) -> list[str]:
+    """
+    classify texts with a transformers text-classification pipeline in batches.
+
+    Texts get sorted by length before they are batched, so that
+    every batch only needs to be padded to roughly the same length.
+    """
+    labels = [None] * len(texts)
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    id2label = model.model.config.id2label
+    with torch.inference_mode():
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            inputs = model.tokenizer(
+                [texts[i] for i in idx], truncation=True, padding=True, return_tensors="pt"
+            ).to(model.device)
+            predictions = model.model(**inputs).logits.argmax(-1).tolist()
+            for i, p in zip(idx, predictions):
+                labels[i] = id2label[p]
+    return labels
 
 
 class TextBlockClassifier(Extractor):
-    def __init__(self, min_prob=0.5):
+    def __init__(self, min_prob=0.5, batch_size: int = 32):
         super().__init__()
         self._min_prob = min_prob
+        self._batch_size = batch_size
 
-    def __call__(self, text_box_elements: pd.DataFrame):
-        tokenizer = AutoTokenizer.from_pretrained("bert-base-uncased")
-        model_name = "txtblockclassifier"
-        model_dir = settings.MODEL_DIR / model_name
-        if not model_dir.exists():
-            # TODO: download "any" model that we want from transformers
-            logger.info(f"model {model_name} not found in pydoxtools models, download directly from transformers!")
-            model_dir = "xyntopia/tb_classifier"
-        # tokenizer_kwargs = {'padding': True, 'truncation': True, 'max_length': 512, 'return_tensors': 'pt'}
-        # TODO: optionally enable CUDA...
-        # TODO: only extract "unique" addresses
-        model = AutoModelForSequenceClassification.from_pretrained(model_dir, num_labels=2)  # .to("cuda")
-        model = pipeline("text-classification", model=model, tokenizer=tokenizer)
+    def __call__(self, text_box_elements: pd.DataFrame, batch_size: int = None):
         text = text_box_elements["text"].str.strip()
-        res = text.apply(lambda x: model(
-            [x], truncation=True, padding=True)[0]["label"])
-        return text[res == "address"].to_list()
+        # identical text boxes only need to be classified once
+        unique_text = text.unique().tolist()
+        with model_registry.acquire("text_classification", "txtblockclassifier") as model:
+            labels = classify_texts(model, unique_text, batch_size or self._batch_size)
+        addresses = {t for t, label in zip(unique_text, labels) if label == "address"}
+        return text[text.isin(addresses)].to_list()
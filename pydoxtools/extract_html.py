@@ -8,7 +8,6 @@ from typing import List
 from urllib.parse import urlsplit
 
 import extruct
-import langdetect.lang_detect_exception
 import lxml
 import numpy as np
 import pandas as pd
@@ -18,6 +17,7 @@ from goose3 import Goose
 
 from pydoxtools import document_base
 from pydoxtools import html_utils
+from pydoxtools.language_utils import detect_language
 from pydoxtools.html_utils import logger, clean_html
 
 try:
@@ -36,10 +36,7 @@ logger = logging.getLogger(__name__)
 
 def find_language(html):
     txt = html_utils.get_pure_html_text(html)
-    try:
-        return langdetect.detect(txt)
-    except langdetect.lang_detect_exception.LangDetectException:
-        return "None"
+    return detect_language(txt, default="None")
 
 
 def extract_tables(html):
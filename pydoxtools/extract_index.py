@@ -1,60 +1,32 @@
 from typing import Callable
 
-import hnswlib
 import networkx as nx
 import numpy as np
+import scipy.sparse
 
 from pydoxtools.document_base import Extractor, TokenCollection
+from pydoxtools.math_utils import pagerank
+from pydoxtools.vector_index import VectorIndex, create_index
 
 
 class IndexExtractor(Extractor):
     """
-    Class extracts an index form a document
-    TODO: make it flexible which kind of index we can use for this :).
+    Class extracts a nearest neighbour search index from a document.
 
-    --> for example we could also use a scikit-learn knn index or some brute-force method
-        etc....
+    backend: "auto", "brute_force", "hnswlib" or "balltree" (see pydoxtools.vector_index)
+    params: parameters for the index backend such as M, ef_construction and ef for hnswlib
     """
 
-    def __init__(self):
+    def __init__(self, backend: str = "auto", **params):
         super().__init__()
+        self._backend = backend
+        self._params = params
 
-    def __call__(self, vecs: np.ndarray, ids: list[int]):
-        """create a nearest neighbour search index
-
-        pos_filter creates an index only for specific word types
-
-        TODO: document this function a little better
-        """
-        index = hnswlib.Index(space='cosine', dim=vecs.shape[1])
-        # ids = list(range(len(vecs)))
-        """
-        if filter == "noun_chunks":
-            vecs = [e.vector for e in self.noun_chunks]
-            idx = list(range(len(vecs)))
-        elif filter == "sents":
-            vecs = [s.vector for s in self.sents]
-            idx = list(range(len(vecs)))
-        elif filter:
-            token_list = [t for t in self.spacy_doc if (t.pos_ in filter)]
-            vecs = [t.vector for t in token_list]
-            idx = [t.i for t in token_list]
-        else:
-            vecs = self.vecs
-            idx = list(t.i for t in self.spacy_doc)
-        """
-
-        # max_elements defines the maximum number of elements that can be stored in
-        # the structure(can be increased/shrunk).
-        # ef_construction: quality vs speed parameter
-        # M = max number of outgoing connections in the graph...
-        index.init_index(max_elements=len(vecs) + 1, ef_construction=200, M=16)
-        # Element insertion (can be called several times):
-        index.add_items(data=vecs, ids=ids)
-        # Controlling the recall by setting ef:
-        # index.set_ef(100)  # ef should always be > k
-
-        return index
+    def __call__(self, vecs: np.ndarray, ids: list[int], backend: str = None) -> VectorIndex:
+        """create a nearest neighbour search index for vectors which can be identified by ids"""
+        backend = backend or self._backend
+        params = self._params if backend == self._backend else {}
+        return create_index(vecs, ids, backend=backend, **params)
 
 
 class KnnQuery(Extractor):
@@ -63,23 +35,38 @@ class KnnQuery(Extractor):
 
     def __call__(
             self,
-            index: hnswlib.Index,
+            index: VectorIndex,
             idx_values: list,
             vectorizer: Callable,  # e.g. lambda spacy_nlp, txt: spacy_nlp spacy_nlp(txt).vector
     ) -> Callable:
-        def knn_query(txt: str | np.ndarray | TokenCollection, k: int = 5, indices=False) -> list[tuple]:
+        def to_vector(txt: str | np.ndarray | TokenCollection) -> np.ndarray:
             if isinstance(txt, str):
-                search_vec = vectorizer(txt)
+                return vectorizer(txt)
             elif isinstance(txt, np.ndarray):
-                search_vec = txt
+                return txt
+            else:
+                return txt.vector
+
+        def knn_query(
+                txt: str | np.ndarray | TokenCollection | list, k: int = 5, indices=False
+        ) -> list[tuple] | list[list[tuple]]:
+            """
+            find the k nearest neighbours of txt. If txt is a 2D-matrix of
+            query vectors or a list of queries, all of them get answered in a single
+            batched call and a list of results is returned.
+            """
+            batched = isinstance(txt, list) or (isinstance(txt, np.ndarray) and txt.ndim == 2)
+            if isinstance(txt, list):
+                search_vecs = np.array([to_vector(t) for t in txt])
             else:
-                search_vec = txt.vector
-            similar = index.knn_query([search_vec], k=k)
+                search_vecs = np.atleast_2d(to_vector(txt))
+            labels, distances = index.knn_query(search_vecs, k=k)
 
             if indices:
-                return [(i, idx_values[i], dist) for i, dist in zip(similar[0][0], similar[1][0])]
+                res = [[(i, idx_values[i], dist) for i, dist in zip(li, di)] for li, di in zip(labels, distances)]
             else:
-                return [(idx_values[i], dist) for i, dist in zip(similar[0][0], similar[1][0])]
+                res = [[(idx_values[i], dist) for i, dist in zip(li, di)] for li, di in zip(labels, distances)]
+            return res if batched else res[0]
 
         return knn_query
 
@@ -89,6 +76,9 @@ class SimilarityGraph(Extractor):
      this function buils a "directed similarity graph" by taking the similarity of words in a document
      and connecting tokens which are similar. This can then be used for further analysis
      such as textrank (wordranks, sentence ranks, paragraph ranking) etc...
+
+     The graph is returned as a sparse adjacency matrix where adjacency[i, j] = 1 - distance
+     for every connection i -> j.
      """
 
     def __init__(self, max_connectivity=4, max_distance=0.2):
@@ -96,18 +86,26 @@ class SimilarityGraph(Extractor):
         self.k = max_connectivity
         self.max_distance = max_distance
 
-    def __call__(self, index_query_func: Callable, source: list[TokenCollection]):
-        G = nx.DiGraph()
-        for i, token_span in enumerate(source):
-            G.add_node(i, label=token_span.text)
-            # we take k+1 here, as the first element will always be the query token itself...
-            similar = index_query_func(token_span, k=self.k + 1, indices=True)
-            # links = links[links<0.3]
-            # doc_sim = nlp_utils.cos_similarity(self.spacy_doc.vector[None, :], span.vector[None, :])[0]
-            for j, _, d in similar:
-                if (not i == j) and (d <= self.max_distance):
-                    G.add_edge(i, j, weight=(1 - d))
-        return G
+    def __call__(self, index: VectorIndex, vecs: np.ndarray) -> scipy.sparse.csr_matrix:
+        n = len(vecs)
+        if n == 0:
+            return scipy.sparse.csr_matrix((0, 0))
+        # we take k+1 here, as the first element will always be the query token itself...
+        # all vectors get queried in a single batch
+        labels, distances = index.knn_query(vecs, k=self.k + 1)
+        rows = np.broadcast_to(np.arange(n)[:, None], labels.shape)
+        valid = (labels != rows) & (distances <= self.max_distance)
+        return scipy.sparse.csr_matrix(
+            (1 - distances[valid], (rows[valid], labels[valid])), shape=(n, n))
+
+
+def similarity_graph_to_networkx(adjacency: scipy.sparse.spmatrix, labels: list) -> nx.DiGraph:
+    """convert a sparse similarity graph into a networkx graph with labeled nodes"""
+    G = nx.DiGraph()
+    G.add_nodes_from((i, dict(label=str(l))) for i, l in enumerate(labels))
+    A = scipy.sparse.coo_matrix(adjacency)
+    G.add_weighted_edges_from(zip(A.row.tolist(), A.col.tolist(), A.data.tolist()))
+    return G
 
 
 class ExtractKeywords(Extractor):
@@ -115,8 +113,9 @@ class ExtractKeywords(Extractor):
         super().__init__()
         self.k = top_k
 
-    def __call__(self, G: nx.Graph):
+    def __call__(self, adjacency: scipy.sparse.spmatrix, labels: list):
         """extract keywords by textrank from a similarity graph of a spacy document"""
-        keywords = ((G.nodes[i]["label"], score) for i, score in nx.pagerank(G, weight='weight').items())
-        top_kw = sorted(keywords, key=lambda x: x[1], reverse=True)[:self.k]
-        return [kw[0] for kw in top_kw]
+        scores = pagerank(adjacency)
+        # stable sort, so that nodes with equal score keep their order
+        top = np.argsort(-scores, kind="stable")[:self.k]
+        return [str(labels[i]) for i in top]
@@ -1,3 +1,7 @@
+import functools
+import importlib
+import typing
+
 from pydoxtools import document_base
 
 
@@ -34,3 +38,65 @@ class LambdaExtractor(document_base.Extractor):
 
     def __call__(self, *args, **kwargs):
         return self._func(*args, **kwargs)
+
+
+class LazyExtractor(document_base.Extractor):
+    """
+    Placeholder for an extractor class which gets imported and created
+    the first time the extractor is called. This way heavy libraries
+    (torch, spacy, pandoc etc...) only get loaded when they are actually needed.
+
+    Use lazy_extractor to create these.
+    """
+
+    def __init__(self, module: str, name: str, *args, **kwargs):
+        super().__init__()
+        self._module = module
+        self._name = name
+        self._args = args
+        self._kwargs = kwargs
+
+    @property
+    def class_name(self) -> str:
+        return self._name
+
+    @functools.cached_property
+    def extractor(self) -> document_base.Extractor:
+        cls = getattr(importlib.import_module(self._module), self._name)
+        return cls(*self._args, **self._kwargs)
+
+    def __call__(self, *args, **kwargs):
+        return self.extractor(*args, **kwargs)
+
+
+def lazy_extractor(module: str, name: str) -> typing.Callable[..., LazyExtractor]:
+    """
+    returns a function which can be used like the constructor of the
+    extractor class *name* from *module* without importing it::
+
+        SpacyExtractor = lazy_extractor("pydoxtools.extract_spacy", "SpacyExtractor")
+        SpacyExtractor(model_size="md").pipe(...).out(...)
+    """
+
+    def create(*args, **kwargs) -> LazyExtractor:
+        return LazyExtractor(module, name, *args, **kwargs)
+
+    create.__name__ = create.__qualname__ = name
+    return create
+
+
+class LazyFunction:
+    """a function from *module* which gets imported on the first call"""
+
+    def __init__(self, module: str, name: str):
+        self._module = module
+        self._name = name
+        self._func = None
+
+    def __call__(self, *args, **kwargs):
+        if self._func is None:
+            self._func = getattr(importlib.import_module(self._module), self._name)
+        return self._func(*args, **kwargs)
+
+    def __repr__(self):
+        return f"LazyFunction({self._module}.{self._name})"
@@ -1,13 +1,13 @@
 import io
 import logging
 
-import langdetect
 import pytesseract
 from PIL import Image
 from pdfminer.high_level import extract_text
 
 from pydoxtools import ocr_language_mappings
 from pydoxtools.document_base import Extractor
+from pydoxtools.language_utils import detect_language
 
 logger = logging.getLogger(__name__)
 
@@ -32,9 +32,8 @@ class OCRExtractor(Extractor):
         if ocr_lang == "auto":
             pdf = pytesseract.image_to_pdf_or_hocr(file, extension='pdf', lang=None)
             text = extract_text(io.BytesIO(pdf))
-            try:
-                lang = langdetect.detect(text)
-            except langdetect.lang_detect_exception.LangDetectException:
+            lang = detect_language(text, default=None)
+            if lang is None:
                 raise OCRException("could not detect language !!!")
             # get the corresponding language for tesseract
             lang = ocr_language_mappings.langdetect2tesseract.get(lang, None)
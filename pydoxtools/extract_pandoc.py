@@ -1,16 +1,22 @@
+import functools
+import logging
+
 import pandas as pd
 import pandoc
 import pandoc.types
-import logging
 from packaging import version
 from pydoxtools import document_base
 
 logger = logging.getLogger(__name__)
 
-pandoc_version = pandoc._configuration['version']
-if version.parse(pandoc_version) < version.parse('2.14.2'):
-    logger.warning(f"installed pandoc version {pandoc_version}, which doesn't support rtf file format!"
-                   f"in order to be able to use rtf, you need to install a pandoc version >= 2.14.2")
+
+@functools.cache
+def check_pandoc_version():
+    """warn about old pandoc versions (only once, when pandoc is used for the first time)"""
+    pandoc_version = pandoc._configuration['version']
+    if version.parse(pandoc_version) < version.parse('2.14.2'):
+        logger.warning(f"installed pandoc version {pandoc_version}, which doesn't support rtf file format!"
+                       f"in order to be able to use rtf, you need to install a pandoc version >= 2.14.2")
 
 
 def extract_list(elt):
@@ -51,6 +57,7 @@ class PandocLoader(document_base.Extractor):
     def __call__(
             self, raw_content: bytes | str, document_type: str
     ) -> pandoc.types.Pandoc:
+        check_pandoc_version()
         pandoc_format = pandoc.read(raw_content, format=document_type.strip("."))
         return pandoc_format
 
@@ -1,14 +1,15 @@
-import functools
 import logging
 import subprocess
-from typing import Optional
+from typing import Iterable, Optional
 
 import numpy as np
 import spacy
+import spacy.symbols
 from spacy import Language
 from spacy.tokens import Doc, Token, Span
 
-from .document_base import Extractor, TokenCollection
+from .document_base import Extractor, TokenCollection, token_collection_vectors
+from .model_registry import model_registry
 
 logger = logging.getLogger(__name__)
 
@@ -20,12 +21,17 @@ def download_model(model_id: str):
 
 
 def extract_noun_chunks(spacy_doc) -> list[TokenCollection]:
+    # leave out determiners, pronouns and whitespace
+    pos = spacy_doc.to_array("POS")
+    excluded = [spacy.symbols.DET, spacy.symbols.SPACE, spacy.symbols.PRON]
     token_list = []
     for nc in spacy_doc.noun_chunks:
-        tc = TokenCollection([t for t in nc if t.pos_ not in ["DET", "SPACE", "PRON"]])
-        if len(tc) > 0:
-            token_list.append(tc)
-    # filter = ["DET"]
+        idx = np.arange(nc.start, nc.end)
+        idx = idx[~np.isin(pos[idx], excluded)]
+        if len(idx) > 0:
+            token_list.append(TokenCollection(spacy_doc, idx))
+    # calculate all vectors in a single pass
+    token_collection_vectors(token_list)
     return token_list
 
 
@@ -60,15 +66,11 @@ def get_spacy_model_id(model_language, size="sm") -> Optional[str]:
         return f'xx_sent_ud_sm'
 
 
-@functools.lru_cache()
-def load_cached_spacy_model(model_id: str) -> Language:
+def _load_spacy_model(model_id: str) -> Language:
     """
     load spacy nlp model and in case of a transformer model add custom vector pipeline...
-
-    we also make sure to cache the model for batch operations on documens.
     """
     try:
-        logger.info(f"loading spacy model: {model_id}")
         nlp = spacy.load(model_id)
     except OSError:  # model doesn't seem to be present, yet
         logger.info(f"failed, loading. trying to download spacy model: {model_id}")
@@ -81,19 +83,68 @@ def load_cached_spacy_model(model_id: str) -> Language:
     return nlp
 
 
-@Language.factory('trf_vectors')
+model_registry.register("spacy", _load_spacy_model)
+
+
+def load_cached_spacy_model(model_id: str) -> Language:
+    """
+    load spacy nlp model through the model registry so that
+    it gets cached for batch operations on documents.
+
+    The model isn't protected from eviction (see ModelRegistry.get). Use
+    model_registry.acquire("spacy", model_id) if it should be kept for longer.
+    """
+    return model_registry.get("spacy", model_id)
+
+
+def pool_wordpieces(vecs: np.ndarray, indices: np.ndarray, lengths: np.ndarray, pooling: str = "sum") -> np.ndarray:
+    """
+    pool wordpiece vectors into token vectors.
+
+    vecs: wordpiece vectors (n_wordpieces x hidden_size)
+    indices: the wordpiece indices of all tokens, concatenated
+    lengths: number of wordpieces of every token
+    pooling: "sum", "mean" or "max". Tokens without wordpieces get a zero vector.
+    """
+    lengths = np.asarray(lengths)
+    pooled = np.zeros((len(lengths), vecs.shape[1]), dtype=vecs.dtype)
+    nonempty = lengths > 0
+    if not nonempty.any():
+        return pooled
+    # segments of empty tokens have zero length, so we can simply leave them out
+    starts = (np.cumsum(lengths) - lengths)[nonempty]
+    wordpieces = vecs[np.asarray(indices).ravel()]
+    if pooling == "max":
+        pooled[nonempty] = np.maximum.reduceat(wordpieces, starts, axis=0)
+    elif pooling in ("sum", "mean"):
+        pooled[nonempty] = np.add.reduceat(wordpieces, starts, axis=0)
+        if pooling == "mean":
+            pooled[nonempty] /= lengths[nonempty, None]
+    else:
+        raise ValueError(f"unknown pooling method: {pooling}")
+    return pooled
+
+
+_DOC_VECTOR_KEY = ("pydoxtools", "trf_doc_vector")
+
+
+@Language.factory('trf_vectors', default_config={"pooling": "sum"})
 class TrfContextualVectors:
     """
     Spacy pipeline which add transformer vectors to each token based on user hooks.
 
+    pooling: how the vectors of the wordpieces of a token get combined: "sum", "mean" or "max"
+
     https://spacy.io/usage/processing-pipelines#custom-components-user-hooks
     https://github.com/explosion/spaCy/discussions/6511
     """
 
-    def __init__(self, nlp: Language, name: str):
-        # TODO: we can configure this class for different pooling methods...
+    def __init__(self, nlp: Language, name: str, pooling: str):
         self.name = name
-        Doc.set_extension("trf_token_vecs", default=None)
+        self._nlp = nlp
+        self.pooling = pooling
+        if not Doc.has_extension("trf_token_vecs"):
+            Doc.set_extension("trf_token_vecs", default=None)
 
     def __call__(self, sdoc):
         # inject hooks from this class into the pipeline
@@ -101,20 +152,17 @@ class TrfContextualVectors:
             sdoc = self._nlp(sdoc)
 
         # pre-calculate all vectors for every token:
-
-        # calculate groups for spacy token boundaries in the trf vectors
-        vec_idx_splits = np.cumsum(sdoc._.trf_data.align.lengths)
+        trf_data = sdoc._.trf_data
         # get transformer vectors and reshape them into one large continous tensor
-        trf_vecs = sdoc._.trf_data.tensors[0].reshape(-1, 768)
-        # calculate mapping groups from spacy tokens to transformer vector indices
-        vec_idxs = np.split(sdoc._.trf_data.align.dataXd, vec_idx_splits)
-
-        # take sum of mapped transformer vector indices for spacy vectors
-        # TOOD: add more pooling methods than just sum...
-        #       if we do this we probabyl need to declare a factory function...
-        vecs = np.stack([trf_vecs[idx].sum(0) for idx in vec_idxs[:-1]])
-        sdoc._.trf_token_vecs = vecs
+        tensor = np.asarray(trf_data.tensors[0])
+        trf_vecs = tensor.reshape(-1, tensor.shape[-1])
+        vecs = pool_wordpieces(trf_vecs, trf_data.align.dataXd, trf_data.align.lengths, self.pooling)
+        return self.set_vectors(sdoc, vecs)
 
+    def set_vectors(self, sdoc: Doc, vecs: np.ndarray) -> Doc:
+        """set token vectors of a document and inject the vector hooks of this class"""
+        sdoc._.trf_token_vecs = vecs
+        sdoc.user_data.pop(_DOC_VECTOR_KEY, None)
         sdoc.user_token_hooks["vector"] = self.token_vector
         sdoc.user_span_hooks["vector"] = self.span_vector
         sdoc.user_hooks["vector"] = self.doc_vector
@@ -126,48 +174,156 @@ class TrfContextualVectors:
         # sdoc.user_hooks["similarity"] = self.similarity
         return sdoc
 
-    @functools.lru_cache
+    # the hooks don't use functools.lru_cache as this would keep
+    # references to all documents. Token & span vectors are simple
+    # slices of the vector matrix and the document vector gets cached
+    # inside of the document itself.
     def token_vector(self, token: Token):
         return token.doc._.trf_token_vecs[token.i]
 
-    @functools.lru_cache
     def span_vector(self, span: Span):
         vecs = span.doc._.trf_token_vecs
         return vecs[span.start: span.end].sum(0)
 
-    @functools.lru_cache
     def doc_vector(self, doc: Doc):
-        vecs = doc._.trf_token_vecs
-        return vecs.sum(0)
+        if (vec := doc.user_data.get(_DOC_VECTOR_KEY)) is None:
+            vec = doc.user_data[_DOC_VECTOR_KEY] = doc._.trf_token_vecs.sum(0)
+        return vec
 
     def has_vector(self, token):
         return True
 
 
+# spacy outputs of a document and the pipeline components they need.
+# Components which produce tensors for other components (tok2vec, transformer)
+# are never disabled.
+SPACY_OUTPUT_COMPONENTS = {
+    "spacy_sents": {"parser", "senter", "sentencizer"},
+    "entities": {"ner", "entity_ruler"},
+    "spacy_noun_chunks": {"tagger", "morphologizer", "attribute_ruler", "parser"},
+}
+_ALWAYS_ENABLED = {"tok2vec", "transformer", "trf_vectors"}
+# if these get requested directly, the full pipeline is used
+_FULL_PIPELINE_OUTPUTS = {"spacy_doc", "spacy_nlp"}
+
+
+def required_spacy_outputs(outputs: Iterable[str]) -> set[str]:
+    """
+    find the spacy outputs (see SPACY_OUTPUT_COMPONENTS) among the outputs which are
+    needed for a request (see Pipeline.upstream_outputs)
+    """
+    return set(outputs) & set(SPACY_OUTPUT_COMPONENTS)
+
+
+def disabled_components(nlp: Language, spacy_outputs: set[str]) -> list[str]:
+    """components of a spacy pipeline which aren't needed for spacy_outputs"""
+    keep = _ALWAYS_ENABLED.union(*(SPACY_OUTPUT_COMPONENTS[o] for o in spacy_outputs))
+    return [name for name in nlp.pipe_names if name not in keep]
+
+
+def split_text(text: str, chunk_size: int, separators=("\n\n", "\n", " ")) -> list[str]:
+    """
+    split a text into chunks of at most chunk_size characters. The text
+    gets split at the separators in the given order (e.g. text box boundaries "\n\n" first)
+    and the parts are merged into chunks again.
+    The separators stay part of the chunks, so "".join(chunks) == text.
+    Chunks can be slightly larger than chunk_size because of leading whitespace.
+    """
+    if len(text) <= chunk_size:
+        return [text]
+    if not separators:
+        return [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+    sep, separators = separators[0], separators[1:]
+    parts = [p + sep for p in text.split(sep)]
+    parts[-1] = parts[-1][:-len(sep)]
+
+    chunks = [""]
+    for p in parts:
+        if len(p) > chunk_size:  # separator didn't split this part enough
+            chunks.extend(split_text(p, chunk_size, separators))
+            chunks.append("")
+        elif len(chunks[-1]) + len(p) > chunk_size:
+            chunks.append(p)
+        else:
+            chunks[-1] += p
+    chunks = [c for c in chunks if c]
+    # move whitespace at the end of a chunk to the beginning of the next one
+    # so that whitespace gets tokenized the same way as in the unsplit text
+    for i in range(len(chunks) - 1):
+        stripped = chunks[i].rstrip()
+        if stripped and len(stripped) < len(chunks[i]):
+            chunks[i + 1] = chunks[i][len(stripped):] + chunks[i + 1]
+            chunks[i] = stripped
+    return chunks
+
+
 class SpacyExtractor(Extractor):
     def __init__(
             self,
             model_size: str = "sm",
             model_language: str = "auto",
-            spacy_model="xx_ent_wiki_sm"
+            spacy_model="xx_ent_wiki_sm",
+            chunk_size: int = None,
+            batch_size: int = 32,
+            n_process: int = 1
     ):
         """
         model_size: if model_language=="auto" we also need to set our model_size
+        chunk_size: texts longer than this (in characters) get split into chunks at text box
+            boundaries which get processed with nlp.pipe and merged back into a single spacy document.
+            By default, only texts which are longer than nlp.max_length get split.
+        batch_size, n_process: parameters for nlp.pipe in chunked mode
         """
         # TODO: add a "HuggingfaceExtractor" with similar structure
         super().__init__()
         self._spacy_model = spacy_model
         self._model_size = model_size
         self._model_language = model_language
-
-    def __call__(self, full_text: str, language: str = "auto") -> spacy.tokens.Doc:
+        self._chunk_size = chunk_size
+        self._batch_size = batch_size
+        self._n_process = n_process
+
+    def __call__(
+            self, full_text: str, language: str = "auto", outputs: list[str] = None,
+            chunk_size: int = None, batch_size: int = None, n_process: int = None
+    ) -> spacy.tokens.Doc:
+        """
+        outputs: all document outputs which are needed for a request (see
+            document_base.REQUESTED_OUTPUTS). Pipeline components which
+            aren't needed for these outputs get disabled, unless the spacy document
+            or model were requested themselves. By default, all components are used.
+        """
         if self._model_language == "auto":
             nlp_modelid = get_spacy_model_id(language, self._model_size)
         else:
             nlp_modelid = self._spacy_model
 
-        spacy_nlp = load_cached_spacy_model(nlp_modelid)
-        return dict(
-            doc=spacy_nlp(full_text),
-            nlp=spacy_nlp
-        )
+        chunk_size = chunk_size or self._chunk_size
+        with model_registry.acquire("spacy", nlp_modelid) as spacy_nlp:
+            disable = []
+            if outputs and not _FULL_PIPELINE_OUTPUTS.intersection(outputs):
+                disable = disabled_components(spacy_nlp, required_spacy_outputs(outputs))
+            if chunk_size or len(full_text) > spacy_nlp.max_length:
+                # chunks can get a little larger than chunk_size because of moved whitespace
+                chunks = split_text(full_text, min(chunk_size or spacy_nlp.max_length, spacy_nlp.max_length // 2))
+            else:
+                chunks = [full_text]
+            if len(chunks) == 1:
+                doc = spacy_nlp(full_text, disable=disable)
+            else:
+                docs = list(spacy_nlp.pipe(
+                    chunks, disable=disable,
+                    batch_size=batch_size or self._batch_size,
+                    n_process=n_process or self._n_process))
+                # character offsets of the merged document are the same as in full_text
+                doc = Doc.from_docs(docs, ensure_whitespace=False)
+                if "trf_vectors" in spacy_nlp.pipe_names:
+                    spacy_nlp.get_pipe("trf_vectors").set_vectors(
+                        doc, np.concatenate([d._.trf_token_vecs for d in docs]))
+            # documents keep the model through their "spacy_nlp" output (and the vocab of
+            # "spacy_doc"). If it gets evicted in the meantime, it stays in memory until
+            # those documents are released.
+            return dict(
+                doc=doc,
+                nlp=spacy_nlp
+            )
@@ -1,4 +1,3 @@
-import functools
 import hashlib
 import logging
 import re
@@ -15,6 +14,7 @@ import pydoxtools
 from pydoxtools import cluster_utils as gu
 from pydoxtools.cluster_utils import pairwise_txtbox_dist, box_cols, y1, x0, x1, boundarybox_intersection_query
 from pydoxtools.document_base import Extractor
+from pydoxtools.element_store import StoredChar
 from pydoxtools.extract_html import extract_lists, extract_tables
 from pydoxtools.extract_textstructure import _line2txt
 
@@ -131,7 +131,7 @@ def _LTObj2Chars(df_le) -> pd.DataFrame:
     chars = []
     for text_line in df_le.lineobj.values:
         for character in text_line:
-            if isinstance(character, LTChar):
+            if isinstance(character, LTChar) or (isinstance(character, StoredChar) and character.is_char):
                 chars.append(character)
     chars = pd.DataFrame([dict(
         obj=c,
@@ -143,54 +143,6 @@ def _LTObj2Chars(df_le) -> pd.DataFrame:
     return chars
 
 
-def _close_cell(oc, df_le, y1, text_line_tol):
-    # the current indexing of text lines is the following:
-    # "y0","x0","y0","x1" and so we need to
-    # to do the indexing accordingly
-    # TODO: not sure if "min" is the right operation here, it might also be enough
-    #       to just use "iloc[0]" due to already correct sorting...
-    oc['y1'] = y1
-    text_elements = df_le.loc[idx[
-                              oc["y0"] - text_line_tol:,
-                              oc["x0"] - text_line_tol:,
-                              :oc["y1"] + text_line_tol,
-                              :oc["x1"] + text_line_tol],
-                    :]
-    if text_elements.empty:
-        return None
-    else:
-        oc['text_elements'] = text_elements
-        return oc
-
-
-def _close_open_cells(open_cells, h_lines, df_le, elem_scan_tol,
-                      text_line_tol, y0_cursor):
-    # iterate through each open cell and check which ones we can close with the
-    # provided top_cell_border_elements
-    still_open = []
-    new_cells = []
-    for oc in open_cells:
-        # check if we have a top element that somehow exists within the cell borders
-        # and can be used to close the cell...
-        # we have 3 cases:
-        #  - both ends are inside the cell
-        #  - x0 is on the left side of the left lineend
-        #  - x1 is on the right side of the right line end
-        # all three cases are handled by the expression below:
-        top_elem = h_lines.loc[
-                   idx[:oc['x1'] - elem_scan_tol,
-                   oc['x0'] + elem_scan_tol:],
-                   :]
-
-        if top_elem.empty:
-            still_open.append(oc)
-        else:  # if top_elem exits, close the cell
-            if new_cell := _close_cell(oc, df_le, y0_cursor, text_line_tol):
-                new_cells.append(new_cell)
-
-    return new_cells, still_open
-
-
 class ListExtractor(Extractor):
     """
     Extract lines that might be part of a "list".
@@ -225,12 +177,16 @@ class Table:
     def __init__(
             self, df_le, df_ge, initial_area: np.ndarray,
             tbe: TableExtractionParameters = None,
-            page: int = None, page_bbox=None, file_name=None
+            page: int = None, page_bbox=None, file_name=None,
+            le_index: gu.BoxIndex = None, ge_index: gu.BoxIndex = None
     ):
         """
         Convert an area list of graphic and line elements into a table.
 
         page, page_bbox, filename are all used for debug-purposes
+
+        le_index, ge_index: optional spatial indices of df_le & df_ge. They
+            can be shared between all tables on a page.
         """
         self._filename = file_name
         self._page_bbox = page_bbox
@@ -239,11 +195,16 @@ class Table:
         self._df_ge = df_ge
         self._tbe = tbe or TableExtractionParameters.reduced_params()
         self._initial_area = initial_area
+        self._le_index = le_index
+        self._ge_index = ge_index
 
         # TODO: put into table extraction parameters
         self.max_lines = 1000
 
         self._debug = {}
+        # results of detect_cells & convert_cells_to_df. We don't use functools.lru_cache
+        # on these methods as that would keep all tables alive.
+        self._cache = {}
 
     @property
     def tbe(self) -> TableExtractionParameters:
@@ -254,7 +215,8 @@ class Table:
         """line elements of table"""
         return gu.boundarybox_query(
             self._df_le, self._initial_area,
-            tol=self.tbe.text_extraction_margin
+            tol=self.tbe.text_extraction_margin,
+            index=self._le_index
         ).copy()
 
     @property
@@ -267,7 +229,8 @@ class Table:
         # TODO: maybe we should not use filtered, but unfiltered graphic elements here?
         return gu.boundarybox_query(
             self._df_ge, self._initial_area,
-            tol=self.tbe.text_extraction_margin
+            tol=self.tbe.text_extraction_margin,
+            index=self._ge_index
         ).copy()
 
     @cached_property
@@ -287,18 +250,17 @@ class Table:
         as well...
         """
 
-        char_dist_matrix = gu.calc_pairwise_matrix(
-            pairwise_txtbox_dist,
+        max_word_distance = 1.0
+        # only calculate distances between characters which are close to each other
+        self.df_ch["groups"], dist_m = gu.distance_cluster_sparse(
             self.df_ch[box_cols].values,
-            diag=0,
+            pairwise_txtbox_dist,
+            distance_threshold=max_word_distance,
+            cutoff=gu.txtbox_dist_cutoff(
+                max_word_distance, self.tbe.max_char_disalignement, self.tbe.max_char_dist),
             min_line_alignement=self.tbe.max_char_disalignement,
             max_box_gap=self.tbe.max_char_dist
         )
-
-        max_word_distance = 1.0
-        self.df_ch["groups"], dist_m = gu.distance_cluster(
-            distance_matrix=char_dist_matrix, distance_threshold=max_word_distance
-        )
         # create new column with the type of group (hb,hm,ht,vb,vm,vt) and their labels
         bb_groups, group_sizes = gu.merge_groups(self.df_ch, "groups")
 
@@ -323,8 +285,14 @@ class Table:
         le_bb = np.array([self.df_le.x0.min(), self.df_le.y0.min(), self.df_le.x1.max(), self.df_le.y1.max()])
         return np.array([*np.vstack([ge_bb[:2], le_bb[:2]]).min(0), *np.vstack([ge_bb[2:], le_bb[2:]]).max(0)])
 
-    @functools.lru_cache()
     def detect_cells(self, steps=None) -> pd.DataFrame:
+        """detect the cells of the table (see _detect_cells), the result gets cached"""
+        key = ("detect_cells", steps)
+        if key not in self._cache:
+            self._cache[key] = self._detect_cells(steps)
+        return self._cache[key]
+
+    def _detect_cells(self, steps=None) -> pd.DataFrame:
         """
         This algorithm works by slowly scanning through a table bottom-to-top first
         and left-to-right for each row.
@@ -341,152 +309,124 @@ class Table:
         we can infer their cell indices. By clustering their cell borders and identifying
         cells indices afterwards.
 
-        TODO: add an ascii sketch about the process...
+        All spatial lookups are done on sorted numpy coordinate arrays (using searchsorted
+        and vectorized interval checks) instead of pandas MultiIndex slicing. The original
+        pandas implementation is kept as a reference in the tests (tests/test_extractor.py).
 
         TODO: we need to do something in the case where we have a table with actual
               box elements as table-rows/borders. in that case we can not use x0/x1 anymore..
         """
-
         max_v_line_thickness = self.tbe.max_v_line_thickness  # maximum thickness which is allowed for a vertical line
         elem_scan_tol = self.tbe.elem_scan_tol
         min_cell_width = self.tbe.min_cell_width
         text_line_tol = self.tbe.text_line_tol  # tolerance which detremines which text lines will be added to a cell area
 
-        # TODO: use the "area-ratio" of elments in order to improve quality?
-        # create indices for our graphical and line elements for
-        # faster spatial queries
-        # TODO: we might not need "w" and "h" or other elements...
-        ge = self.df_ge[box_cols + ['w', 'h']].sort_values(
-            by=['y0', 'y1', 'x0', 'x1'],
-        ).set_index(['y0', 'y1', 'x0', 'x1'], drop=False).copy()
+        # graphic elements sorted by (y0, y1, x0, x1)
+        ge = self.df_ge[box_cols + ['w']].sort_values(by=['y0', 'y1', 'x0', 'x1'])
+        gy0, gy1, gx0, gx1, gw = (ge[c].values for c in ('y0', 'y1', 'x0', 'x1', 'w'))
+        # text elements sorted by (y0, x0, y1, x1)
         le = self.df_words[box_cols + ['text']].sort_values(
             by=["y0", "x0", "y1", "x1"],
-        ).set_index(['y0', 'x0', 'y1', 'x1'], drop=False).copy()
-
-        # generate a list of increasing y-mean values which we can "pop"
-        # from the list in order to scan the table upwards...
-        y_mean = (le.y1 + le.y0) / 2.0
-        y_mean_list = y_mean.drop_duplicates().sort_values(ascending=False).to_list()
+        ).set_index(['y0', 'x0', 'y1', 'x1'], drop=False)
+        ly0, lx0, ly1, lx1 = (le[c].values for c in ('y0', 'x0', 'y1', 'x1'))
+
+        def close_cell(oc, y1_cell):
+            oc['y1'] = y1_cell
+            # text elements which are inside the cell
+            start = np.searchsorted(ly0, oc["y0"] - text_line_tol, side="left")
+            inside = start + np.flatnonzero(
+                (lx0[start:] >= oc["x0"] - text_line_tol)
+                & (ly1[start:] <= oc["y1"] + text_line_tol)
+                & (lx1[start:] <= oc["x1"] + text_line_tol))
+            if len(inside) == 0:
+                return None
+            oc['text_elements'] = le.iloc[inside]
+            return oc
+
+        # increasing y-mean values of the text lines which we "pop"
+        # in order to scan the table upwards...
+        y_mean_list = np.unique((ly1 + ly0) / 2.0)[::-1].tolist()
 
         open_cells = []  # cells that the cursor is currently traversing
-        # finished cells, where the y0-scan cursor has passed
-        # by the top y1 border and "closed" them this way...
-        cells = []
-
-        # move through the table bottom-to-top evaluating row-by-row
-        # define a y- and x-cursor which we will slowly advance in order to scan the table
-        # we start with the first text element in the lower left
+        cells = []  # finished cells
         y0_h_elem = 0.0
 
         max_steps = steps or self.max_lines  # maximum of 1000 lines for a table
         for i in range(max_steps):
-            if not y_mean_list:  # if y_mean_list is empty, we reached the top of the table
-                # as there are no more text lines we can close up all cells
-                # that are still open
-                last_cells = [_close_cell(oc, le, self.bbox[y1], text_line_tol) for oc in open_cells]
+            if not y_mean_list:  # we reached the top of the table, close all remaining cells
+                last_cells = [close_cell(oc, self.bbox[y1]) for oc in open_cells]
                 cells.extend(lc for lc in last_cells if lc)
                 break
 
-            # advance y0_cursor to the next textline
-            # TODO: use y_mean to the the left_over_lines!!
-            while y_mean_list:  # do this until we don't have any more text elements left
+            # advance y0_cursor to the next textline above the previously found table row
+            while y_mean_list:
                 y0_cursor = y_mean_list.pop()
-                # make sure that the middle of the line is above the previously found table row
                 if y0_cursor > y0_h_elem:
                     break
 
-            # now we would like to know every vertical line (not element) that crosses the current
-            # y0-cursor-line to get the vertical cell borders in this row...
-            # get all elements reaching from `below` to `above + tolerance` (using y0 and y1)
-            # we do "swaplevel" in order to be able to use more efficient x-indexing afterwards
-            row_ge_elem = ge.loc[idx[:y0_cursor + elem_scan_tol, y0_cursor + elem_scan_tol:], :]
-            v_row_elem = row_ge_elem.swaplevel(0, 2, axis=0).sort_index()
-
-            if v_row_elem.empty:
+            # vertical borders in this row: elements reaching from
+            # below to above the cursor (+ tolerance)
+            row_end = np.searchsorted(gy0, y0_cursor + elem_scan_tol, side="right")
+            in_row = gy1[:row_end] >= y0_cursor + elem_scan_tol
+            if not in_row.any():
                 # no vertical line detected in this row, so we should move further upwards
-                # and set y0_h_elem to the top of this line element.
                 if y_mean_list:
                     y0_h_elem = (y0_cursor + y_mean_list[-1]) / 2
                 continue
 
-            # get all vertical coordinates because we would like to identify the lines and not
-            # boxes...
-            vlines = np.sort(np.hstack(
-                (np.unique(v_row_elem[['x0', 'x1']].values), self.bbox[[x0, x1]])))
+            vlines = np.sort(np.hstack((
+                np.unique(np.hstack((gx0[:row_end][in_row], gx1[:row_end][in_row]))),
+                self.bbox[[x0, x1]])))
             x0_cursor = vlines[0]
             for x in vlines:
-                # TODO: take txt_lines  here into account. For example:
-                #       if a cell has a textline which is longer than its x1-border,
-                #       we should make the cell longer...
                 if x < x0_cursor + min_cell_width:
                     x0_cursor = x
                     continue
-
-                # check if this cell already exists in "open cells"
-                # by checking if our x-cursor is inside that cell
-                # if not, create it..
+                # create a new cell if our x-cursor isn't inside an open cell already
                 if not next((oc for oc in open_cells
                              if oc['x0'] <= (x0_cursor + elem_scan_tol) <= oc['x1']), None):
-                    # set cell borders but leave cells open as we have to advance our y0 cursor
-                    # to find out the y1 value of the cells ("close" them)...
-                    cell = dict(
-                        x0=x0_cursor,
-                        y0=y0_h_elem,
-                        x1=x  # use left side of broder element as right side of cell
-                    )
-                    open_cells.append(cell)
-                x0_cursor = x  # use right side as the next x0_cursor for left-side of the next cell
-
-            # now after scanning the row, advance y-cursor upwards and check which cells we can close...
-            # get the next horizontal element
-            # TODO: handle the case where we have text "above" graphic lines...
-            # TODO: might need to check for y1 here as well, as there
-            #       might be a case were the box only closes and no new
-            #       one opens... more tests will show...
-            #       maybe check whatever is between here and the next text element?
-            #       and then take the minimum y-coordinate from that..
-            #       YEAH --> we need this.. already our first test showed :P
-            left_over_y1 = ge.loc[idx[:, y0_cursor:], :]
-            if left_over_y1.empty:
-                # assume we are in the last box and need to
-                # close up any remaining boxes...
+                    open_cells.append(dict(x0=x0_cursor, y0=y0_h_elem, x1=x))
+                x0_cursor = x
+
+            # find the next horizontal element above the cursor
+            left_over = gy1 >= y0_cursor
+            if not left_over.any():
                 continue
-            left_over_y0 = left_over_y1[y0_cursor:]
-            next_h_elem = left_over_y1.iloc[0]
-            # TODO: do we need a min here?
-            y0_h_elem = next_h_elem.y1 if left_over_y0.empty else min(next_h_elem.y1, left_over_y0.iloc[0].y0)
-            # TODO: we might want to check if *max_v_line_thickness* should be the
-            #       distance to the next text element.... but maybe its enough to simply
-            #       have this as a parameter...
-            # select horizontal elements in row
-            h_row_elem = left_over_y1.loc[
-                         idx[: y0_h_elem + max_v_line_thickness,
-                         y0_h_elem - elem_scan_tol:],
-                         :]
-            h_row_elem = h_row_elem.loc[
-                h_row_elem.w > min_cell_width]  # .reorder_levels([2, 3, 0, 1], axis=0).sort_index()
-            # and extract horizontal lines from them
-            h_lines = pd.concat([
-                h_row_elem.loc[y0_h_elem - elem_scan_tol:y0_h_elem + max_v_line_thickness,
-                ["x0", "x1", "y0"]].rename(columns={"y0": "y"}),
-                h_row_elem.loc[idx[:, y0_h_elem - elem_scan_tol:y0_h_elem + max_v_line_thickness],
-                               ["x0", "x1", "y1"]].rename(columns={"y1": "y"})
-            ]).droplevel(["y0", "y1"]).sort_index().drop_duplicates(["x0", "x1"])
-
-            new_cells, still_open = _close_open_cells(
-                open_cells, h_lines, le, elem_scan_tol, text_line_tol, y0_h_elem)
+            next_h_elem = np.argmax(left_over)
+            left_over_y0 = left_over.copy()
+            left_over_y0[:np.searchsorted(gy0, y0_cursor, side="left")] = False
+            if left_over_y0.any():
+                y0_h_elem = min(gy1[next_h_elem], gy0[np.argmax(left_over_y0)])
+            else:
+                y0_h_elem = gy1[next_h_elem]
+
+            # horizontal lines in the row which can close our open cells
+            h_lower, h_upper = y0_h_elem - elem_scan_tol, y0_h_elem + max_v_line_thickness
+            h_row = (left_over & (gy0 <= h_upper) & (gy1 >= h_lower) & (gw > min_cell_width)
+                     & (((gy0 >= h_lower) & (gy0 <= h_upper)) | ((gy1 >= h_lower) & (gy1 <= h_upper))))
+            hx0, hx1 = gx0[h_row], gx1[h_row]
+
+            still_open = []
+            for oc in open_cells:
+                if ((hx0 <= oc['x1'] - elem_scan_tol) & (hx1 >= oc['x0'] + elem_scan_tol)).any():
+                    if new_cell := close_cell(oc, y0_h_elem):
+                        cells.append(new_cell)
+                else:
+                    still_open.append(oc)
             open_cells = still_open
-            cells.extend(new_cells)
 
         if steps:  # return additional debug information
             self._debug["open_cells"] = pd.DataFrame(open_cells)
             self._debug["open_cells"]['y1'] = self.bbox[y1]
-            return pd.DataFrame(cells)
-        else:
-            return pd.DataFrame(cells)
+        return pd.DataFrame(cells)
 
-    @functools.lru_cache()
     def convert_cells_to_df(self) -> typing.Tuple[pd.DataFrame, typing.Tuple]:
+        """convert the detected cells into a table (see _convert_cells_to_df), the result gets cached"""
+        if "convert_cells_to_df" not in self._cache:
+            self._cache["convert_cells_to_df"] = self._convert_cells_to_df()
+        return self._cache["convert_cells_to_df"]
+
+    def _convert_cells_to_df(self) -> typing.Tuple[pd.DataFrame, typing.Tuple]:
         """
         TODO: make the algorithm work with non-graphical tables as well by searching for rows/columns/cells
               using textboxes only.
@@ -831,6 +771,39 @@ class TableCandidateAreasExtractor(Extractor):
             text_box_elements,
             filename=None
     ):
+        # detect table areas page-wise
+        box_levels: dict[int, list[pd.DataFrame]] = {}
+        table_candidates: list[Table] = []
+        for p in graphic_elements.p_num.unique():
+            candidates, box_levels[p] = self.page_candidates(
+                page=p,
+                graphic_elements=graphic_elements[graphic_elements["p_num"] == p],
+                line_elements=line_elements[line_elements["p_num"] == p],
+                page_bbox=pages_bbox[p],
+                text_box_elements=text_box_elements.loc[p],
+                filename=filename
+            )
+            table_candidates.extend(candidates)
+
+        return dict(
+            table_candidates=table_candidates,
+            box_levels=box_levels
+        )
+
+    def page_candidates(
+            self,
+            page: int,
+            graphic_elements: pd.DataFrame,
+            line_elements: pd.DataFrame,
+            page_bbox,
+            text_box_elements: pd.DataFrame,
+            filename=None
+    ) -> tuple[list["Table"], list[pd.DataFrame]]:
+        """
+        detect table candidates on a single page. All elements are expected
+        to belong to *page*. This makes it possible to process
+        documents page-by-page (see pdf_utils.PDFPageStreamer).
+        """
         # get minimum length for lines by searching for
         # the minimum height/width of a text box
         # we do this, because we assume that graphical elements should be at least this
@@ -840,8 +813,6 @@ class TableCandidateAreasExtractor(Extractor):
         min_size = 5.0  # minimum size of a graphics element
         margin = 20  # margin of the page
         max_area_page_ratio = 0.4  # maximum area on a page to occupy by a graphics element
-        pages = graphic_elements.p_num.unique()
-        ge = graphic_elements
         # we keep distance_threshold constant as the same effect can be gained
         # through tbe.area_detection_params but a lot more fine-grained as
         # it directly controls the sensitivity of the distance function
@@ -850,53 +821,51 @@ class TableCandidateAreasExtractor(Extractor):
         # merge everything with a distance of less than 10..
         distance_threshold = 10.0  # for table area candidates (TODO: parameterize?)
 
-        fge = {}
-        # detect table areas page-wise
-        box_levels: dict[int, list[pd.DataFrame]] = {}
-        table_candidates: list[Table] = []
-        for p in pages:
-            tbe = text_box_elements.loc[p]
-            min_elem_x = max(tbe.w.min(), min_size)
-            min_elem_y = max(tbe.h.min(), min_size)
-            page_bbox = b = pages_bbox[p]
-            page_area = b[2] * b[3]  # we can do this because the bounding box is always (0,0) at lower left
-            df_ge = filter_out_small_graphics_elements(
-                ge=ge[ge["p_num"] == p].copy(), max_area_page_ratio=max_area_page_ratio,
-                page_area=page_area, margin=margin,
-                min_elem_x=min_elem_x, min_elem_y=min_elem_y,
-                page_bbox=page_bbox
-            )
-            df_le = line_elements[line_elements["p_num"] == p]
-            # TODO: make TableExtractionParameters configurable in document
-            table_areas, box_levels[p] = detect_table_area_candidates(
-                self._tbe,
+        tbe = text_box_elements
+        min_elem_x = max(tbe.w.min(), min_size)
+        min_elem_y = max(tbe.h.min(), min_size)
+        b = page_bbox
+        page_area = b[2] * b[3]  # we can do this because the bounding box is always (0,0) at lower left
+        df_ge = filter_out_small_graphics_elements(
+            ge=graphic_elements.copy(), max_area_page_ratio=max_area_page_ratio,
+            page_area=page_area, margin=margin,
+            min_elem_x=min_elem_x, min_elem_y=min_elem_y,
+            page_bbox=page_bbox
+        )
+        df_le = line_elements
+        # spatial indices get built once per page and are shared by all table candidates
+        le_index = gu.BoxIndex(df_le[box_cols].values)
+        ge_index = gu.BoxIndex(df_ge[box_cols].values)
+        # TODO: make TableExtractionParameters configurable in document
+        table_areas, box_levels = detect_table_area_candidates(
+            self._tbe,
+            df_le, df_ge,
+            distance_threshold,
+            le_index=le_index
+        )
+        _table = (
+            Table(
                 df_le, df_ge,
-                distance_threshold
-            )
-            _table = (
-                Table(
-                    df_le, df_ge,
-                    initial_area=row[box_cols],
-                    page_bbox=page_bbox, page=p, file_name=filename
-                ) for _, row in table_areas.iterrows()
-            )
-            table_candidates.extend(t for t in _table if not t.df_le.empty)
-
-        return dict(
-            table_candidates=table_candidates,
-            box_levels=box_levels
+                initial_area=row[box_cols],
+                page_bbox=page_bbox, page=page, file_name=filename,
+                le_index=le_index, ge_index=ge_index
+            ) for _, row in table_areas.iterrows()
         )
+        return [t for t in _table if not t.df_le.empty], box_levels
 
 
 def detect_table_area_candidates(
         tbe: TableExtractionParameters,
         df_le, df_ge,
-        distance_threshold: float
+        distance_threshold: float,
+        le_index: gu.BoxIndex = None
 ):
     """
     Detect tables from elements such as textboxes & graphical elements.
     the function expects a range of parameters which need to be tuned.
 
+    le_index: optional spatial index of df_le (gets calculated if not given)
+
     TODO: sort out non-table area regions after every iteration and speed up subsequent
           table search iterations this way.. But optimize this on a recall-basis
           in order to make sure we don't sort out any valid tables...
@@ -918,14 +887,13 @@ def detect_table_area_candidates(
         raise ValueError("no area_detection_distance_func_params defined!")
     if len(boxes) > 1:  # merge boxes to table areas..
         for level, param_level in enumerate(tbe.area_detection_distance_func_params):
-            x = gu.calc_pairwise_matrix(
-                gu.pairwise_weighted_distance_combination, boxes.values, diag=0,
+            boxes["groups"], dist_m = gu.distance_cluster_sparse(
+                boxes.values,
+                gu.pairwise_weighted_distance_combination,
+                distance_threshold=distance_threshold,
+                cutoff=gu.weighted_distance_cutoff(param_level, distance_threshold),
                 parameter_list=param_level
             )
-
-            boxes["groups"], dist_m = gu.distance_cluster(
-                distance_matrix=x, distance_threshold=distance_threshold
-            )
             # create new column with the type of group (hb,hm,ht,vb,vm,vt) and their labels
             boxes = gu.merge_bbox_groups(boxes, "groups")
             box_levels.append(boxes)
@@ -944,7 +912,9 @@ def detect_table_area_candidates(
     # filter our empty groups
     # TODO: right now, we don't really know what would be a good filter...
     #       maybe do this by using an optimization approach
-    text_cell_num = boxes[box_cols].apply(lambda x: len(boundarybox_intersection_query(bbs=df_le, bbox=x)), axis=1)
+    if le_index is None:
+        le_index = gu.BoxIndex(df_le[box_cols].values if not df_le.empty else np.empty((0, 4)))
+    text_cell_num = pd.Series(le_index.count_intersecting(boxes[box_cols].values, tol=1.0), index=boxes.index)
     boxes[text_cell_num > 0].copy()
     table_groups: pd.DataFrame = _filter_boxes(
         boxes,
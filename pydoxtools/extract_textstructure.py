@@ -8,11 +8,13 @@ from pdfminer.layout import LTChar, LTTextLineVertical
 from sklearn.ensemble import IsolationForest
 
 from pydoxtools import document_base
+from pydoxtools.element_store import ElementStore, StoredChar
 
 
 def _line2txt(LTOBJ: typing.Iterable):
     """
-    extract text from pdfiner.six lineobj including size hints
+    extract text from pdfiner.six lineobj including size hints.
+    Also works with element_store.StoredLine objects.
 
     TODO: speedup using cython/nuitka/numba
     """
@@ -21,9 +23,9 @@ def _line2txt(LTOBJ: typing.Iterable):
     for i, ch in enumerate(LTOBJ):
         newtxt = ""
         sizehint = ""
-        if isinstance(ch, pdfminer.layout.LTText):
+        if isinstance(ch, (pdfminer.layout.LTText, StoredChar)):
             newtxt = ch.get_text()
-        if isinstance(ch, pdfminer.layout.LTChar):
+        if isinstance(ch, pdfminer.layout.LTChar) or (isinstance(ch, StoredChar) and ch.is_char):
             newsize = ch.size
             if i > 0:
                 # TODO: use an iterative function here...
@@ -69,8 +71,10 @@ class DocumentElementFilter(document_base.Extractor):
         super().__init__()
         self.element_type = element_type
 
-    def __call__(self, elements: pd.DataFrame):
-        df = elements.loc[elements["type"] == self.element_type].copy()
+    def __call__(self, elements: pd.DataFrame | ElementStore):
+        if isinstance(elements, ElementStore):
+            return elements.view(element_type=self.element_type).to_frame()
+        df = elements.loc[elements["type"] == self.element_type]
         return df
 
 
@@ -147,19 +151,20 @@ class TitleExtractor(document_base.Extractor):
         # TODO: extract the necessary features that we need here "on-the-fly" from
         #       LTLineObj
         # extract more features for every line
-        dfl = df_le
         # get font with largest size to characterize line
         # TODO: this can probably be made better..  (e.g. only take the font of the "majority" content)
-        dfl[['font', 'size', 'color']] = dfl.font_infos.apply(
+        fonts = df_le.font_infos.apply(
             lambda x: pd.Series(asdict(max(x, key=operator.attrgetter("size"))))
         )
+        # we don't modify df_le here as it is shared with other extractors
+        dfl = df_le.assign(font=fonts["name"], size=fonts["size"], color=fonts["color"])
 
         # generate some more features
         dfl['text'] = dfl.rawtext.str.strip()
         dfl = dfl.loc[dfl.text.str.len() > 0].copy()
         dfl['length'] = dfl.text.str.len()
         dfl['wordcount'] = dfl.text.str.split().apply(len)
-        dfl['vertical'] = dfl.lineobj.apply(lambda x: isinstance(x, LTTextLineVertical))
+        dfl['vertical'] = dfl.lineobj.apply(lambda x: isinstance(x, LTTextLineVertical) or getattr(x, "vertical", False))
 
         dfl = dfl.join(pd.get_dummies(dfl.font, prefix="font"))
         dfl = dfl.join(pd.get_dummies(dfl.font, prefix="color"))
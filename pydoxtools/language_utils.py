@@ -0,0 +1,99 @@
+"""
+Language detection on bounded text samples.
+
+langdetect gets slower the more text it has to analyze and is non-deterministic
+by default. Here we only analyze a fixed number of characters sampled from text boxes
+spread over the whole document and use a fixed seed. This makes detection results
+reproducible and the cost independent of the document size.
+"""
+
+import logging
+
+import langdetect.lang_detect_exception
+import numpy as np
+from langdetect import detector_factory
+
+logger = logging.getLogger(__name__)
+
+
+def _create_detector(seed: int):
+    detector_factory.init_factory()  # loads the language profiles only once
+    detector = detector_factory._factory.create()
+    detector.seed = seed
+    return detector
+
+
+def sample_text(text_boxes: list[str], max_chars: int = 2000, min_box_len: int = 20) -> str:
+    """
+    take a sample of at most max_chars characters from text boxes which are evenly
+    spread over the document. Very short boxes (e.g. page numbers, table cells)
+    are skipped if there are longer ones.
+    """
+    boxes = [b.strip() for b in text_boxes if b and b.strip()]
+    boxes = [b for b in boxes if len(b) >= min_box_len] or boxes
+    if sum(len(b) + 1 for b in boxes) <= max_chars:
+        return "\n".join(boxes)
+    # take samples with an equal share of characters (at least 10 samples for long boxes)
+    per_box = max(min_box_len, max_chars // 10)
+    mean_len = sum(len(b) for b in boxes) // len(boxes) + 1
+    n = max(1, min(len(boxes), max_chars // min(per_box, mean_len)))
+    idx = np.unique(np.linspace(0, len(boxes) - 1, n).round().astype(int))
+    return "\n".join(boxes[i][:per_box] for i in idx)[:max_chars]
+
+
+def _as_boxes(text: str | list[str]) -> list[str]:
+    return text.split("\n") if isinstance(text, str) else list(text)
+
+
+def detect_language(
+        text: str | list[str], max_chars: int = 2000, seed: int = 0, default: str = "unknown"
+) -> str:
+    """
+    detect the language of a text (or list of text boxes) from a sample of at most max_chars
+    characters. Returns *default* if no language could be detected.
+    """
+    sample = sample_text(_as_boxes(text), max_chars=max_chars)
+    if not sample:
+        return default
+    detector = _create_detector(seed)
+    detector.append(sample)
+    try:
+        return detector.detect()
+    except langdetect.lang_detect_exception.LangDetectException:
+        return default
+
+
+def detect_section_languages(
+        text: str | list[str], section_chars: int = 5000, max_sections: int = 20,
+        max_chars: int = 1000, seed: int = 0
+) -> list[dict]:
+    """
+    detect the languages of consecutive sections of a document.
+
+    Text boxes get grouped into sections of roughly section_chars characters
+    (but no more than max_sections sections) and a sample of max_chars characters
+    of each section is analyzed. Neighbouring sections with the same language get merged.
+
+    returns a list of dict(start=..., end=..., language=...) where start & end
+    are text box indices (end is exclusive).
+    """
+    boxes = _as_boxes(text)
+    if not boxes:
+        return []
+    total = sum(len(b) for b in boxes)
+    section_chars = max(section_chars, total // max_sections + 1)
+    # box indices where a new section begins
+    cum = np.cumsum([len(b) for b in boxes])
+    starts = np.unique(np.searchsorted(cum, np.arange(0, total, section_chars), side="right"))
+    # the first section always starts with the first box (also if all boxes are empty)
+    starts = np.r_[0, starts[(starts > 0) & (starts < len(boxes))]]
+    bounds = list(zip(starts, list(starts[1:]) + [len(boxes)]))
+
+    sections = []
+    for start, end in bounds:
+        lang = detect_language(boxes[start:end], max_chars=max_chars, seed=seed)
+        if sections and sections[-1]["language"] == lang:
+            sections[-1]["end"] = int(end)
+        else:
+            sections.append(dict(start=int(start), end=int(end), language=lang))
+    return sections
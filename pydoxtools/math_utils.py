@@ -1,4 +1,5 @@
 import numpy as np
+import scipy.sparse
 import sklearn as sk
 
 
@@ -19,4 +20,31 @@ def cos_compare(x, y):
     return sk.metrics.pairwise.cosine_similarity(x, y)
 
 
+def pagerank(adjacency: scipy.sparse.spmatrix, alpha=0.85, max_iter=100, tol=1.0e-6) -> np.ndarray:
+    """
+    calculate the pagerank of the nodes of a weighted, directed graph given as a
+    sparse adjacency matrix (adjacency[i, j] = weight of the edge i -> j)
+    using power iteration. This gives the same results as networkx.pagerank.
+    """
+    A = scipy.sparse.csr_matrix(adjacency, dtype=float)
+    n = A.shape[0]
+    if n == 0:
+        return np.empty(0)
+    out_weight = np.asarray(A.sum(axis=1)).ravel()
+    nonzero = out_weight != 0
+    inv_weight = np.zeros(n)
+    inv_weight[nonzero] = 1.0 / out_weight[nonzero]
+    # row-normalized transition matrix
+    P = scipy.sparse.diags(inv_weight) @ A
+    dangling = ~nonzero
+
+    x = np.full(n, 1.0 / n)
+    for _ in range(max_iter):
+        x_last = x
+        x = alpha * (x @ P + x[dangling].sum() / n) + (1 - alpha) / n
+        if np.abs(x - x_last).sum() < n * tol:
+            return x
+    raise RuntimeError(f"pagerank didn't converge in {max_iter} iterations")
+
+
 __private_value = 5
@@ -0,0 +1,272 @@
+"""
+A central registry for machine learning models (spacy pipelines, transformers,
+classifiers etc...) which keeps track of the memory they use.
+
+Models get loaded lazily through loader functions that are registered for
+a "kind" of model. Loaded models are kept in memory until the configured
+memory budget (settings.PDXT_MODEL_MEMORY_BUDGET) is exceeded. Then the least
+recently used models which are not in use anymore get evicted:
+
+    from pydoxtools.model_registry import model_registry
+
+    model_registry.register("spacy", load_spacy_model)
+
+    # make sure the model doesn't get evicted while we are working with it:
+    with model_registry.acquire("spacy", "en_core_web_md") as nlp:
+        ...
+    # models returned by "get" should only be used right away and never be kept
+    # as the registry can't keep track of them:
+    n_pipes = len(model_registry.get("spacy", "en_core_web_md").pipe_names)
+
+Long-running workers can preload the models they need in order to
+have a predictable resident set from the start:
+
+    model_registry.preload([("spacy", "en_core_web_md"), ("qam", "deepset/roberta-base-squad2")])
+"""
+
+import collections
+import contextlib
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Hashable, Iterable
+
+from pydoxtools.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _rss() -> int:
+    """resident set size of the current process in bytes (0 if not available)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return 0
+
+
+def estimate_model_size(model: Any, _seen: set = None) -> int:
+    """
+    estimate the memory which is occupied by the weights of a model in bytes.
+
+    This works for torch modules, thinc/spacy pipelines, numpy arrays and
+    containers/wrappers of those (e.g. transformers pipelines or NLPContext).
+    Everything else is counted as 0.
+    """
+    _seen = set() if _seen is None else _seen
+    if model is None or id(model) in _seen:
+        return 0
+    _seen.add(id(model))
+
+    if hasattr(model, "parameters") and hasattr(model, "buffers"):  # torch.nn.Module
+        tensors = {id(t): t for t in (*model.parameters(), *model.buffers())}
+        return sum(t.nelement() * t.element_size() for t in tensors.values())
+    if hasattr(model, "nbytes") and hasattr(model, "dtype"):  # numpy/cupy arrays
+        return int(model.nbytes)
+    if isinstance(model, (str, bytes, int, float)):
+        return 0
+    if isinstance(model, dict):
+        return sum(estimate_model_size(v, _seen) for v in model.values())
+    if isinstance(model, (list, tuple, set)):
+        return sum(estimate_model_size(v, _seen) for v in model)
+    if hasattr(model, "pipeline") and hasattr(model, "vocab"):  # spacy Language
+        size = sum(estimate_model_size(getattr(proc, "model", None), _seen)
+                   for _, proc in model.pipeline)
+        vectors = getattr(model.vocab, "vectors", None)
+        return size + estimate_model_size(getattr(vectors, "data", None), _seen)
+    if hasattr(model, "walk") and hasattr(model, "param_names"):  # thinc Model
+        size = 0
+        for node in model.walk():
+            for name in node.param_names:
+                if node.has_param(name):
+                    size += estimate_model_size(node.get_param(name), _seen)
+            for shim in getattr(node, "shims", []):  # e.g. wrapped pytorch models
+                size += estimate_model_size(getattr(shim, "_model", None), _seen)
+        return size
+    # wrappers such as transformers pipelines or NLPContext
+    return sum(estimate_model_size(getattr(model, attr, None), _seen)
+               for attr in ("model", "tokenizer"))
+
+
+@dataclass
+class ModelEntry:
+    kind: str
+    key: Hashable
+    model: Any
+    size: int  # estimated memory usage in bytes
+    load_time: float  # seconds
+    refcount: int = 0
+
+
+@dataclass
+class _ModelKind:
+    loader: Callable[[Hashable], Any]
+    size_func: Callable[[Any], int] | None = None
+    warmup: Callable[[Any], Any] | None = None
+
+
+class ModelRegistry:
+    """
+    Loads, caches and evicts models.
+
+    memory_budget: maximum memory in bytes which should be used by the
+        models of this registry. Models which are currently acquired
+        don't get evicted, so the budget can be exceeded temporarily.
+    """
+
+    def __init__(self, memory_budget: int = None):
+        self._memory_budget = memory_budget if memory_budget is not None \
+            else settings.PDXT_MODEL_MEMORY_BUDGET
+        self._kinds: dict[str, _ModelKind] = {}
+        # ordered from least recently used to most recently used
+        self._entries: collections.OrderedDict[tuple[str, Hashable], ModelEntry] = collections.OrderedDict()
+        self._lock = threading.RLock()
+        self._loading: dict[tuple[str, Hashable], threading.Lock] = {}
+
+    def register(
+            self,
+            kind: str,
+            loader: Callable[[Hashable], Any],
+            size_func: Callable[[Any], int] = None,
+            warmup: Callable[[Any], Any] = None
+    ):
+        """
+        register a loader function for a kind of model.
+
+        loader: gets called with the model key and returns the model
+        size_func: optional function which calculates the memory usage of a model.
+            Defaults to estimate_model_size (with a fallback to the increase
+            of the process memory during loading).
+        warmup: optional function which gets called with the model right after
+            it was loaded, e.g. to run a dummy inference which initializes
+            lazily created buffers.
+        """
+        with self._lock:
+            self._kinds[kind] = _ModelKind(loader=loader, size_func=size_func, warmup=warmup)
+
+    @property
+    def memory_budget(self) -> int:
+        return self._memory_budget
+
+    @memory_budget.setter
+    def memory_budget(self, value: int):
+        self._memory_budget = value
+        self._evict()
+
+    @property
+    def memory_usage(self) -> int:
+        """estimated memory in bytes of all currently loaded models"""
+        with self._lock:
+            return sum(e.size for e in self._entries.values())
+
+    def loaded(self) -> list[ModelEntry]:
+        """currently loaded models from least to most recently used"""
+        with self._lock:
+            return list(self._entries.values())
+
+    def _load(self, kind: str, key: Hashable) -> ModelEntry:
+        try:
+            model_kind = self._kinds[kind]
+        except KeyError:
+            raise KeyError(f"no loader registered for models of kind '{kind}'") from None
+
+        logger.info(f"loading {kind} model: {key}")
+        rss_before, start = _rss(), time.monotonic()
+        model = model_kind.loader(key)
+        if model_kind.warmup:
+            model_kind.warmup(model)
+        load_time = time.monotonic() - start
+        size = (model_kind.size_func or estimate_model_size)(model)
+        if not size:
+            size = max(_rss() - rss_before, 0)
+        logger.info(f"loaded {kind} model {key} in {load_time:.1f}s, ~{size / 1024 ** 2:.0f}MB")
+        return ModelEntry(kind=kind, key=key, model=model, size=size, load_time=load_time)
+
+    def _get_entry(self, kind: str, key: Hashable, acquire: bool = False) -> ModelEntry:
+        k = (kind, key)
+        with self._lock:
+            if entry := self._entries.get(k):
+                self._entries.move_to_end(k)
+                entry.refcount += acquire
+                return entry
+            loading_lock = self._loading.setdefault(k, threading.Lock())
+
+        # load outside of the global lock, so that other models can be used
+        # in the meantime. The per-model lock makes sure we only load it once.
+        with loading_lock:
+            with self._lock:
+                if entry := self._entries.get(k):
+                    self._entries.move_to_end(k)
+                    entry.refcount += acquire
+                    return entry
+            entry = self._load(kind, key)
+            with self._lock:
+                self._entries[k] = entry
+                self._loading.pop(k, None)
+                # make sure our new model doesn't get evicted right away
+                entry.refcount += 1
+                self._evict()
+                entry.refcount -= 1 - acquire
+        return entry
+
+    def get(self, kind: str, key: Hashable) -> Any:
+        """
+        return a model and load it if necessary.
+
+        The registry doesn't know about references to the returned model, so it can
+        get evicted while it is still in use. The model then stays in memory without being
+        accounted for and gets loaded a second time by the next call. Only use the result
+        right away and don't keep it (e.g. in a closure or an extractor output).
+        Use "acquire" for everything else.
+        """
+        return self._get_entry(kind, key).model
+
+    @contextlib.contextmanager
+    def acquire(self, kind: str, key: Hashable):
+        """
+        context manager which returns a model and makes sure it doesn't
+        get evicted as long as the context is active.
+        """
+        entry = self._get_entry(kind, key, acquire=True)
+        try:
+            yield entry.model
+        finally:
+            with self._lock:
+                entry.refcount -= 1
+                self._evict()
+
+    def preload(self, models: Iterable[tuple[str, Hashable]]):
+        """load a list of (kind, key) models in advance"""
+        for kind, key in models:
+            self.get(kind, key)
+
+    def _evict(self):
+        with self._lock:
+            usage = self.memory_usage
+            for k, entry in list(self._entries.items()):
+                if usage <= self._memory_budget:
+                    break
+                if entry.refcount > 0:
+                    continue
+                logger.info(f"evicting {entry.kind} model {entry.key} (~{entry.size / 1024 ** 2:.0f}MB)")
+                del self._entries[k]
+                usage -= entry.size
+            if usage > self._memory_budget:
+                logger.warning(f"models use ~{usage / 1024 ** 2:.0f}MB which is more than the "
+                               f"memory budget of {self._memory_budget / 1024 ** 2:.0f}MB")
+
+    def evict(self, kind: str = None, key: Hashable = None):
+        """
+        remove models from the registry which aren't in use. Models can
+        be selected by kind and key. Without arguments all models get removed.
+        """
+        with self._lock:
+            for k, entry in list(self._entries.items()):
+                if (kind is None or entry.kind == kind) and (key is None or entry.key == key) \
+                        and entry.refcount == 0:
+                    del self._entries[k]
+
+
+model_registry = ModelRegistry()
@@ -15,8 +15,10 @@ TODO: move the inference parts into the "document" class in order to make them d
       agnostic
 """
 
+import collections
 import functools
 import logging
+import threading
 from difflib import SequenceMatcher
 from typing import Any
 
@@ -33,6 +35,7 @@ from transformers import AutoTokenizer, AutoModel, AutoModelForQuestionAnswering
 from urlextract import URLExtract
 
 from pydoxtools import html_utils
+from pydoxtools.model_registry import model_registry
 from pydoxtools.settings import settings
 
 logger = logging.getLogger(__name__)
@@ -111,6 +114,51 @@ def tokenize_windows(txt, tokenizer, win_len=500, overlap=50,
         return tok_wins_ids, toktxt
 
 
+
+class TextWindows:
+    """
+    Tokenizes a text only once and creates token id windows
+    (the same as tokenize_windows with add_special_tokens=False)
+    from the cached tokens. This way, a text can be split
+    into windows of different lengths (e.g. for questions of different lengths)
+    without re-tokenizing it.
+
+    max_cached: maximum number of different window configurations which are kept in memory
+    """
+
+    def __init__(self, txt: str, tokenizer, max_cached: int = 16):
+        self._txt = txt
+        self._tokenizer = tokenizer
+        self._max_cached = max_cached
+        self._token_ids = None
+        self._windows: collections.OrderedDict[tuple, list[list[int]]] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def token_ids(self) -> list[int]:
+        if self._token_ids is None:
+            toktxt = self._tokenizer.tokenize(self._txt)
+            self._token_ids = self._tokenizer.convert_tokens_to_ids(toktxt)
+        return self._token_ids
+
+    def windows(self, win_len=500, overlap=50, max_len=510) -> list[list[int]]:
+        key = (win_len, overlap, max_len)
+        with self._lock:
+            if (wins := self._windows.get(key)) is not None:
+                self._windows.move_to_end(key)
+                return wins
+            tk_num = len(self.token_ids)
+            if tk_num < max_len:
+                wins = [self._tokenizer.encode(self._txt)[1:-1]]
+            else:
+                step = int(win_len - overlap)
+                wins = [self.token_ids[idx:idx + win_len] for idx in range(0, tk_num, step)]
+            self._windows[key] = wins
+            if len(self._windows) > self._max_cached:
+                self._windows.popitem(last=False)
+            return wins
+
+
 def transform_to_contextual_embeddings(input_ids_t, model, tokenizer=None, lang=False):
     # for one sentence all ids are "1" for two, the first sentence gets "0"
     input_ids_t = torch.tensor([input_ids_t]).to(device)
@@ -312,8 +360,8 @@ def get_bert_vocabulary():
 
 def reset_models():
     """clear models from memory"""
-    load_models.cache_clear()
-    load_tokenizer.cache_clear()
+    model_registry.evict("transformer")
+    model_registry.evict("tokenizer")
 
 
 def veclengths(x):
@@ -593,16 +641,12 @@ class NLPContext(BaseModel):
         arbitrary_types_allowed = True
 
 
-@functools.lru_cache(maxsize=32)
-def load_tokenizer(model_name='distilbert-base-multilingual-cased'):
-    logger.info("load_tokenizer")
+def _load_tokenizer(model_name: str):
     tokenizer = AutoTokenizer.from_pretrained(model_name)
     return tokenizer, get_vocabulary()
 
 
-# TODO: merge this function with
-@functools.lru_cache()
-def load_models(model_name: str = 'distilbert-base-multilingual-cased'):
+def _load_models(model_name: str):
     logger.info(f"load model on device: {device}")
     tokenizer = transformers.AutoTokenizer.from_pretrained(model_name)
     # model = AutoModelForQuestionAnswering.from_pretrained(model_name, output_hidden_states=True)
@@ -612,13 +656,28 @@ def load_models(model_name: str = 'distilbert-base-multilingual-cased'):
     return model, tokenizer
 
 
-@functools.lru_cache()
-def QandAmodels(model_id: str):
+def _load_qam_models(model_id: str):
     # TODO: only load model "id" and use that id
     #        with transformers AutoModel etc...
-    logger.info(f"loading Q & A model and tokenizer {model_id}")
     # model, tokenizer = load_models(model_id)
     tokenizer = AutoTokenizer.from_pretrained(model_id)
     model = AutoModelForQuestionAnswering.from_pretrained(model_id)
-    logger.info(f"finished loading Q & A models... {model_id}")
     return NLPContext(tokenizer=tokenizer, model=model)
+
+
+model_registry.register("tokenizer", _load_tokenizer)
+model_registry.register("transformer", _load_models)
+model_registry.register("qam", _load_qam_models)
+
+
+def load_tokenizer(model_name='distilbert-base-multilingual-cased'):
+    return model_registry.get("tokenizer", model_name)
+
+
+# TODO: merge this function with
+def load_models(model_name: str = 'distilbert-base-multilingual-cased'):
+    return model_registry.get("transformer", model_name)
+
+
+def QandAmodels(model_id: str):
+    return model_registry.get("qam", model_id)
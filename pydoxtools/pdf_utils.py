@@ -10,9 +10,11 @@ Created on Mon Dec 16 12:07:52 2019
 # 
 
 
+import concurrent.futures
 import functools
 import io
 import logging
+import typing
 from pathlib import Path
 
 import pandas as pd
@@ -27,9 +29,12 @@ from pdfminer.layout import LAParams
 from pdfminer.layout import LTChar, LTCurve, LTFigure, LTTextLine
 from pdfminer.layout import LTTextContainer
 from pdfminer.pdfinterp import resolve1
+from pdfminer.pdfpage import PDFPage
 from pdfminer.pdfparser import PDFParser
 
-from pydoxtools import document_base, list_utils
+from pydoxtools import document_base, element_store, list_utils
+from pydoxtools.extract_tables import TableCandidateAreasExtractor
+from pydoxtools.extract_textstructure import TextBoxElementExtractor
 
 logger = logging.getLogger(__name__)
 
@@ -169,11 +174,15 @@ class PDFFileLoader(document_base.Extractor):
     def __init__(
             self,
             laparams=LAParams(),
+            workers: int = None,
             **kwargs
     ):
         """
         :param laparams: An LAParams object from pdfminer.layout. If None, uses
         some default settings that often work well.
+        :param workers: parse pages in parallel using this number of worker processes.
+            The page range gets split into contiguous chunks (one per worker) and the
+            results are merged in page order, so they are the same as in the serial case.
 
         LAParams(
            line_overlap=0.5,  # 0.5, are chars in the same line?
@@ -187,16 +196,22 @@ class PDFFileLoader(document_base.Extractor):
         """
         super().__init__()
         self._laparams = laparams
+        self._workers = workers
 
-    def __call__(self, fobj: bytes, page_numbers=None, max_pages=0):
+    def __call__(self, fobj: bytes, page_numbers=None, max_pages=0, workers: int = None):
+        workers = workers or self._workers
         doc_obj = io.BytesIO(fobj)
-        docelements, extracted_page_numbers, pages_bbox = self.extract_pdf_elements(
-            doc_obj, page_numbers, max_pages)
         meta = meta_infos(doc_obj)
+        if workers and workers > 1:
+            store, extracted_page_numbers, pages_bbox = self.extract_pdf_elements_parallel(
+                fobj, page_numbers, max_pages, workers)
+        else:
+            store, extracted_page_numbers, pages_bbox = self.extract_pdf_elements(
+                doc_obj, page_numbers, max_pages)
 
         return dict(
             meta=meta,
-            elements=docelements,
+            element_store=store,
             pages=extracted_page_numbers,
             pages_bbox=pages_bbox
         )
@@ -204,13 +219,15 @@ class PDFFileLoader(document_base.Extractor):
     def extract_pdf_elements(self, fobj, page_numbers, max_pages):
         """
         extracts all text lines from a pdf and annotates them with various features.
+        The elements get stored page by page in a compact element_store.ElementStore, so
+        that the pdfminer objects of a page can be released as soon as the page is finished.
         TODO: make use of other pdf-pobjects as well (images, figures, drawings  etc...)
         TODO: check for already extracted pages and only extract missing ones...
         TODO: implement our own algorithm in order to identify textboxes...  the pdfminer.six
               one has problems with boxes when there is a line with a right- and a left justified
               text in the same line..  in most cases they should be split into two boxes...
         """
-        docelements = []  # should be of type list[dict]
+        builder = element_store.ElementStoreBuilder()
         # TODO: automatically classify text pieces already at this point here for example
         #       to find addresses, hint to tables etc... the rest of the algorithm would get a lot
         #       more precise this way...
@@ -218,73 +235,206 @@ class PDFFileLoader(document_base.Extractor):
         pages_bbox = {}
 
         # iterate through pages
+        for pageid, page_bbox, page_records in self.iter_pages(fobj, page_numbers, max_pages):
+            extracted_page_numbers.add(pageid)
+            pages_bbox[pageid] = page_bbox
+            builder.add_records(page_records)
+
+        # TODO: validate elements using document_base.DocumentElement
+        return builder.build(), extracted_page_numbers, pages_bbox
+
+    def extract_pdf_elements_parallel(self, fobj: bytes, page_numbers, max_pages, workers: int):
+        """
+        same as extract_pdf_elements, but the pages get parsed by a pool of worker processes.
+
+        Every worker parses a contiguous chunk of pages and returns a compact
+        ElementStore without any pdfminer objects. pdfminer numbers the pages of each run
+        starting from 1, so we have to add the offset of the chunk in order to get
+        the same page numbers as in a serial run.
+        """
+        # the pages which pdfminer selects in a serial run
+        page_ids = [page.pageid for page in PDFPage.get_pages(io.BytesIO(fobj))]
+        selected_ids = {page.pageid for page in PDFPage.get_pages(io.BytesIO(fobj), page_numbers, max_pages)}
+        selected = [pageno for pageno, pageid in enumerate(page_ids) if pageid in selected_ids]
+        if workers < 2 or len(selected) < 2:
+            return self.extract_pdf_elements(io.BytesIO(fobj), page_numbers, max_pages)
+
+        chunksize = -(-len(selected) // workers)  # ceil division
+        chunks = [(offset, selected[offset:offset + chunksize])
+                  for offset in range(0, len(selected), chunksize)]
+
+        stores = []
+        extracted_page_numbers = set()
+        pages_bbox = {}
+        with concurrent.futures.ProcessPoolExecutor(min(workers, len(chunks))) as pool:
+            futures = [pool.submit(_extract_page_chunk, fobj, self._laparams, pages, offset)
+                       for offset, pages in chunks]
+            # futures are in page order, so we merge the results in page order as well
+            for future in futures:
+                chunk_store, chunk_pages_bbox = future.result()
+                stores.append(chunk_store)
+                extracted_page_numbers.update(chunk_pages_bbox)
+                pages_bbox.update(chunk_pages_bbox)
+
+        return element_store.ElementStore.concat(stores), extracted_page_numbers, pages_bbox
+
+    def iter_pages(
+            self, fobj, page_numbers=None, max_pages=0
+    ) -> typing.Iterator[tuple[int, tuple, list[dict]]]:
+        """
+        lazily extract a pdf page by page.
+
+        yields (page number, page bounding box, element records of the page)
+        """
         for page_layout in extract_pages(fobj,
                                          laparams=self._laparams,
                                          page_numbers=page_numbers,
                                          maxpages=max_pages):
-            extracted_page_numbers.add(page_layout.pageid)
-            pages_bbox[page_layout.pageid] = page_layout.bbox
-            # iterate through all page elements and translate them
-            # TODO: make sure we adhere to a common schema for all file types here...
-            for boxnum, element in enumerate(page_layout):
-                if isinstance(element, LTCurve):  # LTCurve are rectangles AND lines
-                    # docelements should be compatible with document_base.DocumentElement
-                    docelements.append(dict(
-                        type=document_base.ElementType.Graphic,
-                        gobj=element,
-                        linewidth=element.linewidth,
-                        non_stroking_color=element.non_stroking_color,
-                        stroking_color=element.stroking_color,
-                        stroke=element.stroke,
-                        fill=element.fill,
-                        evenodd=element.evenodd,
-                        p_num=page_layout.pageid,
-                        boxnum=boxnum,
-                        x0=element.x0,
-                        y0=element.y0,
-                        x1=element.x1,
-                        y1=element.y1
-                    ))
-                elif isinstance(element, LTTextContainer):
-                    if isinstance(element, LTTextLine):
-                        element = [element]
-                    for linenum, text_line in enumerate(element):
-                        fontset = set()
-                        # TODO: this could be moved somewhere else and probably be made more efficient
-                        for character in text_line:
-                            if isinstance(character, LTChar):
-                                charfont = document_base.Font(
-                                    character.fontname, character.size,
-                                    str(character.graphicstate.ncolor))
-                                fontset.add(charfont)
-                        linetext = text_line.get_text()
-                        # extract metadata
-                        # TODO: move most of these function to a "feature-generation-function"
-                        # which extracts the information directly from the LTTextLine object
-                        docelements.append(dict(
-                            type=document_base.ElementType.Line,
-                            lineobj=text_line,
-                            rawtext=linetext,
-                            font_infos=fontset,
-                            p_num=page_layout.pageid,
-                            linenum=linenum,
-                            boxnum=boxnum,
-                            x0=text_line.x0,
-                            y0=text_line.y0,
-                            x1=text_line.x1,
-                            y1=text_line.y1
-                        ))
-                elif isinstance(element, LTFigure):
-                    # TODO: use pdfminer.six to also group Char in LTFigure
-                    # TODO: extract text from figures as well...
-                    # chars =[e for e in list_utils.flatten(element, max_level=1)):
-                    # list(list_utils.flatten(element, max_level=1))
-                    # txt = "".join(e.get_text() for e in list_utils.flatten(element) if isinstance(e, LTChar))
-                    # es = list(list_utils.flatten(element))
-                    # import pdfminer.converter
-                    pass
-
-        # TODO: validate pandas dataframe using document_base.DocumentElement
-        docelementsframe = pd.DataFrame.from_records(docelements)
-
-        return docelementsframe, extracted_page_numbers, pages_bbox
+            yield page_layout.pageid, page_layout.bbox, page_elements(page_layout)
+
+
+class PDFPageStreamer(document_base.Extractor):
+    """
+    Streaming version of the pdf pipeline.
+
+    Instead of parsing the entire document before anything else can happen,
+    this extractor returns a function which creates a generator. The generator
+    yields the results for each page as soon as the page is finished:
+
+        for page in doc.x("page_stream")():
+            print(page["page"], page["text_box_elements"], page["table_candidates"])
+
+    This way the first results are available very quickly and memory usage
+    is bounded by the size of a page and not by the size of the document.
+    """
+
+    def __init__(self, laparams=LAParams(), table_extraction_params=None):
+        super().__init__()
+        self._loader = PDFFileLoader(laparams=laparams)
+        self._textboxes = TextBoxElementExtractor()
+        self._tables = TableCandidateAreasExtractor(table_extraction_params)
+
+    def __call__(self, fobj: bytes, page_numbers=None, max_pages=0, filename=None):
+        def page_stream() -> typing.Iterator[dict[str, typing.Any]]:
+            pages = self._loader.iter_pages(io.BytesIO(fobj), page_numbers, max_pages)
+            for pageid, page_bbox, page_records in pages:
+                store = element_store.ElementStoreBuilder().add_records(page_records).build()
+                yield self.process_page(pageid, page_bbox, store, filename)
+
+        return page_stream
+
+    def process_page(
+            self, page: int, page_bbox, elements: element_store.ElementStore, filename=None
+    ) -> dict[str, typing.Any]:
+        """run the page-level part of the pdf pipeline on the elements of a single page"""
+        line_elements = elements.view(element_type=document_base.ElementType.Line).to_frame()
+        graphic_elements = elements.view(element_type=document_base.ElementType.Graphic).to_frame()
+        text_box_elements = None
+        if not line_elements.empty:
+            text_box_elements = self._textboxes(line_elements)["text_box_elements"]
+
+        table_candidates, box_levels = [], []
+        if (not graphic_elements.empty) and (text_box_elements is not None) and (not text_box_elements.empty):
+            table_candidates, box_levels = self._tables.page_candidates(
+                page=page,
+                graphic_elements=graphic_elements,
+                line_elements=line_elements,
+                page_bbox=page_bbox,
+                text_box_elements=text_box_elements.loc[page],
+                filename=filename
+            )
+
+        return dict(
+            page=page,
+            page_bbox=page_bbox,
+            element_store=elements,
+            line_elements=line_elements,
+            graphic_elements=graphic_elements,
+            text_box_elements=text_box_elements,
+            table_candidates=table_candidates,
+            table_box_levels=box_levels
+        )
+
+
+def _extract_page_chunk(
+        fobj: bytes, laparams, page_numbers: list[int], offset: int
+) -> tuple[element_store.ElementStore, dict[int, tuple]]:
+    """runs in the worker processes of PDFFileLoader.extract_pdf_elements_parallel"""
+    loader = PDFFileLoader(laparams=laparams)
+    builder = element_store.ElementStoreBuilder()
+    pages_bbox = {}
+    for pageid, page_bbox, page_records in loader.iter_pages(io.BytesIO(fobj), page_numbers):
+        pageid += offset
+        for r in page_records:
+            r["p_num"] = pageid
+        builder.add_records(page_records)
+        pages_bbox[pageid] = page_bbox
+    return builder.build(), pages_bbox
+
+
+def page_elements(page_layout) -> list[dict]:
+    """
+    translate the elements of a pdfminer page layout into records which
+    are compatible with document_base.DocumentElement
+    """
+    records = []
+    # iterate through all page elements and translate them
+    # TODO: make sure we adhere to a common schema for all file types here...
+    for boxnum, element in enumerate(page_layout):
+        if isinstance(element, LTCurve):  # LTCurve are rectangles AND lines
+            # docelements should be compatible with document_base.DocumentElement
+            records.append(dict(
+                type=document_base.ElementType.Graphic,
+                gobj=element,
+                linewidth=element.linewidth,
+                non_stroking_color=element.non_stroking_color,
+                stroking_color=element.stroking_color,
+                stroke=element.stroke,
+                fill=element.fill,
+                evenodd=element.evenodd,
+                p_num=page_layout.pageid,
+                boxnum=boxnum,
+                x0=element.x0,
+                y0=element.y0,
+                x1=element.x1,
+                y1=element.y1
+            ))
+        elif isinstance(element, LTTextContainer):
+            if isinstance(element, LTTextLine):
+                element = [element]
+            for linenum, text_line in enumerate(element):
+                fontset = set()
+                # TODO: this could be moved somewhere else and probably be made more efficient
+                for character in text_line:
+                    if isinstance(character, LTChar):
+                        charfont = document_base.Font(
+                            character.fontname, character.size,
+                            str(character.graphicstate.ncolor))
+                        fontset.add(charfont)
+                linetext = text_line.get_text()
+                # extract metadata
+                # TODO: move most of these function to a "feature-generation-function"
+                # which extracts the information directly from the LTTextLine object
+                records.append(dict(
+                    type=document_base.ElementType.Line,
+                    lineobj=text_line,
+                    rawtext=linetext,
+                    font_infos=fontset,
+                    p_num=page_layout.pageid,
+                    linenum=linenum,
+                    boxnum=boxnum,
+                    x0=text_line.x0,
+                    y0=text_line.y0,
+                    x1=text_line.x1,
+                    y1=text_line.y1
+                ))
+        elif isinstance(element, LTFigure):
+            # TODO: use pdfminer.six to also group Char in LTFigure
+            # TODO: extract text from figures as well...
+            # chars =[e for e in list_utils.flatten(element, max_level=1)):
+            # list(list_utils.flatten(element, max_level=1))
+            # txt = "".join(e.get_text() for e in list_utils.flatten(element) if isinstance(e, LTChar))
+            # es = list(list_utils.flatten(element))
+            # import pdfminer.converter
+            pass
+    return records
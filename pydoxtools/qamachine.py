@@ -6,19 +6,18 @@ from typing import Dict, List, Tuple
 import torch
 
 from pydoxtools.document_base import Extractor
-from pydoxtools.nlp_utils import tokenize_windows, QandAmodels
+from pydoxtools.model_registry import model_registry
+from pydoxtools.nlp_utils import tokenize_windows, QandAmodels, TextWindows
 
 logger = logging.getLogger(__name__)
 
 
-def answer_questions_on_long_text(questions, text, nlp_context) -> Dict[str, List[Tuple[str, float]]]:
-    all_answers = {}
-    for q in questions:
-        answers = long_text_question(
-            q, text, nlp_context.tokenizer, nlp_context.model)
-        all_answers[q] = answers
-
-    return all_answers
+def answer_questions_on_long_text(
+        questions, text, nlp_context, batch_size: int = 16
+) -> Dict[str, List[Tuple[str, float]]]:
+    answers = long_text_questions(
+        questions, text, nlp_context.tokenizer, nlp_context.model, batch_size=batch_size)
+    return dict(zip(questions, answers))
 
 
 # we have functools.lru_cache outside of NLPContext because we would like to
@@ -66,37 +65,86 @@ def get_topk_answers(answer_start_scores, answer_end_scores,
     return answers
 
 
-def long_text_question(question, text, tokenizer, model):
+def question_window_inputs(
+        question, text, tokenizer, text_windows: TextWindows = None
+) -> list[tuple[list[int], list[int]]]:
+    """
+    split text into windows which fit into the model together with the question
+    and return (input_ids, token_type_ids) for every window.
+
+    text_windows can be used to re-use the tokenization of the
+    text for several calls.
+    """
     max_len = 512  # maximum possble input for BERT and other transformers
     q_inputs = tokenizer(question, add_special_tokens=False, return_tensors="pt")
     q_len = q_inputs.input_ids.shape[1]
     max_txt_len = max_len - q_len - 3  # -1, because the [CLS] token from q_len will get truncated
-    win_tokens, win_toktxt = tokenize_windows(
-        text, tokenizer, win_len=max_txt_len, overlap=50, max_len=512,
-        add_special_tokens=False)
+    if text_windows:
+        win_tokens = text_windows.windows(win_len=max_txt_len, overlap=50, max_len=512)
+    else:
+        win_tokens, win_toktxt = tokenize_windows(
+            text, tokenizer, win_len=max_txt_len, overlap=50, max_len=512,
+            add_special_tokens=False)
 
     q_tokens = q_inputs.input_ids[0].tolist()
     q_len = len(q_tokens)
-    answers = []
+    return [([2] + q_tokens + [3] + txt_tokens + [3], [0] * (q_len + 2) + [1] * (len(txt_tokens) + 1))
+            for txt_tokens in win_tokens]
+
+
+def long_text_questions(
+        questions, text, tokenizer, model, batch_size: int = 16, text_windows: TextWindows = None
+) -> list[list[tuple[str, float]]]:
+    """
+    answer several questions on a text which can be longer than the maximum input
+    length of the model.
+
+    All (question, text-window) pairs get packed into padded batches of at most
+    batch_size pairs. The answers of every question are returned in
+    the order of the text windows.
+    """
     # check if model needs type_ids:
     needs_type_ids = 'token_type_ids' in tokenizer("test1", "test2")
-    for i, txt_tokens in enumerate(win_tokens):
-        logger.info(f"run q & a segment #: {i}")
-        input_ids = torch.tensor([[2] + q_tokens + [3] + txt_tokens + [3]])
-        input = dict(
-            input_ids=input_ids,
-            attention_mask=torch.tensor([input_ids.shape[1] * [1]])
-        )
-        if needs_type_ids:
-            input["token_type_ids"] = torch.tensor([[0] * (q_len + 2) + [1] * (len(txt_tokens) + 1)])
-        res = model(**input)
-        answer_start_scores, answer_end_scores = res.start_logits, res.end_logits
-        answers.extend(get_topk_answers(
-            answer_start_scores, answer_end_scores, input_ids[0], 5, tokenizer))
-
+    pad_id = tokenizer.pad_token_id or 0
+    device = getattr(model, "device", "cpu")
+
+    pairs = [(qi, ids, type_ids) for qi, q in enumerate(questions)
+             for ids, type_ids in question_window_inputs(q, text, tokenizer, text_windows)]
+    # sort pairs by length, so that we don't waste computations on padding
+    order = sorted(range(len(pairs)), key=lambda i: len(pairs[i][1]))
+    window_answers = [None] * len(pairs)
+    with torch.inference_mode():
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            logger.info(f"run q & a batch with {len(batch)} segments")
+            max_len = max(len(pairs[i][1]) for i in batch)
+            input_ids = torch.tensor([pairs[i][1] + [pad_id] * (max_len - len(pairs[i][1])) for i in batch])
+            input = dict(
+                input_ids=input_ids,
+                attention_mask=torch.tensor([[1] * len(pairs[i][1]) + [0] * (max_len - len(pairs[i][1]))
+                                             for i in batch])
+            )
+            if needs_type_ids:
+                input["token_type_ids"] = torch.tensor([pairs[i][2] + [0] * (max_len - len(pairs[i][2]))
+                                                        for i in batch])
+            res = model(**{k: v.to(device) for k, v in input.items()})
+            start_logits, end_logits = res.start_logits.cpu(), res.end_logits.cpu()
+            for row, i in enumerate(batch):
+                n = len(pairs[i][1])  # leave out the padding
+                window_answers[i] = get_topk_answers(
+                    start_logits[row:row + 1, :n], end_logits[row:row + 1, :n],
+                    input_ids[row, :n], 5, tokenizer)
+
+    answers = [[] for _ in questions]
+    for (qi, _, _), a in zip(pairs, window_answers):
+        answers[qi].extend(a)
     return answers
 
 
+def long_text_question(question, text, tokenizer, model):
+    return long_text_questions([question], text, tokenizer, model)[0]
+
+
 def question_text_segment(text, question, tokenizer, model, ans_num=1):
     inputs = tokenizer(question, text, add_special_tokens=True, return_tensors="pt")
     input_ids = inputs["input_ids"].tolist()[0]
@@ -112,19 +160,29 @@ class QamExtractor(Extractor):
     answers on the given text.
 """
 
-    def __init__(self, model_id: str):
+    def __init__(self, model_id: str, batch_size: int = 16):
         super().__init__()
         self._model_id = model_id
+        self._batch_size = batch_size
 
-    def __call__(self, text: str, trf_model_id: str = None):
-        nlpc = QandAmodels(trf_model_id or self._model_id)
+    def __call__(self, text: str, trf_model_id: str = None, batch_size: int = None):
+        model_id = trf_model_id or self._model_id
+        batch_size = batch_size or self._batch_size
+        # the text gets tokenized only once for all calls of qa_machine.
+        # We can not cache the encoder states in the same way, as question
+        # answering models encode question & text jointly.
+        text_windows: list[TextWindows] = []
 
         def qa_machine(questions) -> list[list[tuple[str, float]]]:
             if isinstance(questions, str):
-                questions = [str]
-            allanswers = answer_questions_on_long_text(questions, text, nlpc)
-            answers = list(allanswers.values())
-            return answers
+                questions = [questions]
+            # qa_machine can be kept around for a long time, so we only hold on to the
+            # model while answering questions. In between, the model registry can evict it.
+            with model_registry.acquire("qam", model_id) as nlpc:
+                if not text_windows:
+                    text_windows.append(TextWindows(text, nlpc.tokenizer))
+                return long_text_questions(questions, text, nlpc.tokenizer, nlpc.model,
+                                           batch_size=batch_size, text_windows=text_windows[0])
 
         return qa_machine
 
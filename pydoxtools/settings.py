@@ -19,8 +19,6 @@ import os
 from pathlib import Path
 
 import appdirs
-# TODO: remove joblib as a dependency from here ...
-import joblib
 from pydantic import BaseSettings
 
 logger = logging.getLogger(__name__)
@@ -40,6 +38,16 @@ class _Settings(BaseSettings):
     TRAINING_DATA_DIR: Path = _PYDOXTOOLS_DIR / 'training_data'
     MODEL_DIR = CACHE_DIR_BASE / "models"
 
+    # persistent cache for extractor results (see pydoxtools.cache_utils)
+    PDXT_DISK_CACHE_DIR: Path = CACHE_DIR_BASE / "extractor_cache"
+    PDXT_DISK_CACHE_MAX_SIZE: int = 2 * 1024 ** 3  # in bytes
+
+    # memory which can be used by models which are loaded through pydoxtools.model_registry
+    PDXT_MODEL_MEMORY_BUDGET: int = 4 * 1024 ** 3  # in bytes
+
+    # vector indexes with up to this many vectors use exact brute-force search (see pydoxtools.vector_index)
+    PDXT_BRUTE_FORCE_INDEX_MAX_SIZE: int = 20000
+
     # in order to be able to access OPENAI api
     OPENAI_API_KEY: str = "sk ...."
 
@@ -78,6 +86,8 @@ class _Settings(BaseSettings):
 
     # TODO: replace this with diskcache
     def get_memory_cache(self):
+        # TODO: remove joblib as a dependency from here ...
+        import joblib
         return joblib.Memory(str(self.CACHE_DIR_BASE), verbose=0)
 
 
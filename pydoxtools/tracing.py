@@ -0,0 +1,250 @@
+"""
+Tracing & profiling of extractor calls.
+
+A Tracer records every call of Pipeline.x together with:
+
+- wall time & cpu time (of the calling thread)
+- self time (wall time without the time spent in nested extractor calls)
+- peak memory increase (only if memory=True as this uses tracemalloc, which slows
+  down the extraction considerably)
+- whether the result came from the memory cache, the disk cache or had to be calculated
+- the sizes of the inputs of the extractor
+- the chain of extractors which led to the call
+
+Tracers can be given to a single document or activated for all documents
+which are processed inside a "with" block:
+
+    from pydoxtools.tracing import Tracer
+
+    with Tracer() as tracer:
+        for path in paths:
+            Document(path).x("tables_df")
+
+    tracer.save_chrome_trace("trace.json")  # open with chrome://tracing or https://ui.perfetto.dev
+    print(tracer.stats())  # aggregated statistics per extractor
+
+Every document shows up as a separate process in the chrome trace.
+
+Documents which get processed in other processes (e.g. Pipeline.map) are not traced.
+"""
+
+import contextlib
+import json
+import logging
+import threading
+import time
+import tracemalloc
+import typing
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+if typing.TYPE_CHECKING:
+    import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# the tracer which was activated with "with Tracer():"
+_active_tracer: "Tracer | None" = None
+
+
+def active_tracer() -> "Tracer | None":
+    return _active_tracer
+
+
+def input_size(value: Any) -> int | None:
+    """size of an extractor input: number of bytes for arrays, the length for everything else"""
+    if hasattr(value, "nbytes") and hasattr(value, "dtype"):
+        return int(value.nbytes)
+    try:
+        return len(value)
+    except TypeError:
+        return None
+
+
+@dataclass
+class TraceEvent:
+    name: str  # requested output
+    extractor: str  # class name of the extractor
+    document: str
+    thread: int
+    parents: tuple[str, ...]  # chain of outputs which led to this call, outermost first
+    start: float  # seconds since the creation of the tracer
+    wall: float = 0.0
+    cpu: float = 0.0
+    self_wall: float = 0.0
+    memory: int | None = None  # peak memory increase in bytes
+    cache: str = "none"  # "memory", "disk", "miss" or "none" for uncached extractors
+    inputs: dict[str, int | None] = field(default_factory=dict)
+    error: bool = False
+
+
+@dataclass
+class _Frame:
+    event: TraceEvent
+    wall_start: float
+    cpu_start: float
+    mem_start: int = 0
+    mem_peak: int = 0
+    child_wall: float = 0.0
+
+
+class Tracer:
+    """
+    Records extractor calls of documents.
+
+    memory: also record the peak memory increase of every call. As tracemalloc
+        traces allocations of all threads, the values can be too high when extractors
+        run in parallel (Pipeline.x_parallel).
+    """
+
+    def __init__(self, memory: bool = False):
+        self.memory = memory
+        self.events: list[TraceEvent] = []
+        self._t0 = time.perf_counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._documents: dict[str, int] = {}
+        self._started_tracemalloc = False
+        self._previous: Tracer | None = None
+
+    def __enter__(self):
+        global _active_tracer
+        self._previous, _active_tracer = _active_tracer, self
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        return self
+
+    def __exit__(self, *exc):
+        global _active_tracer
+        _active_tracer = self._previous
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    @property
+    def _stack(self) -> list[_Frame]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _document_id(self, document: str) -> int:
+        with self._lock:
+            return self._documents.setdefault(document, len(self._documents) + 1)
+
+    def current_parents(self) -> tuple[str, ...]:
+        """the chain of outputs which is currently being traced in this thread, outermost first"""
+        return getattr(self._local, "parents", ()) + tuple(f.event.name for f in self._stack)
+
+    @contextlib.contextmanager
+    def parents(self, parents: tuple[str, ...]):
+        """
+        trace all calls of the current thread inside the "with" block as children
+        of *parents*. This is used to keep the call chain of extractors which
+        run in worker threads (Pipeline.x_parallel), as every thread has its own stack.
+        """
+        previous = getattr(self._local, "parents", ())
+        self._local.parents = tuple(parents)
+        try:
+            yield
+        finally:
+            self._local.parents = previous
+
+    @contextlib.contextmanager
+    def span(self, document: Any, name: str, extractor: Any):
+        """
+        record a single extractor call. Yields the TraceEvent which can be
+        updated with additional information (cache status, input sizes)
+        """
+        stack = self._stack
+        event = TraceEvent(
+            name=name,
+            extractor=extractor.class_name,
+            document=f"{document.__class__.__name__}({document.source})#{document.uuid}",
+            thread=threading.get_ident(),
+            parents=self.current_parents(),
+            start=time.perf_counter() - self._t0
+        )
+        self._document_id(event.document)
+        frame = _Frame(event=event, wall_start=time.perf_counter(), cpu_start=time.thread_time())
+        memory = self.memory and tracemalloc.is_tracing()
+        if memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1].mem_peak = max(stack[-1].mem_peak, peak)
+            tracemalloc.reset_peak()
+            frame.mem_start = frame.mem_peak = current
+        stack.append(frame)
+        try:
+            yield event
+        except BaseException:
+            event.error = True
+            raise
+        finally:
+            stack.pop()
+            event.wall = time.perf_counter() - frame.wall_start
+            event.cpu = time.thread_time() - frame.cpu_start
+            event.self_wall = event.wall - frame.child_wall
+            if memory:
+                peak = max(frame.mem_peak, tracemalloc.get_traced_memory()[1])
+                event.memory = peak - frame.mem_start
+                if stack:
+                    stack[-1].mem_peak = max(stack[-1].mem_peak, peak)
+                tracemalloc.reset_peak()
+            if stack:
+                stack[-1].child_wall += event.wall
+            self.events.append(event)
+
+    def clear(self):
+        self.events = []
+
+    def stats(self) -> "pd.DataFrame":
+        """
+        aggregated statistics per extractor output over all recorded calls (and documents),
+        sorted by the total self time.
+        """
+        import pandas as pd
+        columns = ["calls", "documents", "cache_hits", "errors", "wall", "self_wall",
+                   "cpu", "wall_mean", "wall_max", "memory_max"]
+        if not self.events:
+            return pd.DataFrame(columns=columns)
+        df = pd.DataFrame([dict(
+            name=e.name, extractor=e.extractor, document=e.document, wall=e.wall,
+            self_wall=e.self_wall, cpu=e.cpu, memory=e.memory, error=e.error,
+            cache_hit=e.cache in ("memory", "disk")
+        ) for e in self.events])
+        stats = df.groupby(["name", "extractor"]).agg(
+            calls=("wall", "size"),
+            documents=("document", "nunique"),
+            cache_hits=("cache_hit", "sum"),
+            errors=("error", "sum"),
+            wall=("wall", "sum"),
+            self_wall=("self_wall", "sum"),
+            cpu=("cpu", "sum"),
+            wall_mean=("wall", "mean"),
+            wall_max=("wall", "max"),
+            memory_max=("memory", "max"),
+        )
+        return stats.sort_values("self_wall", ascending=False)
+
+    def chrome_trace(self) -> dict:
+        """
+        convert the recorded events into the chrome trace event format which
+        can be viewed as a flamegraph in chrome://tracing or https://ui.perfetto.dev
+        """
+        trace = [dict(name="process_name", ph="M", pid=pid, args=dict(name=doc))
+                 for doc, pid in self._documents.items()]
+        for e in self.events:
+            trace.append(dict(
+                name=e.name, cat=e.extractor, ph="X",
+                ts=e.start * 1e6, dur=e.wall * 1e6,
+                pid=self._documents[e.document], tid=e.thread,
+                args=dict(cpu=e.cpu, self_wall=e.self_wall, memory=e.memory, cache=e.cache,
+                          inputs=e.inputs, parents=list(e.parents), error=e.error)
+            ))
+        return dict(traceEvents=trace, displayTimeUnit="ms")
+
+    def save_chrome_trace(self, path: str | Path):
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
@@ -0,0 +1,210 @@
+"""
+Nearest neighbour indexes for vectors (e.g. word or noun chunk vectors).
+
+All indexes use the cosine distance and have the same interface as
+hnswlib indexes:
+
+    index = create_index(vecs, ids)
+    labels, distances = index.knn_query(query_vecs, k=5)
+
+which returns arrays of shape (len(query_vecs), k). Available backends are:
+
+- "brute_force": exact search with numpy, fastest for small amounts of vectors
+- "hnswlib": approximate search with a hierarchical navigable small world graph
+- "balltree": exact search with a scikit-learn BallTree
+
+With backend="auto" a backend gets chosen depending on the number of vectors.
+Indexes can be pickled and saved/loaded with save/load_index.
+"""
+
+import abc
+import logging
+import pickle
+from pathlib import Path
+
+import numpy as np
+
+from pydoxtools.settings import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import hnswlib
+except ImportError:
+    logger.info("can not use hnswlib vector indexes, due to missing library: hnswlib")
+    hnswlib = None
+
+
+def _normalize(vecs: np.ndarray) -> np.ndarray:
+    vecs = np.atleast_2d(np.asarray(vecs, dtype=np.float32))
+    norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vecs / norms
+
+
+class VectorIndex(abc.ABC):
+    """base class for cosine-distance vector indexes"""
+    backend: str = ""
+
+    @abc.abstractmethod
+    def add_items(self, data: np.ndarray, ids: list[int] | np.ndarray = None):
+        pass
+
+    @abc.abstractmethod
+    def knn_query(self, data: np.ndarray, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """
+        return (labels, distances) of the k nearest neighbours of every query vector.
+
+        If the index has less than k elements, only that many neighbours are returned.
+        """
+
+    @abc.abstractmethod
+    def __len__(self) -> int:
+        pass
+
+    def save(self, path: str | Path):
+        with open(path, "wb") as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def load_index(path: str | Path) -> VectorIndex:
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+class BruteForceIndex(VectorIndex):
+    """exact search by calculating the distances to all vectors"""
+    backend = "brute_force"
+
+    def __init__(self, dim: int):
+        self._vecs = np.empty((0, dim), dtype=np.float32)
+        self._ids = np.empty(0, dtype=np.int64)
+
+    def add_items(self, data: np.ndarray, ids: list[int] | np.ndarray = None):
+        data = _normalize(data)
+        ids = np.arange(len(self), len(self) + len(data)) if ids is None else np.asarray(ids, dtype=np.int64)
+        self._vecs = np.vstack((self._vecs, data))
+        self._ids = np.concatenate((self._ids, ids))
+
+    def knn_query(self, data: np.ndarray, k: int = 1, chunk_size: int = 1 << 22) -> tuple[np.ndarray, np.ndarray]:
+        """
+        the queries get processed in chunks, so that the distance matrix of a chunk
+        has no more than chunk_size elements
+        """
+        data = _normalize(data)
+        rows = max(1, chunk_size // max(len(self), 1))
+        if len(data) <= rows:
+            return self._knn_chunk(data, k)
+        labels, distances = zip(*(self._knn_chunk(data[i:i + rows], k) for i in range(0, len(data), rows)))
+        return np.vstack(labels), np.vstack(distances)
+
+    def _knn_chunk(self, data: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        k = min(k, len(self))
+        dist = 1.0 - data @ self._vecs.T
+        if k < len(self):
+            idx = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        else:
+            idx = np.broadcast_to(np.arange(len(self)), dist.shape)
+        dist = np.take_along_axis(dist, idx, axis=1)
+        order = np.argsort(dist, axis=1, kind="stable")
+        return self._ids[np.take_along_axis(idx, order, axis=1)], np.take_along_axis(dist, order, axis=1)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+class BallTreeIndex(VectorIndex):
+    """
+    exact search with a scikit-learn BallTree. The tree gets (re-)built
+    lazily after new items were added.
+    """
+    backend = "balltree"
+
+    def __init__(self, dim: int, leaf_size: int = 40):
+        self._leaf_size = leaf_size
+        self._vecs = np.empty((0, dim), dtype=np.float32)
+        self._ids = np.empty(0, dtype=np.int64)
+        self._tree = None
+
+    def add_items(self, data: np.ndarray, ids: list[int] | np.ndarray = None):
+        data = _normalize(data)
+        ids = np.arange(len(self), len(self) + len(data)) if ids is None else np.asarray(ids, dtype=np.int64)
+        self._vecs = np.vstack((self._vecs, data))
+        self._ids = np.concatenate((self._ids, ids))
+        self._tree = None
+
+    def knn_query(self, data: np.ndarray, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        if self._tree is None:
+            from sklearn.neighbors import BallTree
+            self._tree = BallTree(self._vecs, leaf_size=self._leaf_size)
+        k = min(k, len(self))
+        dist, idx = self._tree.query(_normalize(data), k=k)
+        # for normalized vectors: |a-b|^2 = 2 - 2*cos(a,b)
+        return self._ids[idx], (dist ** 2) / 2.0
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+class HnswIndex(VectorIndex):
+    """
+    approximate search using hnswlib
+
+    M: max number of outgoing connections in the graph
+    ef_construction: quality vs speed parameter during index construction
+    ef: quality vs speed parameter for queries (always gets raised to at least k)
+    """
+    backend = "hnswlib"
+
+    def __init__(self, dim: int, max_elements: int = 1000, M: int = 16, ef_construction: int = 200, ef: int = 50):
+        if hnswlib is None:
+            raise ImportError("the hnswlib backend needs the hnswlib library")
+        self._ef = ef
+        self._index = hnswlib.Index(space='cosine', dim=dim)
+        self._index.init_index(max_elements=max_elements, ef_construction=ef_construction, M=M)
+        self._index.set_ef(ef)
+
+    def add_items(self, data: np.ndarray, ids: list[int] | np.ndarray = None):
+        data = np.atleast_2d(data)
+        required = len(self) + len(data)
+        if required > self._index.get_max_elements():
+            self._index.resize_index(max(required, 2 * self._index.get_max_elements()))
+        self._index.add_items(data=data, ids=ids)
+
+    def knn_query(self, data: np.ndarray, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        k = min(k, len(self))
+        self._index.set_ef(max(self._ef, k))
+        return self._index.knn_query(np.atleast_2d(data), k=k)
+
+    def __len__(self) -> int:
+        return self._index.get_current_count()
+
+
+def choose_backend(n: int) -> str:
+    """choose an index backend based on the number of vectors"""
+    if n <= settings.PDXT_BRUTE_FORCE_INDEX_MAX_SIZE:
+        return "brute_force"
+    return "hnswlib" if hnswlib is not None else "balltree"
+
+
+def create_index(vecs: np.ndarray, ids: list[int] | np.ndarray = None, backend: str = "auto",
+                 **params) -> VectorIndex:
+    """
+    create a vector index with a given backend (see module docstring).
+
+    params are handed to the constructor of the backend, e.g. M & ef for hnswlib
+    """
+    vecs = np.atleast_2d(vecs)
+    if backend == "auto":
+        backend = choose_backend(len(vecs))
+    if backend == "brute_force":
+        index = BruteForceIndex(dim=vecs.shape[1], **params)
+    elif backend == "balltree":
+        index = BallTreeIndex(dim=vecs.shape[1], **params)
+    elif backend == "hnswlib":
+        index = HnswIndex(dim=vecs.shape[1], max_elements=len(vecs) + 1, **params)
+    else:
+        raise ValueError(f"unknown vector index backend: {backend}")
+    if len(vecs):
+        index.add_items(vecs, ids)
+    return index
@@ -7,8 +7,13 @@ import io
 import pathlib
 from pathlib import Path
 
+import numpy as np
+import pandas as pd
+
 from pydoxtools.document import Document
+from pydoxtools.document_base import ElementType
 from pydoxtools import settings
+from pydoxtools.cluster_utils import box_cols, x0, x1, y1
 
 logger = logging.getLogger(__name__)
 
@@ -114,6 +119,33 @@ def test_qam_machine():
     assert answers[1][0][0] == 'The BST BAT - 110'
 
 
+def test_batched_question_answering():
+    from pydoxtools.model_registry import model_registry
+    from pydoxtools.qamachine import long_text_questions
+    # a text with several windows and questions of different lengths (and a duplicate)
+    text = " ".join(f"The BST BAT-{i} is a battery which was built in Berlin." for i in range(150))
+    questions = ["what is the product name?", "where was the product built by the company?",
+                 "what is the product name?", "who?"]
+    with model_registry.acquire("qam", 'distilbert-base-cased-distilled-squad') as nlpc:
+        batched = long_text_questions(questions, text, nlpc.tokenizer, nlpc.model, batch_size=5)
+        for q, answers in zip(questions, batched):
+            single = long_text_questions([q], text, nlpc.tokenizer, nlpc.model, batch_size=1)[0]
+            assert [a for a, _ in answers] == [a for a, _ in single]
+            assert np.allclose([s for _, s in answers], [s for _, s in single], atol=1e-3)
+
+
+def test_text_windows():
+    from transformers import AutoTokenizer
+    from pydoxtools.nlp_utils import TextWindows, tokenize_windows
+    tokenizer = AutoTokenizer.from_pretrained('distilbert-base-cased-distilled-squad')
+    text = " ".join(f"word{i}" for i in range(1000))
+    windows = TextWindows(text, tokenizer, max_cached=1)
+    for win_len in (500, 400, 500):
+        expected, _ = tokenize_windows(text, tokenizer, win_len=win_len, overlap=50,
+                                       max_len=512, add_special_tokens=False)
+        assert windows.windows(win_len=win_len, overlap=50, max_len=512) == expected
+
+
 def test_address_extraction():
     doc = Document(
         fobj=make_path_absolute("./data/PFR-PR23_BAT-110__V1.00_.pdf"),
@@ -124,6 +156,22 @@ def test_address_extraction():
     assert findthis in addresses
 
 
+def test_batched_text_classification():
+    from pydoxtools.extract_classes import TextBlockClassifier, classify_texts
+    from pydoxtools.model_registry import model_registry
+    texts = ["Max-Planck-Str. 3, 12489 Berlin, Germany", "hello", "a much longer text block " * 20,
+             "hello", "info@berlin-space-tech.com", "Max-Planck-Str. 3, 12489 Berlin, Germany", ""]
+    with model_registry.acquire("text_classification", "txtblockclassifier") as model:
+        single = [classify_texts(model, [t], batch_size=1)[0] for t in texts]
+        # texts of different lengths (and duplicates) get padded in the same batch
+        assert classify_texts(model, texts, batch_size=3) == single
+        assert classify_texts(model, texts, batch_size=len(texts)) == single
+
+    boxes = pd.DataFrame(dict(text=texts))
+    addresses = [t for t, label in zip(texts, single) if label == "address"]
+    assert TextBlockClassifier(batch_size=2)(boxes) == addresses
+
+
 def test_chat_gpt():
     import openai
     doc = Document(
@@ -177,6 +225,690 @@ def test_pipeline_graph():
     doc.pipeline_graph(image_path=settings._PYDOXTOOLS_DIR / "docs/images/document_logic_png.svg", document_logic_id=".png")
 
 
+def test_disk_cache(tmp_path):
+    from pydoxtools.cache_utils import DiskCache
+    cache = DiskCache(cache_dir=tmp_path, max_size=50 * 1024 ** 2)
+    doc = Document(fobj=make_path_absolute("./data/PFR-PR23_BAT-110__V1.00_.pdf"), disk_cache=cache)
+    tables = doc.x("tables_df")
+    assert cache.size > 0
+
+    # a new document with the same content should get its results from the disk cache
+    with open(make_path_absolute("./data/PFR-PR23_BAT-110__V1.00_.pdf"), "rb") as file:
+        doc_str = file.read()
+    doc = Document(fobj=doc_str, document_type=".pdf", disk_cache=cache)
+    cached_tables = doc.x("tables_df")
+    assert doc._cache_hits >= 1
+    assert [t.shape for t in cached_tables] == [t.shape for t in tables]
+
+    # eviction keeps the cache bounded
+    small_cache = DiskCache(cache_dir=tmp_path / "small", max_size=1024)
+    Document(fobj=doc_str, document_type=".pdf", disk_cache=small_cache).x("text_box_elements")
+    assert small_cache.size <= 1024
+
+
+def test_disk_cache_across_processes(tmp_path):
+    import subprocess
+    import sys
+    # every process creates its own extractors, so the cache keys must not depend on their
+    # state. "language" is calculated by a LazyExtractor which creates its extractor on the first call.
+    code = ("import sys; from pydoxtools.document import Document; from pydoxtools.cache_utils import DiskCache; "
+            "doc = Document(fobj='some text\\nin a few\\nlines', disk_cache=DiskCache(cache_dir=sys.argv[1])); "
+            "res = doc.extract(['text_box_list', 'language']); print(res.outputs); print(res.computed)")
+    runs = [subprocess.run([sys.executable, "-c", code, str(tmp_path)],
+                           capture_output=True, text=True, check=True).stdout.splitlines()[-2:] for _ in range(2)]
+    assert runs[0][0] == runs[1][0]
+    assert "language" in runs[0][1]
+    assert runs[1][1] == "[]"
+
+
+def test_extractor_fingerprint(monkeypatch):
+    import pydoxtools
+    from pydoxtools.cache_utils import extractor_fingerprint
+    from pydoxtools.extract_logic import LambdaExtractor, LazyExtractor, LazyFunction
+    a = LambdaExtractor(LazyFunction("pydoxtools.list_utils", "flatten")).pipe("x").out("y")
+    b = LambdaExtractor(LazyFunction("pydoxtools.list_utils", "group_by")).pipe("x").out("y")
+    assert extractor_fingerprint(a) != extractor_fingerprint(b)
+    # creating the wrapped extractor doesn't change the fingerprint
+    lazy = LazyExtractor("pydoxtools.extract_logic", "Constant", x=1).out("x")
+    fingerprint = extractor_fingerprint(lazy)
+    assert lazy() == {"x": 1}
+    assert extractor_fingerprint(lazy) == fingerprint
+    fingerprint = extractor_fingerprint(a)
+    monkeypatch.setattr(pydoxtools, "__version__", "0.0.0")
+    assert extractor_fingerprint(a) != fingerprint
+
+
+def test_document_batch():
+    sources = [make_path_absolute(f) for f in (
+        "./data/alan_turing.txt", "./data/PFR-PR23_BAT-110__V1.00_.pdf", "./data/test.html")]
+    # add a document which can not be processed
+    sources.append(make_path_absolute("./data/does_not_exist.pdf"))
+    results = list(Document.map(sources, extract=["full_text"], workers=2, timeout=300))
+    assert len(results) == len(sources)
+    results = sorted(results, key=lambda r: r.index)
+    assert all(r.ok for r in results[:3])
+    assert all(len(r.outputs["full_text"]) > 0 for r in results[:3])
+    assert not results[3].ok
+
+
+class _CrashingDocument:
+    """kills its worker process for the source "crash" """
+
+    def __init__(self, fobj):
+        self._fobj = fobj
+
+    def extract(self, names):
+        import os
+        import time
+        from pydoxtools.document_base import ExtractionResult
+        time.sleep(0.1)
+        if self._fobj == "crash":
+            os._exit(1)
+        return ExtractionResult(outputs={"length": len(self._fobj)}, computed=["length"], reused=[])
+
+
+def test_document_batch_crash_isolation():
+    from pydoxtools.document_batch import DocumentBatch
+    sources = [f"document {i}" for i in range(8)]
+    sources[3] = "crash"
+    results = sorted(DocumentBatch(sources, extract=["length"], workers=2,
+                                   document_class=_CrashingDocument, max_retries=1),
+                     key=lambda r: r.index)
+    assert len(results) == len(sources)
+    # only the crashing document fails, not the ones processed at the same time
+    assert [r.ok for r in results] == [i != 3 for i in range(len(sources))]
+
+
+def test_parallel_extraction():
+    path = make_path_absolute("./data/PFR-PR23_BAT-110__V1.00_.pdf")
+    doc = Document(fobj=path)
+    timings = doc.x_parallel(["tables_df", "full_text", "addresses"], workers=4, process_workers=2)
+    assert timings and all(t >= 0 for t in timings.values())
+    serial = Document(fobj=path)
+    assert doc.x("full_text") == serial.x("full_text")
+    assert len(doc.x("tables_df")) == len(serial.x("tables_df"))
+
+
+def test_pdf_page_stream():
+    doc = Document(fobj=make_path_absolute("./data/PFR-PR23_BAT-110__V1.00_.pdf"))
+    pages = list(doc.x("page_stream")())
+    assert [p["page"] for p in pages] == sorted(doc.x("page_set"))
+    assert sum(len(p["table_candidates"]) for p in pages) == len(doc.x("table_candidates"))
+    streamed_text = [t for p in pages if p["text_box_elements"] is not None
+                     for t in p["text_box_elements"].text]
+    assert streamed_text == doc.x("text_box_list")
+
+
+def test_parallel_pdf_parsing():
+    path = make_path_absolute("./data/PFR-PR23_BAT-110__V1.00_.pdf")
+    serial = Document(fobj=path)
+    parallel = Document(fobj=path, config=dict(pdf_workers=2))
+    assert parallel.x("page_set") == serial.x("page_set")
+    assert parallel.x("elements").p_num.tolist() == serial.x("elements").p_num.tolist()
+    assert parallel.x("text_box_list") == serial.x("text_box_list")
+    # page selections which leave less than two pages
+    for selection in (dict(page_numbers=[100, 101]), dict(max_pages=1), dict(page_numbers=[1, 2], max_pages=2)):
+        serial = Document(fobj=path, **selection)
+        parallel = Document(fobj=path, config=dict(pdf_workers=2), **selection)
+        assert parallel.x("elements").p_num.tolist() == serial.x("elements").p_num.tolist()
+
+
+def test_element_store():
+    doc = Document(fobj=make_path_absolute("./data/PFR-PR23_BAT-110__V1.00_.pdf"))
+    store = doc.x("element_store")
+    lines = store.view(element_type=ElementType.Line)
+    assert len(lines) + len(store.view(element_type=ElementType.Graphic)) == len(store)
+    # views by type are zero-copy
+    assert np.shares_memory(lines["x0"], store["x0"])
+    page = lines.view(page=1)
+    assert (page["p_num"] == 1).all()
+    df = doc.x("line_elements")
+    assert df.rawtext.tolist() == lines.to_frame().rawtext.tolist()
+    assert "".join(c.get_text() for c in df.lineobj.iloc[0]) == df.rawtext.iloc[0]
+    assert not lines.chars().empty
+    # coordinates keep the precision of pdfminer
+    assert store["x0"].dtype == np.float64
+    graphics = doc.x("graphic_elements")
+    gobj = graphics.gobj.iloc[0]
+    assert gobj.bbox == tuple(graphics[["x0", "y0", "x1", "y1"]].iloc[0])
+    assert gobj.pts
+
+
+def test_sparse_distance_cluster():
+    from pydoxtools import cluster_utils as gu
+    rng = np.random.default_rng(0)
+    xy = rng.uniform(0, 600, (300, 2))
+    boxes = np.hstack([xy, xy + rng.uniform(0, 60, (300, 2))])
+    params = {"va": [11.1, 11.1, 5.55, 11.1], "ha": [11.1, 11.1, 5.55, 11.1]}
+    dm = gu.calc_pairwise_matrix(gu.pairwise_weighted_distance_combination, boxes, diag=0, parameter_list=params)
+    dense, _ = gu.distance_cluster(distance_matrix=dm, distance_threshold=10.0)
+    sparse, _ = gu.distance_cluster_sparse(
+        boxes, gu.pairwise_weighted_distance_combination, 10.0,
+        cutoff=gu.weighted_distance_cutoff(params, 10.0), parameter_list=params)
+    # same clusters (labels can be numbered differently)
+    assert len(set(zip(dense, sparse))) == len(set(dense)) == len(set(sparse))
+
+
+def test_box_index():
+    from pydoxtools import cluster_utils as gu
+    rng = np.random.default_rng(0)
+    for n in [0, 1, 16, 17, 500]:
+        # integer coordinates, so that a lot of boxes touch the edges of the query boxes
+        xy = rng.integers(0, 50, (n, 2))
+        boxes = pd.DataFrame(np.hstack([xy, xy + rng.integers(0, 10, (n, 2))]).astype(float),
+                             columns=gu.box_cols, index=rng.permutation(n) + 100)
+        index = gu.BoxIndex(boxes[gu.box_cols].values)
+        queries = rng.integers(0, 50, (30, 4)).astype(float)
+        queries[:, 2:] = queries[:, :2] + rng.integers(0, 20, (30, 2))
+        for tol in (0.0, 1.0):
+            for q in queries:
+                assert boxes.iloc[index.contained(q, tol=tol)].equals(gu.boundarybox_query(boxes, q, tol=tol))
+                assert list(boxes.index[index.intersecting(q, tol=tol)]) == list(
+                    gu.boundarybox_intersection_query(boxes, q, tol=tol))
+            assert list(index.count_intersecting(queries, tol=tol)) == [
+                len(gu.boundarybox_intersection_query(boxes, q, tol=tol)) for q in queries]
+
+
+# reference implementation of Table.detect_cells for regression tests
+idx = pd.IndexSlice
+
+
+def _close_cell(oc, df_le, y1, text_line_tol):
+    # the current indexing of text lines is the following:
+    # "y0","x0","y0","x1" and so we need to
+    # to do the indexing accordingly
+    # TODO: not sure if "min" is the right operation here, it might also be enough
+    #       to just use "iloc[0]" due to already correct sorting...
+    oc['y1'] = y1
+    text_elements = df_le.loc[idx[
+                              oc["y0"] - text_line_tol:,
+                              oc["x0"] - text_line_tol:,
+                              :oc["y1"] + text_line_tol,
+                              :oc["x1"] + text_line_tol],
+                    :]
+    if text_elements.empty:
+        return None
+    else:
+        oc['text_elements'] = text_elements
+        return oc
+
+
+def _close_open_cells(open_cells, h_lines, df_le, elem_scan_tol,
+                      text_line_tol, y0_cursor):
+    # iterate through each open cell and check which ones we can close with the
+    # provided top_cell_border_elements
+    still_open = []
+    new_cells = []
+    for oc in open_cells:
+        # check if we have a top element that somehow exists within the cell borders
+        # and can be used to close the cell...
+        # we have 3 cases:
+        #  - both ends are inside the cell
+        #  - x0 is on the left side of the left lineend
+        #  - x1 is on the right side of the right line end
+        # all three cases are handled by the expression below:
+        top_elem = h_lines.loc[
+                   idx[:oc['x1'] - elem_scan_tol,
+                   oc['x0'] + elem_scan_tol:],
+                   :]
+
+        if top_elem.empty:
+            still_open.append(oc)
+        else:  # if top_elem exits, close the cell
+            if new_cell := _close_cell(oc, df_le, y0_cursor, text_line_tol):
+                new_cells.append(new_cell)
+
+    return new_cells, still_open
+
+
+def _detect_cells_pandas(table) -> pd.DataFrame:
+    """
+    original implementation of Table.detect_cells using pandas MultiIndex slicing.
+    This is a lot slower, but we keep it as a reference for regression tests.
+    """
+
+    max_v_line_thickness = table.tbe.max_v_line_thickness  # maximum thickness which is allowed for a vertical line
+    elem_scan_tol = table.tbe.elem_scan_tol
+    min_cell_width = table.tbe.min_cell_width
+    text_line_tol = table.tbe.text_line_tol  # tolerance which detremines which text lines will be added to a cell area
+
+    # TODO: use the "area-ratio" of elments in order to improve quality?
+    # create indices for our graphical and line elements for
+    # faster spatial queries
+    # TODO: we might not need "w" and "h" or other elements...
+    ge = table.df_ge[box_cols + ['w', 'h']].sort_values(
+        by=['y0', 'y1', 'x0', 'x1'],
+    ).set_index(['y0', 'y1', 'x0', 'x1'], drop=False).copy()
+    le = table.df_words[box_cols + ['text']].sort_values(
+        by=["y0", "x0", "y1", "x1"],
+    ).set_index(['y0', 'x0', 'y1', 'x1'], drop=False).copy()
+
+    # generate a list of increasing y-mean values which we can "pop"
+    # from the list in order to scan the table upwards...
+    y_mean = (le.y1 + le.y0) / 2.0
+    y_mean_list = y_mean.drop_duplicates().sort_values(ascending=False).to_list()
+
+    open_cells = []  # cells that the cursor is currently traversing
+    # finished cells, where the y0-scan cursor has passed
+    # by the top y1 border and "closed" them this way...
+    cells = []
+
+    # move through the table bottom-to-top evaluating row-by-row
+    # define a y- and x-cursor which we will slowly advance in order to scan the table
+    # we start with the first text element in the lower left
+    y0_h_elem = 0.0
+
+    for i in range(table.max_lines):
+        if not y_mean_list:  # if y_mean_list is empty, we reached the top of the table
+            # as there are no more text lines we can close up all cells
+            # that are still open
+            last_cells = [_close_cell(oc, le, table.bbox[y1], text_line_tol) for oc in open_cells]
+            cells.extend(lc for lc in last_cells if lc)
+            break
+
+        # advance y0_cursor to the next textline
+        # TODO: use y_mean to the the left_over_lines!!
+        while y_mean_list:  # do this until we don't have any more text elements left
+            y0_cursor = y_mean_list.pop()
+            # make sure that the middle of the line is above the previously found table row
+            if y0_cursor > y0_h_elem:
+                break
+
+        # now we would like to know every vertical line (not element) that crosses the current
+        # y0-cursor-line to get the vertical cell borders in this row...
+        # get all elements reaching from `below` to `above + tolerance` (using y0 and y1)
+        # we do "swaplevel" in order to be able to use more efficient x-indexing afterwards
+        row_ge_elem = ge.loc[idx[:y0_cursor + elem_scan_tol, y0_cursor + elem_scan_tol:], :]
+        v_row_elem = row_ge_elem.swaplevel(0, 2, axis=0).sort_index()
+
+        if v_row_elem.empty:
+            # no vertical line detected in this row, so we should move further upwards
+            # and set y0_h_elem to the top of this line element.
+            if y_mean_list:
+                y0_h_elem = (y0_cursor + y_mean_list[-1]) / 2
+            continue
+
+        # get all vertical coordinates because we would like to identify the lines and not
+        # boxes...
+        vlines = np.sort(np.hstack(
+            (np.unique(v_row_elem[['x0', 'x1']].values), table.bbox[[x0, x1]])))
+        x0_cursor = vlines[0]
+        for x in vlines:
+            # TODO: take txt_lines  here into account. For example:
+            #       if a cell has a textline which is longer than its x1-border,
+            #       we should make the cell longer...
+            if x < x0_cursor + min_cell_width:
+                x0_cursor = x
+                continue
+
+            # check if this cell already exists in "open cells"
+            # by checking if our x-cursor is inside that cell
+            # if not, create it..
+            if not next((oc for oc in open_cells
+                         if oc['x0'] <= (x0_cursor + elem_scan_tol) <= oc['x1']), None):
+                # set cell borders but leave cells open as we have to advance our y0 cursor
+                # to find out the y1 value of the cells ("close" them)...
+                cell = dict(
+                    x0=x0_cursor,
+                    y0=y0_h_elem,
+                    x1=x  # use left side of broder element as right side of cell
+                )
+                open_cells.append(cell)
+            x0_cursor = x  # use right side as the next x0_cursor for left-side of the next cell
+
+        # now after scanning the row, advance y-cursor upwards and check which cells we can close...
+        # get the next horizontal element
+        # TODO: handle the case where we have text "above" graphic lines...
+        # TODO: might need to check for y1 here as well, as there
+        #       might be a case were the box only closes and no new
+        #       one opens... more tests will show...
+        #       maybe check whatever is between here and the next text element?
+        #       and then take the minimum y-coordinate from that..
+        #       YEAH --> we need this.. already our first test showed :P
+        left_over_y1 = ge.loc[idx[:, y0_cursor:], :]
+        if left_over_y1.empty:
+            # assume we are in the last box and need to
+            # close up any remaining boxes...
+            continue
+        left_over_y0 = left_over_y1[y0_cursor:]
+        next_h_elem = left_over_y1.iloc[0]
+        # TODO: do we need a min here?
+        y0_h_elem = next_h_elem.y1 if left_over_y0.empty else min(next_h_elem.y1, left_over_y0.iloc[0].y0)
+        # TODO: we might want to check if *max_v_line_thickness* should be the
+        #       distance to the next text element.... but maybe its enough to simply
+        #       have this as a parameter...
+        # select horizontal elements in row
+        h_row_elem = left_over_y1.loc[
+                     idx[: y0_h_elem + max_v_line_thickness,
+                     y0_h_elem - elem_scan_tol:],
+                     :]
+        h_row_elem = h_row_elem.loc[
+            h_row_elem.w > min_cell_width]  # .reorder_levels([2, 3, 0, 1], axis=0).sort_index()
+        # and extract horizontal lines from them
+        h_lines = pd.concat([
+            h_row_elem.loc[y0_h_elem - elem_scan_tol:y0_h_elem + max_v_line_thickness,
+            ["x0", "x1", "y0"]].rename(columns={"y0": "y"}),
+            h_row_elem.loc[idx[:, y0_h_elem - elem_scan_tol:y0_h_elem + max_v_line_thickness],
+                           ["x0", "x1", "y1"]].rename(columns={"y1": "y"})
+        ]).droplevel(["y0", "y1"]).sort_index().drop_duplicates(["x0", "x1"])
+
+        new_cells, still_open = _close_open_cells(
+            open_cells, h_lines, le, elem_scan_tol, text_line_tol, y0_h_elem)
+        open_cells = still_open
+        cells.extend(new_cells)
+
+    return pd.DataFrame(cells)
+
+
+def test_detect_cells():
+    doc = Document(fobj=make_path_absolute("./data/PFR-PR23_BAT-110__V1.00_.pdf"))
+    for t in doc.x("table_candidates"):
+        cells, reference = t.detect_cells(), _detect_cells_pandas(t)
+        assert len(cells) == len(reference)
+        if not cells.empty:
+            assert np.allclose(cells[["x0", "y0", "x1", "y1"]].values,
+                               reference[["x0", "y0", "x1", "y1"]].values)
+
+
+def test_detect_cells_speed():
+    import timeit
+    doc = Document(fobj=make_path_absolute("./data/PFR-PR23_BAT-110__V1.00_.pdf"))
+    tables = doc.x("table_candidates")
+    for t in tables:  # calculate the cached inputs (words, graphic elements) first
+        t.detect_cells()
+    fast = min(timeit.repeat(lambda: [t._detect_cells() for t in tables], number=1, repeat=3))
+    reference = min(timeit.repeat(lambda: [_detect_cells_pandas(t) for t in tables], number=1, repeat=3))
+    # the numpy implementation should stay a lot faster than the pandas reference. Wall clock
+    # times depend too much on the machine, so we only log them instead of failing the tests.
+    logger.info(f"detect_cells: {fast:.4f}s, pandas reference: {reference:.4f}s "
+                f"({reference / max(fast, 1e-9):.1f}x faster)")
+
+
+def test_model_registry():
+    from pydoxtools.model_registry import ModelRegistry
+    loaded = []
+    registry = ModelRegistry(memory_budget=2 * 8000)
+    registry.register("array", lambda key: loaded.append(key) or np.zeros(1000))
+    registry.get("array", "a"), registry.get("array", "b"), registry.get("array", "a")
+    assert loaded == ["a", "b"]
+    assert registry.memory_usage == 16000
+    with registry.acquire("array", "b"):
+        # "a" is the least recently used model which isn't in use
+        registry.get("array", "c")
+        assert {e.key for e in registry.loaded()} == {"b", "c"}
+    registry.get("array", "a")
+    assert loaded == ["a", "b", "c", "a"]
+    assert [e.key for e in registry.loaded()] == ["c", "a"]
+
+
+def test_vector_index_backends(tmp_path):
+    from pydoxtools.vector_index import create_index, load_index
+    rng = np.random.default_rng(0)
+    vecs, queries = rng.normal(size=(500, 32)), rng.normal(size=(20, 32))
+    ids = list(range(1000, 1500))
+    brute_force = create_index(vecs, ids, backend="brute_force")
+    exact_labels, exact_dist = brute_force.knn_query(queries, k=5)
+    # queries in chunks of 3 rows
+    labels, dist = brute_force.knn_query(queries, k=5, chunk_size=3 * 500)
+    assert (labels == exact_labels).all() and np.allclose(dist, exact_dist)
+    for backend in ("balltree", "hnswlib"):
+        index = create_index(vecs, ids, backend=backend)
+        index.save(tmp_path / backend)
+        labels, dist = load_index(tmp_path / backend).knn_query(queries, k=5)
+        assert (labels[:, 0] == exact_labels[:, 0]).all()
+        assert np.allclose(dist[:, 0], exact_dist[:, 0], atol=1e-4)
+
+
+def test_corpus_index(tmp_path):
+    from pydoxtools.corpus_index import CorpusIndex
+    rng = np.random.default_rng(0)
+    docs = {f"doc{i}": rng.normal(size=(50, 16)) for i in range(20)}
+    corpus = CorpusIndex(tmp_path)
+    for doc_id, vecs in docs.items():
+        corpus.add_vectors(doc_id, "sents", vecs, [f"{doc_id}-{j}" for j in range(len(vecs))])
+    corpus.save()
+
+    corpus = CorpusIndex(tmp_path)
+    hit = corpus.search(docs["doc3"][7], k=1)[0]
+    assert (hit.doc_id, hit.source, hit.offset, hit.text) == ("doc3", "sents", 7, "doc3-7")
+    assert corpus.search(docs["doc3"][7], k=1, sources=["noun_chunks"]) == []
+    corpus.remove_document("doc3")
+    assert corpus.search(docs["doc3"][7], k=1)[0].doc_id != "doc3"
+    # changes are on disk without calling save()
+    assert CorpusIndex(tmp_path).documents == corpus.documents
+    corpus.compact()
+    assert len(corpus) == 19 * 50
+    assert corpus.search(docs["doc5"][1], k=1)[0].text == "doc5-1"
+
+    # the generic VectorIndex interface adds vectors without texts
+    corpus.add_items(docs["doc3"][:2], doc_id="raw")
+    assert CorpusIndex(tmp_path).search(docs["doc3"][1], k=1)[0].doc_id == "raw"
+
+    doc = Document(fobj=make_path_absolute("./data/alan_turing.txt"))
+    corpus.add_document(doc, "alan_turing", sources=["noun_chunks", "sents"])
+    query = doc.x("noun_chunks")[3]
+    assert corpus.search(query.vector, k=1)[0].text == str(query)
+
+
+def test_sparse_textrank():
+    import networkx as nx
+    from pydoxtools.extract_index import SimilarityGraph, similarity_graph_to_networkx
+    from pydoxtools.math_utils import pagerank
+    from pydoxtools.vector_index import create_index
+    rng = np.random.default_rng(1)
+    vecs = rng.normal(size=(300, 20))
+    vecs[100:] = vecs[rng.integers(0, 100, 200)] + 0.3 * rng.normal(size=(200, 20))
+    adjacency = SimilarityGraph(max_distance=0.3)(create_index(vecs, list(range(len(vecs)))), vecs)
+    G = similarity_graph_to_networkx(adjacency, list(range(len(vecs))))
+    reference = nx.pagerank(G, weight="weight")
+    assert np.allclose(pagerank(adjacency), [reference[i] for i in range(len(vecs))])
+
+
+def test_chunked_spacy_processing():
+    from pydoxtools.extract_spacy import split_text, required_spacy_outputs, disabled_components
+    text = " ".join(f"Sentence number {i} is here." + ("\n\n" if i % 3 == 0 else "") for i in range(300))
+    chunks = split_text(text, 500)
+    assert "".join(chunks) == text
+    assert all(len(c.lstrip()) <= 500 for c in chunks)
+
+    doc = Document(fobj=text, document_type=".txt")
+    chunked = Document(fobj=text, document_type=".txt", config=dict(spacy_chunk_size=500))
+    assert [t.text for t in chunked.x("spacy_doc")] == [t.text for t in doc.x("spacy_doc")]
+    assert [str(nc) for nc in chunked.x("noun_chunks")] == [str(nc) for nc in doc.x("noun_chunks")]
+
+    # texts which are longer than the maximum length of the model get split automatically
+    nlp = doc.x("spacy_nlp")
+    max_length, nlp.max_length = nlp.max_length, 2000
+    try:
+        long_text = Document(fobj=text, document_type=".txt")
+        assert [t.text for t in long_text.x("spacy_doc")] == [t.text for t in doc.x("spacy_doc")]
+    finally:
+        nlp.max_length = max_length
+
+    assert required_spacy_outputs(doc.upstream_outputs(["textrank_keywords"])) == {"spacy_noun_chunks"}
+    assert "parser" in disabled_components(nlp, required_spacy_outputs(["spacy_doc", "entities"]))
+    only_entities = Document(fobj=text, document_type=".txt")
+    res = only_entities.extract(["entities"])
+    # the reduced spacy document isn't kept for other outputs
+    assert "spacy_doc" in res.released
+    assert only_entities.x("spacy_doc").has_annotation("DEP")
+    # the spacy document gets calculated with the full pipeline if it is requested directly
+    res = Document(fobj=text, document_type=".txt").extract(["entities", "spacy_doc"])
+    assert res.outputs["spacy_doc"].has_annotation("DEP") and res.outputs["spacy_doc"].has_annotation("ENT_IOB")
+
+
+def test_noun_chunk_vectors():
+    from pydoxtools.document_base import token_vectors
+    doc = Document(fobj=make_path_absolute("./data/alan_turing.txt"))
+    spacy_doc = doc.x("spacy_doc")
+    assert np.allclose(token_vectors(spacy_doc), np.array([t.vector for t in spacy_doc]))
+    noun_chunks = doc.x("noun_chunks")
+    assert np.allclose(doc.x("noun_vecs"), [np.mean([t.vector for t in nc], 0) for nc in noun_chunks])
+    assert all(t.pos_ not in ("DET", "SPACE", "PRON") for nc in noun_chunks for t in nc)
+
+
+def test_wordpiece_pooling():
+    from pydoxtools.extract_spacy import pool_wordpieces
+    rng = np.random.default_rng(0)
+    vecs = rng.normal(size=(50, 7))
+    lengths = rng.integers(0, 4, 30)  # some tokens have no wordpieces
+    indices = rng.integers(0, 50, lengths.sum())
+    groups = np.split(indices, np.cumsum(lengths))[:-1]
+    for pooling, func in (("sum", np.sum), ("mean", np.mean), ("max", np.max)):
+        expected = np.stack([func(vecs[g], axis=0) if len(g) else np.zeros(7) for g in groups])
+        assert np.allclose(pool_wordpieces(vecs, indices, lengths, pooling), expected)
+
+
+def test_language_detection():
+    from pydoxtools.language_utils import detect_language, detect_section_languages, sample_text
+    english = ["This is an English sentence about documents and tables."] * 200
+    german = ["Dies ist ein deutscher Satz über Dokumente und Tabellen."] * 200
+    assert len(sample_text(english * 100, max_chars=2000)) <= 2000
+    assert detect_language(english) == "en"
+    assert detect_language(german) == "de"
+    assert detect_language([]) == "unknown"
+    sections = detect_section_languages(english + german)
+    assert [s["language"] for s in sections] == ["en", "de"]
+    assert sections[0]["start"] == 0 and sections[-1]["end"] == 400
+    # empty and whitespace-only documents
+    assert detect_section_languages([]) == []
+    assert detect_section_languages("") == [dict(start=0, end=1, language="unknown")]
+    assert detect_section_languages(["  ", "\n", ""]) == [dict(start=0, end=3, language="unknown")]
+    assert Document(fobj="").x("section_languages") == [dict(start=0, end=1, language="unknown")]
+
+
+def test_tracing(tmp_path):
+    from pydoxtools.tracing import Tracer
+    with Tracer(memory=True) as tracer:
+        doc = Document(fobj="some text\nin a few\nlines")
+        doc.x("text_box_list")
+        doc.x("text_box_list")
+    assert tracer.events
+    assert {e.cache for e in tracer.events} >= {"memory"}
+    assert any(e.parents for e in tracer.events)
+    stats = tracer.stats()
+    assert stats["calls"].sum() == len(tracer.events)
+    tracer.save_chrome_trace(tmp_path / "trace.json")
+    assert (tmp_path / "trace.json").stat().st_size > 0
+
+    # tracers can also be attached to single documents
+    tracer = Tracer()
+    Document(fobj="some text", tracer=tracer).x("text_box_list")
+    assert tracer.events and tracer.events[-1].name == "text_box_list"
+
+    # extractors running in worker threads keep the call chain of the calling thread
+    tracer = Tracer()
+    doc = Document(fobj="some text\nin a few\nlines", tracer=tracer)
+    with tracer.parents(("outer",)):
+        doc.x_parallel(["text_box_list"], workers=2)
+    assert tracer.events and all(e.parents[:1] == ("outer",) for e in tracer.events)
+
+
+def test_import_time():
+    # "import pydoxtools" should stay fast (e.g. for CLI tools & serverless workers) and
+    # heavy libraries should only be loaded by the extractors which need them
+    import subprocess
+    import sys
+    code = ("import sys, time; t = time.perf_counter(); import pydoxtools; "
+            "print(time.perf_counter() - t); print(','.join(sys.modules))")
+    res = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    elapsed, modules = res.stdout.splitlines()[-2:]
+    # wall clock times depend too much on the machine, so we only log them
+    logger.info(f"import pydoxtools: {float(elapsed):.3f}s")
+    heavy = {"torch", "transformers", "spacy", "pandoc", "sklearn", "pandas", "networkx", "langdetect"}
+    assert not heavy & set(modules.split(","))
+
+
+def test_extraction_plans():
+    doc = Document(fobj="some text\nin a few\nlines", config={"text_block_batch_size": 8})
+    plan = doc.x_plans["text_box_list"]
+    assert plan.extractor is doc.x_funcs["text_box_list"]
+    assert ("df", "text_box_elements", True) in plan.inputs
+    assert doc.x_plans["raw_content"].inputs[0] == ("fobj", "_fobj", False)
+    assert doc.x_config_params("addresses") == {"text_block_batch_size": 8}
+    assert doc.x("text_box_list") == ["some text", "in a few", "lines"]
+    assert doc.x("text_box_list") == ["some text", "in a few", "lines"]
+    assert doc._cache_hits >= 1
+
+
+def test_extraction_plans_follow_extractor_settings():
+    from pydoxtools.document_base import Pipeline
+    from pydoxtools.extract_logic import LambdaExtractor
+
+    calls = []
+    ex = LambdaExtractor(lambda x: calls.append(x) or x.upper()).pipe(x="_fobj").out("upper")
+
+    class Upper(Pipeline):
+        _extractors = {"*": [ex]}
+
+    doc = Upper("text")
+    doc.x("upper"), doc.x("upper")
+    assert len(calls) == 2
+    # extractors can still be configured after the plans were compiled
+    ex.cache()
+    doc.x("upper"), doc.x("upper")
+    assert len(calls) == 3
+    assert doc._extractor_graph(["upper"]) == {ex: set()}
+    assert doc.extract(["upper"]).reused == ["upper"]
+
+
+def test_selective_extraction():
+    doc = Document(fobj="some text\nin a few\nlines")
+    res = doc.extract(["text_box_list", "num_pages"])
+    assert list(res.outputs) == ["text_box_list", "num_pages"]
+    assert res.outputs["text_box_list"] == ["some text", "in a few", "lines"]
+    assert "text_box_elements" in res.computed
+    assert "spacy_doc" not in res.computed
+    res = doc.extract(["text_box_list"], workers=2)
+    assert res.computed == [] and res.reused == ["text_box_list"]
+    try:
+        doc.extract(["does_not_exist"])
+        assert False, "unknown outputs should raise a KeyError"
+    except KeyError:
+        pass
+
+
+def test_release_intermediate_results():
+    lines = ["some text", "in a few", "lines"]
+    doc = Document(fobj="\n".join(lines))
+    res = doc.extract(["text_box_list"], release=True)
+    assert res.outputs["text_box_list"] == lines
+    assert {"raw_content", "text_box_elements"} <= set(res.released)
+    # released results get recalculated if needed
+    assert doc.x("text_box_elements")["text"].to_list() == lines
+    assert "text_box_elements" in doc.release(keep=["text_box_list"])
+    assert doc.x("text_box_list") == lines
+
+    # names can be given as a generator
+    doc = Document(fobj="\n".join(lines))
+    doc.x_parallel((name for name in ["text_box_elements", "text_box_list"]), workers=2, release=True)
+    assert doc.x_plans["text_box_elements"].cache_key in doc._x_func_cache
+    assert doc.x_plans["raw_content"].cache_key not in doc._x_func_cache
+
+    doc = Document(fobj="\n".join(lines), memory_budget=0)
+    assert doc.x("text_box_list") == lines
+    assert len(doc._x_func_cache) == 1
+
+
+def test_memory_budget_evicts_least_recently_used():
+    from pydoxtools.document_base import Pipeline, result_key
+    from pydoxtools.extract_logic import LambdaExtractor
+
+    extractors = {
+        name: LambdaExtractor(lambda s: np.zeros(len(s), dtype=np.uint8)).pipe(s="_fobj").out(name).cache()
+        for name in ["a", "b", "c"]
+    }
+
+    class Arrays(Pipeline):
+        _extractors = {"*": list(extractors.values())}
+
+    # enough memory for two of the results
+    doc = Arrays("x" * 100_000, memory_budget=250_000)
+    doc.x("a"), doc.x("b"), doc.x("a"), doc.x("c")
+    assert set(doc._x_func_cache) == {result_key(extractors["a"]), result_key(extractors["c"])}
+    assert doc.release(keep=["c"]) == ["a"]
+
+
 def test_url_download():
     doc = Document(
         "https://www.raspberrypi.org/app/uploads/2012/12/quick-start-guide-v1.1.pdf",